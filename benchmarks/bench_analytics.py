@@ -0,0 +1,85 @@
+"""
+bench_analytics.py
+
+Daily summaries for every city at once: per-object Python loops over
+WeatherData lists (the previous approach) versus summarize_frame's single
+vectorized groupby over columnar data.
+
+Run with: python -m benchmarks.bench_analytics [sizes]
+e.g. python -m benchmarks.bench_analytics 10000,1000000,10000000
+
+The per-object path needs a WeatherData instance per row, so it is skipped
+above 1M rows to keep memory bounded.
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+
+from models.weather_data import WeatherData  # noqa: E402
+from utils.weather_analyzer import WeatherAnalyzer, summarize_frame  # noqa: E402
+
+N_CITIES = 100
+CONDITIONS = np.array(["Clear", "Clouds", "Rain", "Haze", "Mist"])
+OBJECT_LIMIT = 1_000_000
+
+
+def make_frame(n: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    cycle = np.arange(n) // N_CITIES
+    return pd.DataFrame({
+        "city": pd.Categorical.from_codes(np.arange(n) % N_CITIES, [f"City{i}" for i in range(N_CITIES)]),
+        "dt": pd.to_datetime(1622505600 + cycle * 300, unit="s"),
+        "main": pd.Categorical(CONDITIONS[rng.integers(0, len(CONDITIONS), n)]),
+        "temp": rng.normal(25, 5, n),
+        "feels_like": rng.normal(26, 5, n),
+    })
+
+
+def per_object_summary(observations):
+    analyzer = WeatherAnalyzer()
+    groups = defaultdict(list)
+    for observation in observations:
+        groups[(observation.city, observation.dt // 86400)].append(observation)
+    result = {}
+    for key, day in groups.items():
+        temps = [o.temp for o in day]
+        result[key] = (
+            analyzer.calculate_average_temp(temps), min(temps), max(temps),
+            analyzer.get_dominant_condition([o.main for o in day]),
+        )
+    return result
+
+
+def main(sizes):
+    print(f"{'rows':>10} {'objects s':>10} {'vectorized s':>13} {'speedup':>8}")
+    for n in sizes:
+        df = make_frame(n)
+        start = time.perf_counter()
+        summarize_frame(df, freq="daily")
+        vectorized = time.perf_counter() - start
+
+        if n <= OBJECT_LIMIT:
+            dts = ((df["dt"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1)).tolist()
+            observations = [
+                WeatherData(city=c, main=m, temp=t, feels_like=f, dt=d)
+                for c, m, t, f, d in zip(df["city"].astype(str), df["main"].astype(str),
+                                         df["temp"].tolist(), df["feels_like"].tolist(), dts)
+            ]
+            start = time.perf_counter()
+            per_object_summary(observations)
+            objects = time.perf_counter() - start
+            print(f"{n:>10} {objects:>10.3f} {vectorized:>13.3f} {objects / vectorized:>7.1f}x")
+        else:
+            print(f"{n:>10} {'skipped':>10} {vectorized:>13.3f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    arg = sys.argv[1] if len(sys.argv) > 1 else "10000,1000000"
+    main([int(size) for size in arg.split(",")])
@@ -0,0 +1,76 @@
+"""
+bench_archive.py
+
+Loads a year of 5-minute history for every city from the database and from
+the Parquet and Arrow archives (memory-mapped, column-pruned, time-filtered),
+for the full range and for one week.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set; requires pyarrow.
+Run with: python -m benchmarks.bench_archive [n_cities] [days]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from sqlalchemy import insert  # noqa: E402
+from data.archive import WeatherArchive  # noqa: E402
+from data.database import Base, engine, load_weather_frame, to_db_datetime, WeatherDataDB  # noqa: E402
+
+END = 1622505600 + 365 * 86400
+STEP = 300
+
+
+def seed(cities, days):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = END - days * 86400
+    for city in cities:
+        rows = [
+            {"city": city, "main": "Clear", "temp": 20 + (i % 288) / 20, "feels_like": 21.0, "humidity": 50.0,
+             "dt": to_db_datetime(start + i * STEP)}
+            for i in range(days * 86400 // STEP)
+        ]
+        with engine.begin() as conn:
+            conn.execute(insert(WeatherDataDB), rows)
+    return start
+
+
+def timed(fn, repeat=3):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t)
+    return best, result
+
+
+def run(n_cities: int, days: int):
+    cities = [f"City{i}" for i in range(n_cities)]
+    start = seed(cities, days)
+    start_dt, end_dt = to_db_datetime(start), to_db_datetime(END)
+    archives = {fmt: WeatherArchive(os.path.join(tempfile.mkdtemp(), fmt), format=fmt) for fmt in ("parquet", "arrow")}
+    for fmt, archive in archives.items():
+        elapsed, rows = timed(lambda: archive.export(start_dt, end_dt), repeat=1)
+        print(f"export {fmt}: {rows} rows in {elapsed:.2f}s")
+
+    week = (end_dt - timedelta(days=7), end_dt)
+    print(f"cities={n_cities} days={days}")
+    for label, (lo, hi) in (("full range", (start_dt, end_dt)), ("last week", week)):
+        db_time, df = timed(lambda: load_weather_frame(None, lo, hi), repeat=1)
+        print(f"  {label}: database       {db_time * 1000:9.1f}ms ({len(df)} rows)")
+        for fmt, archive in archives.items():
+            t, df = timed(lambda: archive.load_frame(None, lo, hi))
+            print(f"  {label}: {fmt:8s} archive {t * 1000:9.1f}ms (x{db_time / t:.0f})")
+            t, df = timed(lambda: archive.load_frame(None, lo, hi, columns=["temp"]))
+            print(f"  {label}: {fmt:8s} temp only {t * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    d = int(sys.argv[2]) if len(sys.argv) > 2 else 365
+    run(n, d)
@@ -0,0 +1,71 @@
+"""
+bench_async_db.py
+
+Concurrent one-day history reads issued from an event loop, three ways:
+blocking sync calls on the loop itself, sync calls pushed to worker threads
+(what a plain `def` FastAPI route does), and the async engine from
+data.async_database. Reports throughput and the event loop's lag (how late
+a 10ms ticker wakes up while the reads run) at several concurrency levels.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set; point it at
+a scratch Postgres database to see the asyncpg pool.
+Run with: python -m benchmarks.bench_async_db [requests]
+"""
+
+import asyncio
+import sys
+import time
+
+from benchmarks.fixtures import END, city_names, percentiles, seed_history
+from data import async_database
+from data.async_database import AsyncDatabase
+from data.database import DATABASE_URL, get_weather_range
+
+CITIES = city_names(10)
+
+
+async def ticker(lags: list, stop: asyncio.Event, interval: float = 0.01):
+    # Records how late each wake-up is; a blocked loop shows up as large lag
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run(mode: str, db: AsyncDatabase, requests: int, concurrency: int):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def read(i: int):
+        city = CITIES[i % len(CITIES)]
+        async with limit:
+            if mode == "sync-on-loop":
+                return get_weather_range(city, END - 86400, END)
+            if mode == "sync-threads":
+                return await asyncio.to_thread(get_weather_range, city, END - 86400, END)
+            async with db.sessionmaker() as session:
+                return await async_database.get_weather_range(session, city, END - 86400, END)
+
+    lags, stop = [], asyncio.Event()
+    tick = asyncio.create_task(ticker(lags, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(read(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await tick
+    assert all(len(rows) == 288 for rows in results)
+    return requests / elapsed, percentiles(lags, (50, 99))
+
+
+async def main(requests: int):
+    print(f"seeded {seed_history(CITIES, days=7)} rows")
+    db = AsyncDatabase(DATABASE_URL, pool_size=10, max_overflow=20)
+    print(f"{'mode':>13} {'concurrency':>11} {'req/s':>8} {'lag p50 ms':>11} {'lag p99 ms':>11}")
+    for concurrency in (1, 8, 32):
+        for mode in ("sync-on-loop", "sync-threads", "async"):
+            rate, lag = await run(mode, db, requests, concurrency)
+            print(f"{mode:>13} {concurrency:>11} {rate:>8.0f} {lag['p50']:>11.1f} {lag['p99']:>11.1f}")
+    await db.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,99 @@
+"""
+bench_batch.py
+
+A dashboard refresh (current weather, today's summary and recent alerts for
+every city) against the app served by uvicorn, two ways: one GET per city and
+endpoint (/current-weather, /daily-summary, /alerts), or one POST per endpoint
+(/batch/current, /batch/summary, /batch/alerts). The first refresh is cold
+(upstream fetches, summaries built from the database); the later ones are
+served from the caches and in-memory aggregates.
+
+Reports refresh wall time and the HTTP and upstream requests each way costs.
+Uses a throwaway SQLite file unless DATABASE_URL is already set.
+Run with: python -m benchmarks.bench_batch [n_cities] [rounds]
+"""
+
+import asyncio
+import statistics
+import sys
+import time
+from typing import Dict, List
+
+from benchmarks import fixtures
+from benchmarks.fixtures import city_names, seed_history
+from config.settings import Settings
+from data import database
+
+
+async def refresh(session, app_url: str, cities: List[str], mode: str, concurrency: int) -> int:
+    # One dashboard refresh; returns the number of HTTP requests it took
+    if mode == "batch":
+        body = {"cities": cities}
+        requests = [session.post(f"{app_url}/batch/{endpoint}", json=body) for endpoint in ("current", "summary", "alerts")]
+    else:
+        requests = [
+            session.get(f"{app_url}/{endpoint}/{city}")
+            for city in cities for endpoint in ("current-weather", "daily-summary", "alerts")
+        ]
+    limit = asyncio.Semaphore(concurrency)
+
+    async def send(request):
+        async with limit:
+            async with request as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"{response.url}: {response.status}")
+
+    await asyncio.gather(*(send(request) for request in requests))
+    return len(requests)
+
+
+async def dashboard(mode: str, n_cities: int, rounds: int, concurrency: int, upstream_latency: float) -> Dict:
+    """
+    Serves a fresh app (cold caches) and times `rounds` dashboard refreshes.
+
+    :return: Cold and warm refresh times in seconds, HTTP requests per refresh
+             and upstream requests in total.
+    """
+    import aiohttp
+
+    from main import create_app
+
+    cities = city_names(n_cities)
+    async with fixtures.fake_upstream(latency=upstream_latency) as (upstream, base_url):
+        settings = Settings(
+            DATABASE_URL=database.DATABASE_URL, CITIES=cities, OPENWEATHERMAP_BASE_URL=base_url,
+            UPSTREAM_RATE_LIMIT=0, POLL_ENABLED=False,
+        )
+        app = create_app(settings)
+        async with fixtures.serve_app(app) as app_url:
+            connector = aiohttp.TCPConnector(limit=concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                times = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    http_requests = await refresh(session, app_url, cities, mode, concurrency)
+                    times.append(time.perf_counter() - start)
+    return {
+        "cold": times[0],
+        "warm": times[1:],
+        "http_requests": http_requests,
+        "upstream_requests": upstream.requests,
+    }
+
+
+async def main(n_cities: int, rounds: int):
+    print(f"seeded {seed_history(city_names(n_cities), days=1)} rows")
+    print(f"{'mode':>9} {'cities':>7} {'requests':>9} {'upstream':>9} {'cold s':>8} {'warm ms':>8}")
+    for mode in ("per-city", "batch"):
+        result = await dashboard(mode, n_cities, rounds, concurrency=20, upstream_latency=0.02)
+        warm = statistics.median(result["warm"]) * 1000
+        print(f"{mode:>9} {n_cities:>7} {result['http_requests']:>9} {result['upstream_requests']:>9} "
+              f"{result['cold']:>8.3f} {warm:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+    ))
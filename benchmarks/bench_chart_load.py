@@ -0,0 +1,63 @@
+"""
+bench_chart_load.py
+
+Load + render latency of a temperature chart versus range length, for raw
+5-minute rows and for get_city_weather_data's downsampled series.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set.
+Run with: python -m benchmarks.bench_chart_load [max_points]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from sqlalchemy import insert  # noqa: E402
+from config.settings import Settings  # noqa: E402
+from data.database import Base, engine, load_weather_frame, to_db_datetime, WeatherDataDB  # noqa: E402
+from services.weather_service import WeatherService  # noqa: E402
+from visualization.renderer import render_png  # noqa: E402
+
+CITY = "Delhi"
+END = 1622505600 + 365 * 86400
+STEP = 300
+
+
+def seed(days: int = 365):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    rows = [
+        {"city": CITY, "main": "Clear", "temp": 20 + (i % 288) / 20, "feels_like": 21.0, "humidity": 50.0,
+         "dt": to_db_datetime(END - days * 86400 + i * STEP)}
+        for i in range(days * 86400 // STEP)
+    ]
+    with engine.begin() as conn:
+        conn.execute(insert(WeatherDataDB), rows)
+    return len(rows)
+
+
+def main(max_points: int):
+    print(f"seeded {seed()} rows of 5-minute history for {CITY}")
+    service = WeatherService(Settings(OPENWEATHERMAP_API_KEY="bench", DATABASE_URL=os.environ["DATABASE_URL"]))
+    print(f"{'days':>5} {'raw rows':>9} {'raw load+render s':>18} {'points':>7} {'downsampled s':>14}")
+    for days in (1, 7, 30, 365):
+        start = END - days * 86400
+
+        t0 = time.perf_counter()
+        raw = load_weather_frame([CITY], start, END).rename(columns={"dt": "timestamp", "temp": "temperature"})
+        render_png("temperature", raw, CITY)
+        raw_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        df = service.get_city_weather_data(CITY, start, END, max_points=max_points)
+        render_png("temperature", df, CITY)
+        downsampled_time = time.perf_counter() - t0
+
+        print(f"{days:>5} {len(raw):>9} {raw_time:>18.3f} {len(df):>7} {downsampled_time:>14.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,73 @@
+"""
+bench_fetch.py
+
+Compares one polling cycle against a local fake upstream:
+sequential requests with a fresh session per city (the previous behaviour)
+versus the concurrent fan-out over a shared, pooled session, and the same
+cycle with every city configured by id so it is fetched in group requests.
+
+Run with: python -m benchmarks.bench_fetch [n_cities] [latency_seconds]
+"""
+
+import asyncio
+import sys
+import time
+
+from config.settings import Settings
+from services.weather_service import WeatherService
+from tests.fake_owm import FakeOpenWeatherMap
+
+
+async def run(n_cities: int, latency: float):
+    city_ids = {1000 + i: f"City{i}" for i in range(n_cities)}
+    upstream = FakeOpenWeatherMap(latency=latency, city_ids=city_ids)
+    base_url = await upstream.start()
+    settings = Settings(
+        OPENWEATHERMAP_API_KEY="bench",
+        OPENWEATHERMAP_BASE_URL=base_url,
+        DATABASE_URL="sqlite://",
+        UPSTREAM_RATE_LIMIT=0,
+        CITIES=list(city_ids.values()),
+    )
+    service = WeatherService(settings)
+    grouped = WeatherService(Settings(
+        OPENWEATHERMAP_API_KEY="bench",
+        OPENWEATHERMAP_BASE_URL=base_url,
+        DATABASE_URL="sqlite://",
+        UPSTREAM_RATE_LIMIT=0,
+        CITIES={city: {"id": city_id} for city_id, city in city_ids.items()},
+    ))
+    try:
+        start = time.perf_counter()
+        for city in settings.get_cities():
+            await service.get_current_weather(city)
+            await service.close()  # new session per city, as before
+        sequential = time.perf_counter() - start
+
+        await service.fetch_weather_data()
+        stats = service.last_cycle
+        latencies = sorted(stats.latencies.values())
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+
+        await grouped.fetch_weather_data()
+        group_stats = grouped.last_cycle
+    finally:
+        await service.close()
+        await grouped.close()
+        await upstream.stop()
+
+    print(f"cities={n_cities} upstream_latency={latency * 1000:.0f}ms "
+          f"concurrency={service.concurrency}")
+    print(f"  sequential, session per city: {sequential:8.3f}s")
+    print(f"  concurrent, pooled session:   {stats.wall_time:8.3f}s "
+          f"(speedup x{sequential / stats.wall_time:.1f})")
+    print(f"  per-city latency p50={p50 * 1000:.1f}ms p99={p99 * 1000:.1f}ms")
+    print(f"  requests: {stats.requests} single vs {group_stats.requests} grouped "
+          f"({group_stats.wall_time:.3f}s, x{stats.requests / group_stats.requests:.0f} fewer calls)")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    lat = float(sys.argv[2]) if len(sys.argv) > 2 else 0.02
+    asyncio.run(run(n, lat))
@@ -0,0 +1,50 @@
+"""
+bench_ingest.py
+
+Compares writing one polling cycle row-by-row with insert_weather_data
+(one transaction plus a refresh SELECT per row) against a single
+insert_weather_data_bulk call.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set.
+Run with: python -m benchmarks.bench_ingest [n_rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from data.database import Base, engine, insert_weather_data, insert_weather_data_bulk  # noqa: E402
+from models.weather_data import WeatherData  # noqa: E402
+
+
+def make_cycle(n: int):
+    return [
+        WeatherData(city=f"City{i}", main="Clear", temp=20.0, feels_like=21.0, dt=1622555555)
+        for i in range(n)
+    ]
+
+
+def main(n: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    cycle = make_cycle(n)
+
+    start = time.perf_counter()
+    for weather_data in cycle:
+        insert_weather_data(weather_data)
+    per_row = time.perf_counter() - start
+
+    start = time.perf_counter()
+    insert_weather_data_bulk(cycle)
+    bulk = time.perf_counter() - start
+
+    print(f"rows={n} backend={engine.url.get_backend_name()}")
+    print(f"  per-row insert + refresh: {per_row:8.3f}s ({per_row / n * 1e6:8.1f}us/row)")
+    print(f"  bulk executemany:         {bulk:8.3f}s ({bulk / n * 1e6:8.1f}us/row, x{per_row / bulk:.0f})")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,61 @@
+"""
+bench_memory.py
+
+Bytes per retained observation: a list of pydantic WeatherData objects per
+city (the previous in-memory representation) versus ObservationStore's
+columnar ring buffers. Measured with tracemalloc.
+
+Run with: python -m benchmarks.bench_memory [n_cities] [per_city]
+"""
+
+import sys
+import tracemalloc
+
+from models.weather_data import WeatherData
+from utils.timeseries import ObservationStore
+
+CONDITIONS = ["Clear", "Clouds", "Rain", "Haze", "Mist"]
+
+
+def observations(n_cities: int, per_city: int):
+    for i in range(per_city):
+        for c in range(n_cities):
+            yield WeatherData(
+                city=f"City{c}", main=CONDITIONS[(i + c) % len(CONDITIONS)], temp=20 + (i % 300) / 10,
+                feels_like=21 + (i % 300) / 10, humidity=float(i % 100), dt=1622505600 + i * 300,
+            )
+
+
+def measure(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, used
+
+
+def main(n_cities: int, per_city: int):
+    total = n_cities * per_city
+
+    def as_lists():
+        history = {}
+        for weather_data in observations(n_cities, per_city):
+            history.setdefault(weather_data.city, []).append(weather_data)
+        return history
+
+    def as_store():
+        store = ObservationStore(capacity=per_city)
+        store.extend(observations(n_cities, per_city))
+        return store
+
+    _, list_bytes = measure(as_lists)
+    store, store_bytes = measure(as_store)
+    print(f"observations={total} ({n_cities} cities x {per_city})")
+    print(f"  pydantic lists:    {list_bytes / total:8.1f} bytes/observation")
+    print(f"  ObservationStore:  {store_bytes / total:8.1f} bytes/observation "
+          f"(arrays alone {store.nbytes / total:.1f}, x{list_bytes / store_bytes:.1f} smaller)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50, int(sys.argv[2]) if len(sys.argv) > 2 else 2016)
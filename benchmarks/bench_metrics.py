@@ -0,0 +1,61 @@
+"""
+bench_metrics.py
+
+Cost of the instrumentation: per-call overhead of counter and histogram
+updates, /metrics render time as the number of series grows, and the slowdown
+of a CPU-bound loop while the sampling profiler is running.
+
+Run with: python -m benchmarks.bench_metrics [n_series]
+"""
+
+import sys
+import time
+
+from utils.metrics import Registry
+from utils.profiler import SamplingProfiler
+
+
+def per_call(fn, n=200000) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n
+
+
+def cpu_work(n=2000000) -> float:
+    start = time.perf_counter()
+    total = 0
+    for i in range(n):
+        total += i * i
+    return time.perf_counter() - start
+
+
+def main(n_series: int):
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route", "status"])
+    latency = registry.histogram("latency_seconds", "Latency", ["route"])
+    print(f"counter.inc:       {per_call(lambda: requests.inc(route='/history/{city}', status='200')) * 1e9:7.0f}ns")
+    print(f"histogram.observe: {per_call(lambda: latency.observe(0.003, route='/history/{city}')) * 1e9:7.0f}ns")
+
+    def timed():
+        with latency.time(route="/history/{city}"):
+            pass
+    print(f"histogram.time:    {per_call(timed) * 1e9:7.0f}ns")
+
+    for i in range(n_series):
+        latency.observe(0.01, route=f"/route{i}")
+    start = time.perf_counter()
+    body = registry.render()
+    print(f"render {n_series} histogram series: {(time.perf_counter() - start) * 1000:.1f}ms ({len(body) // 1024} KiB)")
+
+    baseline = min(cpu_work() for _ in range(3))
+    for interval in (0.01, 0.005, 0.001):
+        profiler = SamplingProfiler(interval=interval)
+        profiler.start()
+        profiled = min(cpu_work() for _ in range(3))
+        profiler.stop()
+        print(f"profiler every {interval * 1000:g}ms: CPU loop x{profiled / baseline:.3f} ({profiler.samples} samples)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,79 @@
+"""
+bench_range_query.py
+
+Shows that a one-day get_weather_range / get_latest lookup stays flat as the
+weather_data table grows, because both seek on the (city, dt) index, while
+the old "every row for the city" query grows linearly with history.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set.
+Run with: python -m benchmarks.bench_range_query [max_rows]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from sqlalchemy import insert  # noqa: E402
+from data.database import (  # noqa: E402
+    Base, engine, SessionLocal, WeatherDataDB, get_latest, get_weather_range, to_db_datetime,
+)
+
+CITIES = [f"City{i}" for i in range(50)]
+START = 1622505600
+STEP = 300  # 5-minute polling interval
+
+
+def seed(from_row: int, to_row: int):
+    # Rows are laid out cycle by cycle: every city gets one observation per step.
+    batch = []
+    with engine.begin() as conn:
+        for n in range(from_row, to_row):
+            cycle, city = divmod(n, len(CITIES))
+            batch.append({
+                "city": CITIES[city], "main": "Clear", "temp": 20.0, "feels_like": 21.0,
+                "dt": to_db_datetime(START + cycle * STEP),
+            })
+            if len(batch) == 50_000:
+                conn.execute(insert(WeatherDataDB), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(WeatherDataDB), batch)
+
+
+def timed(fn, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(max_rows: int):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    sizes = [size for size in (10_000, 100_000, 1_000_000, 5_000_000) if size <= max_rows]
+    seeded = 0
+    print(f"{'rows':>10} {'range(1 day) ms':>16} {'latest ms':>10} {'full city scan ms':>18}")
+    for size in sizes:
+        seed(seeded, size)
+        seeded = size
+        last_cycle = size // len(CITIES) - 1
+        end = START + last_cycle * STEP
+        day_range = timed(lambda: get_weather_range("City7", end - 86400, end))
+        latest = timed(lambda: get_latest("City7"))
+
+        def full_scan():
+            db = SessionLocal()
+            try:
+                db.query(WeatherDataDB).filter(WeatherDataDB.city == "City7").all()
+            finally:
+                db.close()
+
+        scan = timed(full_scan, repeat=3)
+        print(f"{size:>10} {day_range:>16.2f} {latest:>10.2f} {scan:>18.2f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,55 @@
+"""
+bench_serialization.py
+
+Cost of serialising a bulk response of WeatherData observations: FastAPI's
+default path (jsonable_encoder + stdlib json), the orjson path used by bulk
+endpoints, and a pre-encoded cache hit; plus gzip/brotli size and time.
+
+Run with: python -m benchmarks.bench_serialization [n_observations]
+"""
+
+import json
+import sys
+import time
+
+from fastapi.encoders import jsonable_encoder
+
+from models.weather_data import WeatherData
+from utils import responses
+from utils.responses import EncodedJSON, compress, dumps
+
+
+def timed(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(n: int):
+    observations = [
+        WeatherData(city=f"City{i % 50}", main="Clear", temp=20 + (i % 100) / 10,
+                    feels_like=21.5, humidity=50.0, dt=1622505600 + i * 300)
+        for i in range(n)
+    ]
+    default = timed(lambda: json.dumps(jsonable_encoder(observations)).encode())
+    fast = timed(lambda: dumps(observations))
+    cached = EncodedJSON(observations)
+    hit = timed(lambda: cached.encoded(None))
+    body = cached.body
+
+    print(f"observations={n} body={len(body) / 1024:.0f}KB")
+    print(f"  jsonable_encoder + json: {default * 1000:8.2f}ms")
+    print(f"  orjson:                  {fast * 1000:8.2f}ms (x{default / fast:.0f})")
+    print(f"  pre-encoded cache hit:   {hit * 1e6:8.2f}us")
+    for encoding in ("gzip", "br") if responses.brotli is not None else ("gzip",):
+        elapsed = timed(lambda: compress(body, encoding))
+        size = len(compress(body, encoding))
+        print(f"  {encoding:4s}: {elapsed * 1000:6.2f}ms -> {size / 1024:.0f}KB "
+              f"({len(body) / size:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,118 @@
+"""
+bench_startup.py
+
+Cold-start cost of the API, each sample in a fresh interpreter: the time to
+`import main` (and which heavy libraries that pulls in), and the time from
+launching `uvicorn main:app` to its first 200 response, then to its first
+chart (the first request that needs pandas and matplotlib).
+
+Polling is disabled in the served app, so no upstream calls are made; the
+database is seeded with a day of history for the chart.
+--max-import / --max-first-response turn it into a regression guard: the
+exit status is 1 when a median exceeds its limit.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set.
+Run with: python -m benchmarks.bench_startup [--runs N] [--max-import S] [--max-first-response S]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.fixtures import free_port, seed_history
+
+HEAVY_MODULES = ["pandas", "matplotlib", "pyarrow"]
+IMPORT_SCRIPT = (
+    "import json, sys, time\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "print(json.dumps({'seconds': time.perf_counter() - start,\n"
+    "                  'loaded': [m for m in %r if m in sys.modules]}))\n" % HEAVY_MODULES
+)
+
+
+def app_env() -> dict:
+    return {**os.environ, "POLL_ENABLED": "false", "CHART_RENDER_WORKERS": "0"}
+
+
+def measure_import() -> dict:
+    # {"seconds": import time, "loaded": heavy modules imported as a side effect}
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], env=app_env(), capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def wait_for(url: str, start: float, timeout: float) -> float:
+    # Seconds from start until url answers 200
+    while time.perf_counter() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                if response.status == 200:
+                    response.read()
+                    return time.perf_counter() - start
+        except urllib.error.HTTPError:
+            raise
+        except OSError:
+            # Not listening yet
+            time.sleep(0.005)
+    raise TimeoutError(f"{url} did not answer within {timeout}s")
+
+
+def measure_first_response(city: str = "Delhi", timeout: float = 60.0) -> dict:
+    """
+    Starts `uvicorn main:app` and returns the seconds until the first 200 from
+    `/` and from the first chart request.
+    """
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=app_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        first_response = wait_for(f"http://127.0.0.1:{port}/", start, timeout)
+        first_chart = wait_for(f"http://127.0.0.1:{port}/chart/temperature/{city}", start, timeout)
+    finally:
+        server.terminate()
+        server.wait()
+    return {"first_response": first_response, "first_chart": first_chart}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_startup")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import", type=float, help="fail if the median import time exceeds this (seconds)")
+    parser.add_argument("--max-first-response", type=float,
+                        help="fail if the median time to the first response exceeds this (seconds)")
+    args = parser.parse_args(argv)
+
+    # A day of history, so the first chart has something to plot
+    seed_history(["Delhi"], days=1)
+    imports = [measure_import() for _ in range(args.runs)]
+    starts = [measure_first_response() for _ in range(args.runs)]
+    import_time = statistics.median(run["seconds"] for run in imports)
+    first_response = statistics.median(run["first_response"] for run in starts)
+    first_chart = statistics.median(run["first_chart"] for run in starts)
+    print(f"import main:           {import_time * 1000:8.0f}ms  (heavy modules loaded: {imports[0]['loaded'] or 'none'})")
+    print(f"launch -> first 200:   {first_response * 1000:8.0f}ms")
+    print(f"launch -> first chart: {first_chart * 1000:8.0f}ms")
+
+    failed = False
+    if args.max_import is not None and import_time > args.max_import:
+        print(f"REGRESSION: import took {import_time:.3f}s > {args.max_import}s")
+        failed = True
+    if args.max_first_response is not None and first_response > args.max_first_response:
+        print(f"REGRESSION: first response took {first_response:.3f}s > {args.max_first_response}s")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,113 @@
+"""
+bench_stream.py
+
+Load test for the /stream Server-Sent Events endpoint: opens thousands of idle
+subscriber connections against the real app (uvicorn, polling disabled so no
+upstream calls), then publishes polling cycles through the app's
+PubSub and measures connection memory and publish-to-delivery latency.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set.
+Run with: python -m benchmarks.bench_stream [n_clients] [n_cities]
+"""
+
+import asyncio
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("OPENWEATHERMAP_API_KEY", "bench")
+
+import aiohttp  # noqa: E402
+import uvicorn  # noqa: E402
+
+from config.settings import Settings  # noqa: E402
+from main import create_app  # noqa: E402
+from models.weather_data import WeatherData  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def client(session, url: str, connected: asyncio.Event, received: list, expected: int, done: asyncio.Event):
+    async with session.get(url) as response:
+        await response.content.readline()  # ": connected"
+        await response.content.readline()
+        connected.set()
+        while len(received) < expected:
+            line = await response.content.readline()
+            if line.startswith(b"data:"):
+                received.append(time.perf_counter())
+        done.set()
+
+
+async def run(n_clients: int, n_cities: int, cycles: int = 5):
+    port = free_port()
+    app = create_app(Settings(POLL_ENABLED=False))
+    server = uvicorn.Server(uvicorn.Config(app, port=port, lifespan="on", log_level="warning"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    pubsub = app.state.services.pubsub
+
+    cities = [f"City{i}" for i in range(n_cities)]
+    rss_before = rss_mb()
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0), timeout=aiohttp.ClientTimeout(total=None))
+    received = [[] for _ in range(n_clients)]
+    connected = [asyncio.Event() for _ in range(n_clients)]
+    done = [asyncio.Event() for _ in range(n_clients)]
+    start = time.perf_counter()
+    tasks = [
+        asyncio.create_task(client(
+            session, f"http://127.0.0.1:{port}/stream?cities={cities[i % n_cities]}",
+            connected[i], received[i], cycles, done[i],
+        ))
+        for i in range(n_clients)
+    ]
+    await asyncio.gather(*(event.wait() for event in connected))
+    connect_time = time.perf_counter() - start
+    rss_idle = rss_mb()
+
+    latencies = []
+    for cycle in range(cycles):
+        published = time.perf_counter()
+        for city in cities:
+            pubsub.publish(city, "observation", WeatherData(
+                city=city, main="Clear", temp=25.0, feels_like=26.0, humidity=50, dt=cycle,
+            ))
+        while min(len(r) for r in received) <= cycle:
+            await asyncio.sleep(0.001)
+        latencies.append(max(r[cycle] for r in received) - published)
+    await asyncio.gather(*(event.wait() for event in done))
+
+    stats = pubsub.stats()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await session.close()
+    server.should_exit = True
+    await server_task
+
+    print(f"clients={n_clients} cities={n_cities} cycles={cycles}")
+    print(f"  connect all:          {connect_time:8.3f}s")
+    print(f"  peak RSS (client+server): {rss_before:.0f}MB -> {rss_idle:.0f}MB idle "
+          f"(~{(rss_idle - rss_before) * 1024 / n_clients:.1f}KB per connection pair)")
+    print(f"  cycle fan-out to all: p50={sorted(latencies)[len(latencies) // 2] * 1000:.1f}ms "
+          f"max={max(latencies) * 1000:.1f}ms")
+    print(f"  delivered={stats['delivered']} dropped={stats['dropped']}")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    c = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    asyncio.run(run(n, c))
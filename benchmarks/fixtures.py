@@ -0,0 +1,148 @@
+"""
+fixtures.py
+
+Shared setup for the benchmark suite: a database seeded with synthetic
+history, synthetic observation and chart data, and in-process servers (the
+fake OpenWeatherMap upstream and the API under uvicorn).
+
+Importing this module points the data layer at a throwaway SQLite file unless
+DATABASE_URL is already set, so it must be imported before data.database.
+Any SQLAlchemy URL works (e.g. a scratch Postgres database), but seeding
+drops and recreates the application tables in it.
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("OPENWEATHERMAP_API_KEY", "bench")
+
+import numpy as np  # noqa: E402
+import pandas as pd  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+from data.database import Base, WeatherDataDB, engine, to_db_datetime  # noqa: E402
+from models.weather_data import WeatherData  # noqa: E402
+from tests.fake_owm import FakeOpenWeatherMap  # noqa: E402
+
+# The synthetic history ends at the next UTC midnight, so "last N days" queries and
+# summaries see it; its values depend only on the offset from that day boundary.
+END = int((datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+           + timedelta(days=1)).timestamp())
+STEP = 300
+CONDITIONS = ["Clear", "Clouds", "Rain", "Haze", "Mist"]
+
+
+def city_names(n_cities: int) -> List[str]:
+    return [f"City{i}" for i in range(n_cities)]
+
+
+def reset_database():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def history_rows(city: str, start: int, count: int, seed: int = 0) -> List[dict]:
+    # Daily temperature cycle plus noise, every STEP seconds from start
+    rng = np.random.default_rng(seed)
+    t = np.arange(count)
+    temps = 20 + 8 * np.sin(2 * np.pi * (t * STEP % 86400) / 86400) + rng.normal(0, 1, count)
+    conditions = rng.integers(0, len(CONDITIONS), count)
+    return [
+        {
+            "city": city, "main": CONDITIONS[conditions[i]], "temp": float(temps[i]),
+            "feels_like": float(temps[i] + 1), "humidity": float(40 + i % 40), "dt": to_db_datetime(start + i * STEP),
+        }
+        for i in range(count)
+    ]
+
+
+def seed_history(cities: List[str], days: int, end: int = END) -> int:
+    """
+    Recreates the tables and fills weather_data with `days` days of 5-minute
+    observations per city, ending at `end`. Returns the number of rows.
+    """
+    reset_database()
+    count = days * 86400 // STEP
+    for seed, city in enumerate(cities):
+        rows = history_rows(city, end - days * 86400, count, seed)
+        with engine.begin() as conn:
+            conn.execute(insert(WeatherDataDB), rows)
+    return count * len(cities)
+
+
+def observations(cities: List[str], cycles: int = 1, start: int = END) -> List[WeatherData]:
+    # Polling cycles as WeatherService returns them, one observation per city per cycle
+    return [
+        WeatherData(
+            city=city, main=CONDITIONS[(i + c) % len(CONDITIONS)], temp=20 + (i * 7 + c) % 20,
+            feels_like=21 + (i * 7 + c) % 20, humidity=float(50 + c % 30), dt=start + i * STEP,
+        )
+        for i in range(cycles)
+        for c, city in enumerate(cities)
+    ]
+
+
+def chart_frame(cities: List[str], points: int) -> pd.DataFrame:
+    # The frame layout the visualization.charts functions expect
+    rng = np.random.default_rng(0)
+    n = points * len(cities)
+    return pd.DataFrame({
+        "timestamp": pd.to_datetime(np.tile(END - points * STEP + np.arange(points) * STEP, len(cities)), unit="s"),
+        "city": np.repeat(cities, points),
+        "temperature": rng.normal(25, 5, n),
+        "humidity": rng.uniform(20, 90, n),
+    })
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@asynccontextmanager
+async def fake_upstream(latency: float = 0.0, **kwargs):
+    """
+    Runs the fake OpenWeatherMap server; yields (server, base_url).
+    """
+    upstream = FakeOpenWeatherMap(latency=latency, **kwargs)
+    base_url = await upstream.start()
+    try:
+        yield upstream, base_url
+    finally:
+        await upstream.stop()
+
+
+@asynccontextmanager
+async def serve_app(app, lifespan: str = "on"):
+    """
+    Serves an ASGI app with uvicorn on a free local port; yields its base URL.
+    The lifespan builds the app's services; create the app with
+    POLL_ENABLED=False so no polling or upstream calls start.
+    """
+    import uvicorn
+
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, port=port, lifespan=lifespan, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        if task.done():
+            task.result()
+        await asyncio.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
+
+
+def percentiles(values: List[float], points=(50, 95, 99)) -> Dict[str, float]:
+    if not values:
+        return {f"p{p}": None for p in points}
+    return {f"p{p}": float(np.percentile(values, p)) for p in points}
@@ -0,0 +1,562 @@
+"""
+suite.py
+
+Reproducible benchmark suite: micro-benchmarks of the data paths (database
+inserts and queries, alert evaluation, analyzers, unit conversions, every chart function) and
+an end-to-end HTTP load scenario against the real FastAPI app served by
+uvicorn with the fake OpenWeatherMap upstream behind it.
+
+All input data is synthetic and seeded (the history ends at the next UTC
+midnight), so two runs differ only by the code (and machine) under test.
+Results are written as JSON together with the git commit they were measured
+on; pass a previous file as --baseline to flag regressions.
+
+Uses a throwaway SQLite file unless DATABASE_URL is already set (see
+benchmarks/fixtures.py).
+
+Run with:
+    python -m benchmarks.suite [--quick] [--filter db.] [--output results.json] [--baseline old.json]
+    python -m benchmarks.suite compare old.json new.json
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import delete
+
+# fixtures sets DATABASE_URL, so it must come before anything that imports data.database
+from benchmarks import fixtures
+from benchmarks.fixtures import END, STEP, city_names
+from data import database
+from models.alert import AlertRule
+
+BENCHMARKS = []
+
+
+def benchmark(name: str):
+    """
+    Registers fn(config) -> result dict under `name`; the group is the part before the first dot.
+    """
+    def register(fn):
+        BENCHMARKS.append((name, fn))
+        return fn
+    return register
+
+
+class Config:
+    def __init__(self, quick: bool = False):
+        self.quick = quick
+
+    def scale(self, full, quick):
+        return quick if self.quick else full
+
+
+def measure(fn: Callable[[], object], repeat: int = 5, number: int = 1, setup: Optional[Callable[[], None]] = None,
+            **params) -> dict:
+    """
+    Times `number` calls of fn, `repeat` times (setup runs untimed before each
+    repeat) and summarises the seconds per call.
+    """
+    times = []
+    fn()  # warm-up: imports, caches, query plans
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) / number)
+    return summarise(times, number=number, **params)
+
+
+def summarise(times: List[float], number: int = 1, **params) -> dict:
+    # Seconds per call over the repeats
+    times = sorted(times)
+    return {
+        "unit": "seconds",
+        "repeat": len(times),
+        "number": number,
+        "min": times[0],
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "p95": times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))],
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "params": params,
+    }
+
+
+# --- database ---------------------------------------------------------------
+
+@benchmark("db.insert_weather_data")
+def bench_insert_single(config):
+    fixtures.reset_database()
+    rows = iter(fixtures.observations(city_names(10), cycles=10000))
+    return measure(lambda: database.insert_weather_data(next(rows)), repeat=config.scale(10, 3), number=20)
+
+
+@benchmark("db.insert_weather_data_bulk")
+def bench_insert_bulk(config):
+    fixtures.reset_database()
+    size = config.scale(1000, 200)
+    batch = fixtures.observations(city_names(100), cycles=size // 100)
+    return measure(lambda: database.insert_weather_data_bulk(batch), repeat=config.scale(10, 3), rows=size)
+
+
+def seeded(config) -> List[str]:
+    # Seeds the history once per run; later benchmarks share it
+    cities = city_names(6)
+    days = config.scale(30, 7)
+    if getattr(config, "seeded", None) != days:
+        fixtures.seed_history(cities, days)
+        config.seeded = days
+    return cities
+
+
+@benchmark("db.get_daily_weather_data")
+def bench_daily(config):
+    seeded(config)
+    day = database.to_db_datetime(END - 86400).date()
+    return measure(lambda: database.get_daily_weather_data("City0", day), repeat=config.scale(20, 5),
+                   rows_per_day=86400 // STEP)
+
+
+@benchmark("db.get_weather_range")
+def bench_range(config):
+    seeded(config)
+    return measure(lambda: database.get_weather_range("City0", END - 7 * 86400, END), repeat=config.scale(20, 5),
+                   days=7)
+
+
+@benchmark("db.load_weather_frame")
+def bench_frame(config):
+    cities = seeded(config)
+    return measure(lambda: database.load_weather_frame(cities, END - 7 * 86400, END), repeat=config.scale(10, 3),
+                   cities=len(cities), days=7)
+
+
+# --- rollups ----------------------------------------------------------------
+
+def reset_rollups():
+    # Back to raw rows only, as before the first compaction
+    with database.get_engine().begin() as conn:
+        conn.execute(delete(database.HourlyRollupDB))
+        conn.execute(delete(database.DailyRollupDB))
+    for key in database.get_rollup_coverage():
+        database.state_delete(database.ROLLUP_STATE, key)
+
+
+def compact():
+    # Rolls the whole seeded history up; raw rows are kept
+    from data.rollup import Compactor
+
+    return Compactor(raw_retention_days=0, hourly_retention_days=0, settle=0).run(now=END)
+
+
+@benchmark("rollup.compact")
+def bench_compact(config):
+    cities = seeded(config)
+    days = config.seeded
+    result = measure(compact, repeat=config.scale(5, 2), setup=reset_rollups,
+                     cities=len(cities), days=days)
+    reset_rollups()
+    return result
+
+
+@benchmark("rollup.downsampled_series")
+def bench_rollup_series(config):
+    # A month at daily resolution (what a 30-day chart asks for), from raw rows and from the rollups
+    seeded(config)
+    days = config.seeded
+
+    def load():
+        return database.load_downsampled_series("City0", END - days * 86400, END, max_points=days)
+
+    reset_rollups()
+    raw = measure(load, repeat=config.scale(20, 5))
+    compact()
+    rollups = measure(load, repeat=config.scale(20, 5), days=days, raw_median=raw["median"])
+    reset_rollups()
+    return rollups
+
+
+# --- alerts -----------------------------------------------------------------
+
+def alert_service(cities: List[str]):
+    from config.settings import Settings
+    from services.alert_service import AlertService
+
+    service = AlertService(Settings(CITIES=cities))
+    for i, city in enumerate(cities):
+        service.set_threshold(30 + i % 5, city)
+        service.add_rule(AlertRule(id=f"cold:{city}", city=city, metric="feels_like", operator="<", threshold=5))
+    service.add_rule(AlertRule(id="heat", city="*", metric="temp", operator=">", threshold=35, consecutive=2))
+    return service
+
+
+@benchmark("alerts.check_alert")
+def bench_check_alert(config):
+    cities = city_names(100)
+    service = alert_service(cities)
+    observation = fixtures.observations(cities)[7]
+    return measure(lambda: service.check_alert(observation), repeat=config.scale(10, 3), number=500,
+                   rules=len(service.get_rules()))
+
+
+@benchmark("alerts.check_alerts_cycle")
+def bench_check_cycle(config):
+    cities = city_names(100)
+    service = alert_service(cities)
+    cycle = fixtures.observations(cities)
+    return measure(lambda: service.check_alerts(cycle), repeat=config.scale(10, 3), number=10, cities=len(cities))
+
+
+# --- analyzers --------------------------------------------------------------
+
+@benchmark("analyzer.aggregator_update_many")
+def bench_aggregator(config):
+    from utils.weather_analyzer import DailyAggregator
+
+    batch = fixtures.observations(city_names(100), cycles=config.scale(100, 20))
+    return measure(lambda: DailyAggregator().update_many(batch), repeat=config.scale(10, 3), observations=len(batch))
+
+
+@benchmark("analyzer.get_daily_summary")
+def bench_daily_summary(config):
+    from utils.weather_analyzer import WeatherAnalyzer
+
+    analyzer = WeatherAnalyzer()
+    analyzer.aggregator.update_many(fixtures.observations(city_names(10), cycles=288))
+    day = database.to_db_datetime(END).date()
+    return measure(lambda: analyzer.get_daily_summary("City3", day), repeat=config.scale(10, 3), number=1000)
+
+
+@benchmark("analyzer.summarize_frame")
+def bench_summarize(config):
+    from utils.weather_analyzer import summarize_frame
+
+    cities = seeded(config)
+    df = database.load_weather_frame(cities, END - 7 * 86400, END)
+    return measure(lambda: summarize_frame(df, freq="hourly"), repeat=config.scale(10, 3), rows=len(df))
+
+
+@benchmark("analyzer.get_summary")
+def bench_summary(config, days: int = 7):
+    from utils.weather_analyzer import WeatherAnalyzer
+
+    cities = seeded(config)
+    analyzer = WeatherAnalyzer()
+    return measure(lambda: analyzer.get_summary(cities, days=days), repeat=config.scale(10, 3),
+                   cities=len(cities), days=days)
+
+
+# --- units ------------------------------------------------------------------
+
+def readings(config):
+    # 1M synthetic temperatures (°C) and humidities (%), seeded
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    n = config.scale(1_000_000, 100_000)
+    return rng.normal(25, 8, n), rng.uniform(10, 100, n)
+
+
+@benchmark("units.convert_temperature")
+def bench_convert(config):
+    from utils.temperature_converter import convert_temperature
+
+    temps, _ = readings(config)
+    return measure(lambda: convert_temperature(temps, "imperial"), repeat=config.scale(20, 5), readings=len(temps))
+
+
+@benchmark("units.convert_per_record")
+def bench_convert_per_record(config):
+    # Baseline: what clients did before, one Python conversion per reading
+    temps, _ = readings(config)
+    values = temps.tolist()
+    return measure(lambda: [t * 1.8 + 32 for t in values], repeat=config.scale(5, 3), readings=len(values))
+
+
+@benchmark("units.heat_index")
+def bench_heat_index(config):
+    from utils.temperature_converter import heat_index
+
+    temps, humidity = readings(config)
+    return measure(lambda: heat_index(temps, humidity), repeat=config.scale(10, 3), readings=len(temps))
+
+
+# --- charts -----------------------------------------------------------------
+
+def render(fig) -> bytes:
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png", bbox_inches="tight")
+    return buf.getvalue()
+
+
+def chart_benchmark(name: str, plot, multi_city: bool = False):
+    @benchmark(f"charts.{name}")
+    def run(config):
+        cities = city_names(3)
+        points = config.scale(2000, 500)
+        df = fixtures.chart_frame(cities, points)
+
+        def draw():
+            if multi_city:
+                return render(plot(df, cities, return_fig=True))
+            return render(plot(df, city="City0", return_fig=True))
+        return measure(draw, repeat=config.scale(5, 2), points=points, cities=len(cities) if multi_city else 1)
+    return run
+
+
+def _register_charts():
+    from visualization import charts
+
+    chart_benchmark("plot_temperature_over_time", charts.plot_temperature_over_time)
+    chart_benchmark("plot_humidity_over_time", charts.plot_humidity_over_time)
+    chart_benchmark("plot_temperature_comparison", charts.plot_temperature_comparison, multi_city=True)
+
+
+@benchmark("charts.plot_comparison_50_cities")
+def bench_comparison_chart(config):
+    from visualization import charts
+
+    cities = city_names(50)
+    points = config.scale(500, 200)
+    df = fixtures.chart_frame(cities, points)
+    return measure(
+        lambda: render(charts.plot_comparison(df, "temperature", cities, return_fig=True)),
+        repeat=config.scale(5, 2), points=points, cities=len(cities),
+    )
+
+
+@benchmark("charts.comparison_json_50_cities")
+def bench_comparison_json(config):
+    import orjson
+
+    from visualization.series import comparison_series, series_payload
+
+    cities = city_names(50)
+    points = config.scale(500, 200)
+    df = fixtures.chart_frame(cities, points)
+    return measure(
+        lambda: orjson.dumps(series_payload(comparison_series(df, "temperature", cities))),
+        repeat=config.scale(10, 3), points=points, cities=len(cities),
+    )
+
+
+_register_charts()
+
+
+# --- end to end -------------------------------------------------------------
+
+async def load_scenario(requests: int, concurrency: int, n_cities: int, upstream_latency: float) -> dict:
+    """
+    Serves the real app and sends `requests` GETs over `concurrency`
+    connections, cycling through the read endpoints. Current weather comes
+    from the fake upstream (through the app's cache); history and summaries
+    from the seeded database and in-memory stores.
+    """
+    import aiohttp
+
+    from config.settings import Settings
+    from data import database
+    from main import create_app
+
+    cities = city_names(n_cities)
+    paths = []
+    for i in range(requests):
+        city = cities[(i // 6) % n_cities]
+        paths.append([
+            f"/current-weather/{city}", f"/history/{city}", f"/daily-summary/{city}", f"/alerts/{city}",
+            f"/summary?cities={city}&days=1", "/metrics",
+        ][i % 6])
+
+    async with fixtures.fake_upstream(latency=upstream_latency) as (upstream, base_url):
+        settings = Settings(
+            DATABASE_URL=database.DATABASE_URL, CITIES=cities, OPENWEATHERMAP_BASE_URL=base_url,
+            UPSTREAM_RATE_LIMIT=0, POLL_ENABLED=False,
+        )
+        app = create_app(settings)
+        async with fixtures.serve_app(app) as app_url:
+            app.state.services.observation_store.extend(fixtures.observations(cities, cycles=288))
+            latencies: Dict[str, List[float]] = {}
+            errors = 0
+            queue = iter(paths)
+
+            async def worker(session):
+                nonlocal errors
+                for path in queue:
+                    start = time.perf_counter()
+                    async with session.get(app_url + path) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                    latencies.setdefault(path.split("/")[1].split("?")[0], []).append(time.perf_counter() - start)
+
+            connector = aiohttp.TCPConnector(limit=concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                start = time.perf_counter()
+                await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+                wall = time.perf_counter() - start
+
+    every = sorted(value for values in latencies.values() for value in values)
+    return {
+        "unit": "seconds",
+        "min": every[0],
+        "median": statistics.median(every),
+        "mean": statistics.fmean(every),
+        **fixtures.percentiles(every, (95, 99)),
+        "throughput_rps": requests / wall,
+        "errors": errors,
+        "upstream_requests": upstream.requests,
+        "endpoints": {name: fixtures.percentiles(values) for name, values in sorted(latencies.items())},
+        "params": {"requests": requests, "concurrency": concurrency, "cities": n_cities,
+                   "upstream_latency": upstream_latency},
+    }
+
+
+@benchmark("http.load_mixed_reads")
+def bench_http(config):
+    seeded(config)
+    return asyncio.run(load_scenario(
+        requests=config.scale(3000, 300), concurrency=config.scale(50, 10), n_cities=6, upstream_latency=0.02,
+    ))
+
+
+@benchmark("http.batch_dashboard")
+def bench_batch(config):
+    # Warm dashboard refreshes of every city: three /batch/* POSTs, compared with one GET per city and endpoint
+    from benchmarks import bench_batch
+
+    fixtures.seed_history(city_names(config.scale(100, 20)), days=1)
+    config.seeded = None
+    params = {"n_cities": config.scale(100, 20), "rounds": config.scale(20, 5), "concurrency": 20,
+              "upstream_latency": 0.02}
+    batch = asyncio.run(bench_batch.dashboard("batch", **params))
+    per_city = asyncio.run(bench_batch.dashboard("per-city", **params))
+    return {
+        **summarise(batch["warm"], **params),
+        "cold": batch["cold"],
+        "http_requests": batch["http_requests"],
+        "per_city": {"median": statistics.median(per_city["warm"]), "cold": per_city["cold"],
+                     "http_requests": per_city["http_requests"]},
+    }
+
+
+# --- startup ----------------------------------------------------------------
+
+@benchmark("startup.import_main")
+def bench_import_main(config):
+    from benchmarks import bench_startup
+
+    runs = [bench_startup.measure_import() for _ in range(config.scale(10, 3))]
+    return {**summarise([run["seconds"] for run in runs]), "heavy_modules_loaded": runs[0]["loaded"]}
+
+
+@benchmark("startup.first_response")
+def bench_first_response(config):
+    from benchmarks import bench_startup
+
+    fixtures.seed_history(["Delhi"], days=1)
+    config.seeded = None
+    runs = [bench_startup.measure_first_response() for _ in range(config.scale(5, 2))]
+    return {
+        **summarise([run["first_response"] for run in runs]),
+        "first_chart": fixtures.percentiles([run["first_chart"] for run in runs], (50,)),
+    }
+
+
+# --- running and comparing --------------------------------------------------
+
+def git_revision() -> Dict[str, object]:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def run(config: Config, name_filter: Optional[str] = None) -> dict:
+    results = {}
+    for name, fn in BENCHMARKS:
+        if name_filter and name_filter not in name:
+            continue
+        result = fn(config)
+        results[name] = {"group": name.split(".", 1)[0], **result}
+        extra = f" {result['throughput_rps']:.0f} req/s" if "throughput_rps" in result else ""
+        print(f"{name:40s} median {result['median'] * 1000:10.3f}ms  min {result['min'] * 1000:10.3f}ms{extra}")
+    return {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "database": database.engine.dialect.name,
+            "quick": config.quick,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> List[str]:
+    """
+    Prints the median of every benchmark in both runs side by side and returns
+    the names that got slower by more than `threshold` (a fraction).
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        ratio = result["median"] / old["median"] if old["median"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:40s} {old['median'] * 1000:10.3f}ms -> {result['median'] * 1000:10.3f}ms  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv: List[str]) -> int:
+    if argv[:1] == ["compare"]:
+        parser = argparse.ArgumentParser(prog="python -m benchmarks.suite compare")
+        parser.add_argument("baseline")
+        parser.add_argument("current")
+        parser.add_argument("--threshold", type=float, default=0.10)
+        args = parser.parse_args(argv[1:])
+        with open(args.baseline) as old, open(args.current) as new:
+            return 1 if compare(json.load(old), json.load(new), args.threshold) else 0
+
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.suite")
+    parser.add_argument("--quick", action="store_true", help="smaller data and fewer repeats (smoke run)")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="previous results to compare against; exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(Config(quick=args.quick), args.filter)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {args.output}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            return 1 if compare(json.load(f), results, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,13 +1,127 @@
 from pydantic_settings import BaseSettings
-from typing import Union, List, Dict
+from typing import Union, List, Dict, Optional
 
 class Settings(BaseSettings):
     OPENWEATHERMAP_API_KEY: str
+    OPENWEATHERMAP_BASE_URL: str = "http://api.openweathermap.org/data/2.5"
     DATABASE_URL: str
+    # Either a list of city names, or a dict of city name -> {"lat", "lon"} and/or
+    # {"id"} (OpenWeatherMap city id, which lets the city be fetched in group requests)
     CITIES: Union[List[str], Dict[str, Dict[str, float]]] = [
         "Delhi", "Mumbai", "Chennai", "Bangalore", "Kolkata", "Hyderabad"
     ]
 
+    # Upstream fetch tuning: max in-flight requests per polling cycle,
+    # pooled connections per host and per-request timeout in seconds.
+    FETCH_CONCURRENCY: int = 20
+    FETCH_LIMIT_PER_HOST: int = 20
+    FETCH_TIMEOUT: float = 10.0
+
+    # Cities with an OpenWeatherMap id are fetched in group requests of up to
+    # this many ids (the upstream limit is 20); 0 disables group fetching.
+    FETCH_GROUP_SIZE: int = 20
+
+    # Upstream resilience: request quota (requests per minute, 0 = unlimited) and
+    # burst size, retries with jittered exponential backoff (seconds) for 5xx/429
+    # and timeouts, and a circuit breaker that opens after this many consecutive
+    # failures and lets a trial request through after the reset timeout.
+    UPSTREAM_RATE_LIMIT: float = 60.0
+    UPSTREAM_BURST: int = 60
+    UPSTREAM_MAX_RETRIES: int = 3
+    UPSTREAM_BACKOFF_BASE: float = 0.5
+    UPSTREAM_BACKOFF_MAX: float = 30.0
+    BREAKER_FAILURE_THRESHOLD: int = 5
+    BREAKER_RESET_TIMEOUT: float = 30.0
+
+    # Polling schedule, in seconds: cycle interval, maximum random delay per
+    # cycle, and the window over which a cycle's city requests are spread.
+    # POLL_ENABLED=false serves the API without polling (tests, read-only replicas).
+    POLL_ENABLED: bool = True
+    POLL_INTERVAL: float = 300.0
+    POLL_JITTER: float = 10.0
+    POLL_STAGGER: float = 30.0
+
+    # Write-behind ingestion: flush buffered observations to the database once
+    # this many rows are pending or the oldest has waited this many seconds.
+    # The default age of 0 writes each polling cycle as one batch.
+    INGEST_BATCH_SIZE: int = 500
+    INGEST_MAX_AGE: float = 0.0
+
+    # Current-weather response cache: entry lifetime in seconds, maximum number
+    # of cached cities, and whether each polling cycle refreshes the cache.
+    CACHE_TTL: float = 600.0
+    CACHE_MAX_ENTRIES: int = 1024
+    CACHE_PREWARM: bool = True
+
+    # JSON responses of at least this many bytes are gzip/brotli compressed when
+    # the client accepts it; encoded bodies of hot bulk responses kept for reuse.
+    COMPRESS_MIN_SIZE: int = 1024
+    RESPONSE_CACHE_SIZE: int = 512
+
+    # Number of recent alerts kept in memory per city
+    ALERT_HISTORY_SIZE: int = 100
+
+    # Number of recent observations kept in memory per city (one week at 5 minutes)
+    OBSERVATION_HISTORY_SIZE: int = 2016
+
+    # Live /stream: messages buffered per subscriber before the oldest is dropped,
+    # and seconds between keepalive comments on an idle connection.
+    STREAM_QUEUE_SIZE: int = 100
+    STREAM_KEEPALIVE: float = 15.0
+
+    # Database connection pools (the async pool serves request handlers): connections kept
+    # open, extra connections allowed under load, seconds to wait for a free connection,
+    # seconds before a connection is replaced, and compiled/prepared statements cached.
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: float = 1800.0
+    DB_STATEMENT_CACHE_SIZE: int = 500
+
+    # State shared between worker processes (`uvicorn main:app --workers N`): alert rules,
+    # the current-weather cache and the polling leader lease. "memory" (single worker),
+    # "sql" (the application database) or "redis" (REDIS_URL, requires redis).
+    # The leader renews its lease every poll, so LEADER_LEASE_TTL must exceed POLL_INTERVAL;
+    # the other workers pick up what the leader persisted every FOLLOWER_SYNC_INTERVAL seconds.
+    STATE_BACKEND: str = "memory"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    LEADER_LEASE_TTL: float = 900.0
+    FOLLOWER_SYNC_INTERVAL: float = 5.0
+
+    # Sampling profiler of the API process, started and stopped at runtime through
+    # POST /profiler/start and /profiler/stop (disabled unless PROFILER_ENABLED).
+    # Sampling stops by itself after PROFILER_MAX_DURATION seconds.
+    PROFILER_ENABLED: bool = False
+    PROFILER_INTERVAL: float = 0.005
+    PROFILER_MAX_DURATION: float = 300.0
+
+    # Columnar history archive (requires pyarrow): directory of city/day partitions
+    # written by `python -m data.archive export`, as "arrow" (memory-mapped) or "parquet" files.
+    # When set, summaries and charts read archived days from it instead of the database.
+    ARCHIVE_PATH: Optional[str] = None
+    ARCHIVE_FORMAT: str = "arrow"
+
+    # Retention and compaction (data.rollup), run by the polling worker every
+    # COMPACTION_INTERVAL seconds (0 disables it): raw observations are rolled up into
+    # hourly and daily tables COMPACTION_SETTLE seconds after each hour ends, raw rows
+    # older than RAW_RETENTION_DAYS are deleted (exported to ARCHIVE_PATH first, if set)
+    # and hourly rollups older than HOURLY_RETENTION_DAYS too. 0 keeps them forever;
+    # raw retention is opt-in, so an upgrade never deletes observations by itself.
+    COMPACTION_INTERVAL: float = 3600.0
+    COMPACTION_SETTLE: float = 900.0
+    RAW_RETENTION_DAYS: int = 0
+    HOURLY_RETENTION_DAYS: int = 365
+
+    # Chart rendering: worker processes (0 renders in a background thread),
+    # number of rendered images kept in the cache, and the most cities one
+    # /chart/compare request may ask for.
+    CHART_RENDER_WORKERS: int = 2
+    CHART_CACHE_SIZE: int = 256
+    CHART_COMPARE_MAX_CITIES: int = 100
+
+    # Most distinct cities one /batch/* request may ask for
+    BATCH_MAX_CITIES: int = 500
+
     class Config:
         env_file = ".env"
 
@@ -21,8 +135,12 @@ class Settings(BaseSettings):
 
     def get_city_coords(self, city: str) -> Dict[str, float]:
         if isinstance(self.CITIES, dict):
-            return self.CITIES.get(city, {})
-        else:
-            return {}
-        
-        
\ No newline at end of file
+            config = self.CITIES.get(city, {})
+            if "lat" in config and "lon" in config:
+                return {"lat": config["lat"], "lon": config["lon"]}
+        return {}
+
+    def get_city_id(self, city: str) -> Optional[int]:
+        if isinstance(self.CITIES, dict) and "id" in self.CITIES.get(city, {}):
+            return int(self.CITIES[city]["id"])
+        return None
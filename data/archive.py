@@ -0,0 +1,450 @@
+"""
+archive.py
+
+Columnar archive of historical observations, partitioned by city and UTC day
+(hive layout: <root>/city=<city>/day=<YYYY-MM-DD>/), in Arrow IPC files
+(uncompressed, read zero-copy from memory maps; the default) or Parquet.
+
+Reads are memory-mapped and pruned: city/day directories outside the range
+are never opened, only the requested columns are read, and the dt range is
+only evaluated on the two boundary days. Coverage is tracked per (city, day):
+readers take every partition the archive holds and read only the remaining
+days, city by city, from the OLTP database. pyarrow is an optional dependency,
+only needed once an archive is configured (settings.ARCHIVE_PATH).
+
+Run with: python -m data.archive export|import [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--cities A,B]
+"""
+
+import os
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple, Union
+from urllib.parse import unquote
+
+from sqlalchemy import select
+
+from data import database
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only needed when an archive is used
+    pa = pc = ds = pq = None
+
+FRAME_COLUMNS = ["city", "dt", "main", "temp", "feels_like", "humidity"]
+FORMATS = {"parquet": "parquet", "arrow": "ipc"}
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("The weather archive requires pyarrow: pip install pyarrow")
+
+
+def _bounds(start, end) -> Tuple[Optional[datetime], Optional[datetime]]:
+    return (
+        database.to_db_datetime(start) if start is not None else None,
+        database.to_db_datetime(end) if end is not None else None,
+    )
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, datetime.min.time())
+
+
+class WeatherArchive:
+    """
+    :param root: Directory holding the partitioned archive.
+    :param format: "arrow" (Arrow IPC / Feather v2, read zero-copy from memory-mapped
+                   files; the fastest to load) or "parquet" (compressed, smaller on disk).
+    :param refresh_interval: Seconds the partition listing is cached for. Writes through
+                             this instance refresh it at once; exports by other processes
+                             show up within this interval.
+    """
+
+    def __init__(self, root: str, format: str = "arrow", refresh_interval: float = 60.0):
+        _require_pyarrow()
+        if format not in FORMATS:
+            raise ValueError(f"Unknown archive format {format!r}; expected one of {sorted(FORMATS)}")
+        self.root = root
+        self.format = format
+        self.refresh_interval = refresh_interval
+        self._partition_cache: Optional[Dict[Tuple[str, date], str]] = None
+        self._scanned_at = 0.0
+        self.partitioning = ds.partitioning(
+            pa.schema([("city", pa.string()), ("day", pa.string())]), flavor="hive"
+        )
+        self.schema = pa.schema([
+            ("dt", pa.timestamp("s")),
+            ("main", pa.string()),
+            ("temp", pa.float64()),
+            ("feels_like", pa.float64()),
+            ("humidity", pa.float64()),
+            ("city", pa.string()),
+            ("day", pa.string()),
+        ])
+
+    def _partitions(self) -> Dict[Tuple[str, date], str]:
+        # Cached listing, so reads do not walk the archive directory every time
+        now = time.monotonic()
+        if self._partition_cache is None or now - self._scanned_at >= self.refresh_interval:
+            self._partition_cache, self._scanned_at = self._scan(), now
+        return self._partition_cache
+
+    def refresh(self):
+        # Drops the cached partition listing; the next read rescans the directory
+        self._partition_cache = None
+
+    def _scan(self) -> Dict[Tuple[str, date], str]:
+        # (city, day) -> partition directory, from the directory names alone.
+        # Partition values are URI-encoded in directory names.
+        partitions = {}
+        if not os.path.isdir(self.root):
+            return partitions
+        for city_dir in os.listdir(self.root):
+            if not city_dir.startswith("city="):
+                continue
+            city = unquote(city_dir[len("city="):])
+            for day_dir in os.listdir(os.path.join(self.root, city_dir)):
+                if day_dir.startswith("day="):
+                    day = date.fromisoformat(day_dir[len("day="):])
+                    partitions[(city, day)] = os.path.join(self.root, city_dir, day_dir)
+        return partitions
+
+    def _read_partition(self, path: str, schema):
+        # Files are memory-mapped: Arrow IPC columns are used in place, Parquet pages
+        # are decoded straight from the mapping, and only the schema's columns are read.
+        tables = []
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if self.format == "arrow":
+                table = pa.ipc.open_file(pa.memory_map(file_path)).read_all().select(schema.names)
+            else:
+                table = pq.ParquetFile(file_path, memory_map=True).read(columns=schema.names)
+            if table.schema != schema:
+                table = table.cast(schema)  # Parquet stores second timestamps as milliseconds
+            tables.append(table)
+        return pa.concat_tables(tables) if len(tables) != 1 else tables[0]
+
+    def _select(
+        self, cities: Optional[List[str]], start: Optional[datetime], end: Optional[datetime]
+    ) -> List[Tuple[str, date, str]]:
+        # Partition pruning on the directory names: (city, day, path) of the partitions
+        # overlapping [start, end), in (city, day) order
+        return sorted(
+            (city, day, path) for (city, day), path in self._partitions().items()
+            if (cities is None or city in cities)
+            and (start is None or day >= start.date())
+            and (end is None or _day_start(day) < end)
+        )
+
+    def _read_day(self, path: str, day: date, schema, start: Optional[datetime], end: Optional[datetime]):
+        table = self._read_partition(path, schema)
+        # Only the first and last day can hold rows outside [start, end)
+        if start is not None and day == start.date():
+            table = table.filter(pc.greater_equal(table["dt"], pa.scalar(start, pa.timestamp("s"))))
+        if end is not None and day == end.date():
+            table = table.filter(pc.less(table["dt"], pa.scalar(end, pa.timestamp("s"))))
+        return table
+
+    def days(self, city: Optional[str] = None) -> List[date]:
+        # Archived days, of one city or of any city
+        return sorted({day for (name, day) in self._partitions() if city is None or name == city})
+
+    def covered_until(self, city: Optional[str] = None) -> Optional[date]:
+        """
+        Exclusive end of the archived history of one city, or of any city: the day
+        after its last archived day. Readers do not split on it; days without a
+        partition are read from the database.
+        """
+        days = self.days(city)
+        return days[-1] + timedelta(days=1) if days else None
+
+    def write_frame(self, df) -> int:
+        """
+        Writes a frame with load_weather_frame's columns into the archive. Every
+        (city, day) partition present in the frame is replaced as a whole, so
+        re-exporting a day is idempotent.
+        """
+        import pandas as pd
+
+        if df.empty:
+            return 0
+        df = df[FRAME_COLUMNS].copy()
+        df["city"] = df["city"].astype(str)
+        df["main"] = df["main"].astype(str)
+        df["dt"] = pd.to_datetime(df["dt"]).astype("datetime64[s]")
+        df["day"] = df["dt"].dt.strftime("%Y-%m-%d")
+        df = df.sort_values(["city", "dt"])
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        ds.write_dataset(
+            table,
+            self.root,
+            format=FORMATS[self.format],
+            partitioning=self.partitioning,
+            existing_data_behavior="delete_matching",
+            basename_template="part-{i}." + ("parquet" if self.format == "parquet" else "arrow"),
+        )
+        self.refresh()
+        return table.num_rows
+
+    def export(
+        self,
+        start: Union[date, datetime, int],
+        end: Union[date, datetime, int],
+        cities: Optional[List[str]] = None,
+        chunk_days: int = 7,
+    ) -> int:
+        """
+        Copies observations in [start, end) from the database into the archive,
+        chunk_days at a time so a year of history never sits in memory at once.
+        Export whole days: a partially exported day is replaced by the next export.
+
+        :return: Number of rows written.
+        """
+        start, end = database.to_db_datetime(start), database.to_db_datetime(end)
+        written = 0
+        while start < end:
+            chunk_end = min(end, start + timedelta(days=chunk_days))
+            written += self.write_frame(database.load_weather_frame(cities, start, chunk_end))
+            start = chunk_end
+        return written
+
+    def load_frame(
+        self,
+        cities: Optional[List[str]] = None,
+        start: Optional[Union[int, datetime, date]] = None,
+        end: Optional[Union[int, datetime, date]] = None,
+        columns: Optional[List[str]] = None,
+    ):
+        """
+        Same contract as database.load_weather_frame, read from the archive.
+
+        Partitions are stored sorted by dt and read in (city, day) order, so
+        the result needs no sorting.
+
+        :param columns: Columns to read besides city and dt (default: all).
+        :return: DataFrame with columns city, dt and the requested columns, ordered by city, dt.
+        """
+        import numpy as np
+
+        columns = ["dt"] + [c for c in (columns or FRAME_COLUMNS) if c not in ("city", "dt")]
+        start, end = _bounds(start, end)
+        schema = pa.schema([self.schema.field(column) for column in columns])
+        names, tables = [], []
+        for city, day, path in self._select(cities, start, end):
+            names.append(city)
+            tables.append(self._read_day(path, day, schema, start, end))
+
+        table = pa.concat_tables(tables) if tables else schema.empty_table()
+        # The city column is rebuilt as a dictionary from the partition names
+        dictionary = sorted(set(names))
+        codes = np.repeat([dictionary.index(name) for name in names], [t.num_rows for t in tables]).astype(np.int32)
+        city = pa.DictionaryArray.from_arrays(pa.array(codes, pa.int32()), pa.array(dictionary, pa.string()))
+        table = table.add_column(0, "city", city)
+        df = table.to_pandas()
+        if "main" in df:
+            df["main"] = df["main"].astype("category")
+        return df
+
+    def load_downsampled_series(
+        self,
+        city: str,
+        start: Union[int, datetime, date],
+        end: Union[int, datetime, date],
+        max_points: int = 2000,
+    ):
+        """
+        Same contract as database.load_downsampled_series, read from the archive.
+        """
+        start_ts = database.to_timestamp(database.to_db_datetime(start))
+        end_ts = database.to_timestamp(database.to_db_datetime(end))
+        df = self.load_frame([city], start, end, columns=["temp", "feels_like", "humidity"])
+        return database.downsample_frame(df, start_ts, database.bucket_size(start_ts, end_ts, max_points))
+
+    def import_into_database(
+        self,
+        cities: Optional[List[str]] = None,
+        start: Optional[Union[int, datetime, date]] = None,
+        end: Optional[Union[int, datetime, date]] = None,
+    ) -> int:
+        """
+        Backfills the database from the archive, reading one (city, day) partition
+        at a time so only a single day is ever held in memory. Observations the
+        database already holds (same city and dt) are skipped.
+
+        :return: Number of rows inserted.
+        """
+        import pandas as pd
+
+        start, end = _bounds(start, end)
+        schema = pa.schema([self.schema.field(column) for column in FRAME_COLUMNS if column != "city"])
+        table = database.WeatherDataDB.__table__
+        inserted = 0
+        for city, day, path in self._select(cities, start, end):
+            part = self._read_day(path, day, schema, start, end).to_pandas()
+            if part.empty:
+                continue
+            day_start = _day_start(day)
+            stmt = select(table.c.dt).where(
+                table.c.city == city,
+                table.c.dt >= day_start,
+                table.c.dt < day_start + timedelta(days=1),
+            )
+            with database.engine.connect() as conn:
+                existing = {row.dt for row in conn.execute(stmt)}
+            rows = [
+                {"city": city, "main": row.main, "temp": row.temp, "feels_like": row.feels_like,
+                 "humidity": None if pd.isna(row.humidity) else row.humidity,
+                 "dt": row.dt.to_pydatetime()}
+                for row in part.itertuples(index=False)
+                if row.dt.to_pydatetime() not in existing
+            ]
+            inserted += database.insert_weather_data_bulk(rows)
+        return inserted
+
+
+def _gaps(days: List[date], start: Optional[datetime], end: Optional[datetime]) -> List[Tuple]:
+    # [lo, hi) ranges of [start, end) not covered by the sorted archived days; None is unbounded
+    gaps, lo = [], start
+    for day in days:
+        if lo is None or lo < _day_start(day):
+            gaps.append((lo, _day_start(day)))
+        lo = _day_start(day) + timedelta(days=1)
+    if end is None or lo is None or lo < end:
+        gaps.append((lo, end))
+    return gaps
+
+
+def _plan(
+    archive: WeatherArchive,
+    cities: Optional[List[str]],
+    start: Optional[datetime],
+    end: Optional[datetime],
+) -> Tuple[List[str], Dict[Tuple, List[str]]]:
+    """
+    Splits a read over [start, end) between the archive and the database, per
+    (city, day).
+
+    :return: The cities with archived days in the range, and the ranges each
+             city has no partitions for, grouped so cities missing the same
+             ranges share one database query per range.
+    """
+    archived: Dict[str, List[date]] = {}
+    for city, day, _ in archive._select(cities, start, end):
+        archived.setdefault(city, []).append(day)
+    if not archived:
+        return [], {}
+    if cities is None:
+        cities = sorted(set(archived) | set(database.get_observed_cities(start, end)))
+    missing: Dict[Tuple, List[str]] = {}
+    for city in cities:
+        gaps = tuple(_gaps(archived.get(city, []), start, end))
+        if gaps:
+            missing.setdefault(gaps, []).append(city)
+    return sorted(archived), missing
+
+
+def load_weather_frame(
+    archive: Optional[WeatherArchive],
+    cities: Optional[List[str]] = None,
+    start: Optional[Union[int, datetime, date]] = None,
+    end: Optional[Union[int, datetime, date]] = None,
+):
+    """
+    database.load_weather_frame that serves archived (city, day) partitions from
+    the archive and every other day from the database.
+    """
+    import pandas as pd
+
+    if archive is None:
+        return database.load_weather_frame(cities, start, end)
+    start, end = _bounds(start, end)
+    archived, missing = _plan(archive, cities, start, end)
+    if not archived:
+        return database.load_weather_frame(cities, start, end)
+    frame = archive.load_frame(archived, start, end)
+    if not missing:
+        return frame
+    frames = [frame] + [
+        database.load_weather_frame(group, lo, hi) for gaps, group in missing.items() for lo, hi in gaps
+    ]
+    frames = [part.astype({"city": str, "main": str}) for part in frames if not part.empty]
+    if not frames:
+        return frame
+    df = pd.concat(frames, ignore_index=True)
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["city"] = df["city"].astype("category")
+    df["main"] = df["main"].astype("category")
+    return df.sort_values(["city", "dt"], ignore_index=True)
+
+
+def load_downsampled_series(
+    archive: Optional[WeatherArchive],
+    city: str,
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+    max_points: int = 2000,
+):
+    """
+    database.load_downsampled_series that reads archived days from the archive.
+    """
+    archived, missing = _plan(archive, [city], *_bounds(start, end)) if archive is not None else ([], {})
+    if not archived:
+        return database.load_downsampled_series(city, start, end, max_points=max_points)
+    if not missing:
+        return archive.load_downsampled_series(city, start, end, max_points=max_points)
+    start_ts = database.to_timestamp(database.to_db_datetime(start))
+    end_ts = database.to_timestamp(database.to_db_datetime(end))
+    df = load_weather_frame(archive, [city], start, end)
+    return database.downsample_frame(df, start_ts, database.bucket_size(start_ts, end_ts, max_points))
+
+
+def load_downsampled_frame(
+    archive: Optional[WeatherArchive],
+    cities: List[str],
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+    max_points: int = 2000,
+):
+    """
+    database.load_downsampled_frame that reads archived days from the archive.
+    """
+    archived, _ = _plan(archive, cities, *_bounds(start, end)) if archive is not None else ([], {})
+    if not archived:
+        return database.load_downsampled_frame(cities, start, end, max_points=max_points)
+    start_ts = database.to_timestamp(database.to_db_datetime(start))
+    end_ts = database.to_timestamp(database.to_db_datetime(end))
+    df = load_weather_frame(archive, cities, start, end)
+    return database.downsample_frame(
+        df, start_ts, database.bucket_size(start_ts, end_ts, max_points), by_city=True
+    )
+
+
+if __name__ == "__main__":
+    import argparse
+    from config.settings import Settings
+
+    parser = argparse.ArgumentParser(description="Export the weather history to, or backfill it from, the archive")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--start", type=date.fromisoformat)
+    parser.add_argument("--end", type=date.fromisoformat, help="exclusive (default: today)")
+    parser.add_argument("--cities", help="comma-separated (default: all)")
+    args = parser.parse_args()
+
+    settings = Settings()
+    if not settings.ARCHIVE_PATH:
+        parser.error("Set ARCHIVE_PATH to use the archive")
+    database.configure(settings.DATABASE_URL)
+    archive = WeatherArchive(settings.ARCHIVE_PATH, format=settings.ARCHIVE_FORMAT)
+    cities = args.cities.split(",") if args.cities else None
+    if args.command == "export":
+        end = args.end or datetime.now(timezone.utc).date()
+        # Continue after the city with the shortest archived history
+        start = args.start or min(
+            archive.covered_until(city) or end - timedelta(days=365) for city in (cities or [None])
+        )
+        print(f"Exported {archive.export(start, end, cities)} rows for {start} .. {end}")
+    else:
+        print(f"Imported {archive.import_into_database(cities, args.start, args.end)} rows")
@@ -0,0 +1,209 @@
+"""
+async_database.py
+
+Async access to the application database for request handlers.
+
+Reads issued from the API event loop go through a SQLAlchemy asyncio engine
+(aiosqlite for SQLite, asyncpg for PostgreSQL), so a slow history query waits
+on the socket instead of holding one of the threads in FastAPI's thread pool.
+The queries themselves are the ones data.database builds, so both layers
+return the same rows.
+
+The pool is sized explicitly (pool_size + max_overflow connections, waiting
+at most pool_timeout seconds for one), connections are pre-pinged before being
+handed out and recycled after pool_recycle seconds, and compiled statements
+are cached (plus prepared statements per connection on asyncpg).
+
+Requires aiosqlite or asyncpg for the configured database.
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from data import database
+from data.database import AlertDB, DailySummaryDB, WeatherDataDB
+from utils.metrics import instrument_engine
+
+# Async driver for each backend DATABASE_URL may name (with or without a sync driver)
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+
+def async_database_url(url: str) -> str:
+    """
+    Rewrites a sync URL (sqlite:///..., postgresql+psycopg2://...) to its async driver.
+    """
+    parsed = make_url(url)
+    if parsed.drivername == "postgres":  # legacy alias some hosts still hand out
+        parsed = parsed.set(drivername="postgresql")
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {parsed.get_backend_name()!r} databases")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+def create_async_db_engine(
+    url: str,
+    pool_size: int = 10,
+    max_overflow: int = 20,
+    pool_timeout: float = 30.0,
+    pool_recycle: float = 1800.0,
+    statement_cache_size: int = 500,
+) -> AsyncEngine:
+    """
+    :param url: Database URL, sync or async form.
+    :param pool_size: Connections kept open.
+    :param max_overflow: Extra connections opened under load, closed when returned.
+    :param pool_timeout: Seconds to wait for a free connection before failing.
+    :param pool_recycle: Seconds after which a connection is replaced.
+    :param statement_cache_size: Compiled SQL statements cached by the engine (and,
+                                 on PostgreSQL, prepared statements per connection).
+    """
+    parsed = make_url(async_database_url(url))
+    options = {"pool_pre_ping": True, "query_cache_size": statement_cache_size}
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        # An in-memory database exists once per connection: share a single one
+        options["poolclass"] = StaticPool
+    else:
+        options.update(
+            poolclass=AsyncAdaptedQueuePool, pool_size=pool_size, max_overflow=max_overflow,
+            pool_timeout=pool_timeout, pool_recycle=pool_recycle,
+        )
+    if parsed.get_backend_name() == "postgresql":
+        parsed = parsed.update_query_dict({"prepared_statement_cache_size": str(statement_cache_size)})
+    engine = create_async_engine(parsed, **options)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+class AsyncDatabase:
+    """
+    An async engine plus its session factory.
+
+    :param url: Database URL (see create_async_db_engine for the pool options).
+    """
+
+    def __init__(self, url: str, **pool_options):
+        self.engine = create_async_db_engine(url, **pool_options)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def session(self) -> AsyncIterator[AsyncSession]:
+        # One session per request, usable as a FastAPI dependency
+        async with self.sessionmaker() as session:
+            yield session
+
+    def pool_status(self) -> Dict[str, int]:
+        pool = self.engine.pool
+        if not isinstance(pool, AsyncAdaptedQueuePool):
+            return {}
+        return {
+            "size": pool.size(), "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(), "idle": pool.checkedin(),
+        }
+
+    async def dispose(self):
+        await self.engine.dispose()
+
+
+# Async counterparts of the data.database read functions; each takes the session first
+
+async def get_weather_range(
+    session: AsyncSession,
+    city: str,
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+) -> List[WeatherDataDB]:
+    return (await session.execute(database.weather_range_query(city, start, end))).scalars().all()
+
+
+async def get_latest(session: AsyncSession, city: str) -> Optional[WeatherDataDB]:
+    return (await session.execute(database.latest_query(city))).scalars().first()
+
+
+async def get_daily_weather_data(session: AsyncSession, city: str, day: Optional[date] = None) -> List[WeatherDataDB]:
+    day = day or datetime.now(timezone.utc).date()
+    return await get_weather_range(session, city, day, day + timedelta(days=1))
+
+
+async def get_recent_alerts(
+    session: AsyncSession, cities: Optional[List[str]] = None, limit: int = 100
+) -> Dict[str, List[AlertDB]]:
+    rows = (await session.execute(database.recent_alerts_query(cities, limit))).scalars().all()
+    return database.group_by_city(rows)
+
+
+async def get_daily_summaries(
+    session: AsyncSession, city: Optional[str] = None, since: Optional[date] = None
+) -> List[DailySummaryDB]:
+    return (await session.execute(database.daily_summaries_query(city, since))).scalars().all()
+
+
+async def get_rollup_coverage(session: AsyncSession) -> Dict[str, int]:
+    return database.parse_rollup_coverage(await session.execute(database.rollup_coverage_query()))
+
+
+async def get_rollups(
+    session: AsyncSession, level: str, city: Optional[Union[str, List[str]]], start, end
+) -> list:
+    return (await session.execute(database.rollups_query(level, city, start, end))).scalars().all()
+
+
+async def load_weather_frame(
+    session: AsyncSession,
+    cities: Optional[List[str]] = None,
+    start: Optional[Union[int, datetime, date]] = None,
+    end: Optional[Union[int, datetime, date]] = None,
+):
+    """
+    Same frame as data.database.load_weather_frame: columns city, dt, main,
+    temp, feels_like, humidity, ordered by (city, dt).
+    """
+    import pandas as pd
+
+    rows = (await session.execute(database.weather_frame_query(cities, start, end))).all()
+    return database.finish_weather_frame(pd.DataFrame(rows, columns=database.WEATHER_FRAME_COLUMNS))
+
+
+async def load_downsampled_series(
+    session: AsyncSession,
+    city: str,
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+    max_points: int = 2000,
+):
+    """
+    Same buckets as data.database.load_downsampled_series.
+    """
+    start_ts = database.to_timestamp(database.to_db_datetime(start))
+    end_ts = database.to_timestamp(database.to_db_datetime(end))
+    bucket_seconds = database.bucket_size(start_ts, end_ts, max_points)
+    coverage = await get_rollup_coverage(session)
+    stmts = database.downsampled_queries(city, start, end, bucket_seconds, session.bind.dialect.name, coverage)
+    if stmts is None:
+        df = await load_weather_frame(session, [city], start, end)
+        return database.downsample_frame(df, start_ts, bucket_seconds)
+    return database.finish_downsampled([(await session.execute(stmt)).all() for stmt in stmts])
+
+
+async def load_downsampled_frame(
+    session: AsyncSession,
+    cities: List[str],
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+    max_points: int = 2000,
+):
+    """
+    Same frame as data.database.load_downsampled_frame.
+    """
+    start_ts = database.to_timestamp(database.to_db_datetime(start))
+    end_ts = database.to_timestamp(database.to_db_datetime(end))
+    bucket_seconds = database.bucket_size(start_ts, end_ts, max_points)
+    coverage = await get_rollup_coverage(session)
+    stmts = database.downsampled_queries(list(cities), start, end, bucket_seconds, session.bind.dialect.name, coverage)
+    if stmts is None:
+        df = await load_weather_frame(session, cities, start, end)
+        return database.downsample_frame(df, start_ts, bucket_seconds, by_city=True)
+    return database.finish_downsampled([(await session.execute(stmt)).all() for stmt in stmts], by_city=True)
@@ -1,21 +1,72 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime
+from sqlalchemy import (
+    create_engine, cast, func, insert, inspect, select, text, update,
+    BigInteger, Column, Integer, String, Float, Date, DateTime, Index, Text, delete, or_,
+)
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session, sessionmaker
+from dotenv import dotenv_values
+from models.weather_data import WeatherData
+from models.alert import Alert
+from utils.metrics import instrument_engine
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Union
 import os
+import threading
+import time
 
-# Load environment variables from .env file
-load_dotenv()
+# Set up Base; the engine and session factory are created on first use, or by
+# configure() with the app's settings, so importing this module never connects
+Base = declarative_base()
+_engine = None
+_session_factory = None
 
-# Retrieve the database URL from the environment variables
-DATABASE_URL = os.getenv("DATABASE_URL")
+# DATABASE_URL from the environment, else from .env (read without loading it into os.environ)
+def _default_url() -> Optional[str]:
+    return os.getenv("DATABASE_URL") or dotenv_values(".env").get("DATABASE_URL")
 
-# Set up Base, engine, and session
-Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+# Create the engine and session factory; nothing connects until the first query
+def configure(url: Optional[str] = None):
+    """
+    Calling it again with the same URL keeps the existing engine; a different URL
+    disposes of it and starts a new one.
+
+    :param url: Database URL (default: DATABASE_URL from the environment or .env).
+    :return: The engine.
+    """
+    global _engine, _session_factory
+    url = url or _default_url()
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    if _engine is not None:
+        if _engine.url == make_url(url):
+            return _engine
+        _engine.dispose()
+    # pre-ping: connections dropped by the server (restarts, idle timeouts) are replaced, not handed out
+    _engine = create_engine(url, pool_pre_ping=True)
+    # Statement and transaction timings for /metrics
+    instrument_engine(_engine)
+    _session_factory = sessionmaker(autocommit=False, autoflush=False, bind=_engine)
+    return _engine
+
+def get_engine():
+    return _engine if _engine is not None else configure()
+
+def open_session() -> Session:
+    get_engine()
+    return _session_factory()
 
-# Define session
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# `engine`, `SessionLocal` and `DATABASE_URL` resolve to the configured engine on access
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        get_engine()
+        return _session_factory
+    if name == "DATABASE_URL":
+        return get_engine().url.render_as_string(hide_password=False)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Define WeatherDataDB table schema
 class WeatherDataDB(Base):
@@ -26,15 +77,172 @@ class WeatherDataDB(Base):
     main = Column(String)
     temp = Column(Float)
     feels_like = Column(Float)
-    dt = DateTime
+    humidity = Column(Float, nullable=True)
+    # Observation time, stored as naive UTC
+    dt = Column(DateTime, nullable=True)
+
+    # Range queries seek on (city, dt) instead of scanning the city's history;
+    # retention (data.rollup) deletes and archives whole days through the dt index
+    __table_args__ = (Index("ix_weather_data_city_dt", "city", "dt"), Index("ix_weather_data_dt", "dt"))
+
+    def to_model(self) -> WeatherData:
+        return WeatherData(
+            city=self.city, main=self.main, temp=self.temp,
+            feels_like=self.feels_like, humidity=self.humidity, dt=to_timestamp(self.dt),
+        )
+
+# Define DailySummaryDB rollup table: running aggregates per (city, UTC day)
+class DailySummaryDB(Base):
+    __tablename__ = "daily_weather_summary"
+
+    city = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    temp_sum = Column(Float, nullable=False, default=0.0)
+    temp_min = Column(Float)
+    temp_max = Column(Float)
+    feels_like_sum = Column(Float, nullable=False, default=0.0)
+    feels_like_min = Column(Float)
+    feels_like_max = Column(Float)
+    # Condition histogram as JSON, e.g. {"Clear": 10, "Rain": 2}
+    conditions = Column(String, nullable=False, default="{}")
+
+# Columns of the rollup tables written by data.rollup's compaction job: raw observations
+# aggregated per (city, bucket). Sums are stored rather than means, so buckets add up exactly.
+class RollupColumns:
+    city = Column(String, primary_key=True)
+    # Bucket start, naive UTC
+    bucket = Column(DateTime, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    temp_sum = Column(Float, nullable=False, default=0.0)
+    temp_min = Column(Float)
+    temp_max = Column(Float)
+    feels_like_sum = Column(Float, nullable=False, default=0.0)
+    feels_like_min = Column(Float)
+    feels_like_max = Column(Float)
+    # Humidity is optional, so it has its own count
+    humidity_sum = Column(Float, nullable=False, default=0.0)
+    humidity_count = Column(Integer, nullable=False, default=0)
+    # Condition histogram as JSON, e.g. {"Clear": 10, "Rain": 2}
+    conditions = Column(String, nullable=False, default="{}")
+
+class HourlyRollupDB(RollupColumns, Base):
+    __tablename__ = "weather_hourly"
+
+class DailyRollupDB(RollupColumns, Base):
+    __tablename__ = "weather_daily"
+
+    @property
+    def day(self) -> date:
+        return self.bucket.date()
+
+# Rollup level -> (table, bucket width in seconds); the "raw" level is weather_data itself
+ROLLUPS = {"hourly": (HourlyRollupDB, 3600), "daily": (DailyRollupDB, 86400)}
+LEVELS = ("raw", "hourly", "daily")
+
+# Define AlertDB table schema: history of alerts raised by AlertService
+class AlertDB(Base):
+    __tablename__ = "alerts"
+
+    id = Column(Integer, primary_key=True)
+    rule_id = Column(String, nullable=False)
+    city = Column(String, nullable=False)
+    metric = Column(String, nullable=False)
+    operator = Column(String, nullable=False)
+    threshold = Column(Float)
+    condition = Column(String)
+    value = Column(Float)
+    main = Column(String)
+    dt = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_alerts_city_dt", "city", "dt"),)
 
-# Create all tables (if they don't exist already)
-Base.metadata.create_all(bind=engine)
+    def to_model(self) -> Alert:
+        return Alert(
+            rule_id=self.rule_id, city=self.city, metric=self.metric, operator=self.operator,
+            threshold=self.threshold, condition=self.condition, value=self.value,
+            main=self.main, dt=to_timestamp(self.dt),
+        )
+
+# Define SharedStateDB table schema: key/value state shared by every worker process
+# (alert rules, cached responses, leader leases), see services.state
+class SharedStateDB(Base):
+    __tablename__ = "shared_state"
+
+    namespace = Column(String(64), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    value = Column(Text, nullable=False)
+    # Unix timestamp after which the entry is treated as absent; NULL never expires
+    expires_at = Column(Float)
+
+def to_db_datetime(value: Union[int, float, datetime, date]) -> datetime:
+    # Normalise a unix timestamp, aware/naive datetime or date to naive UTC.
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromtimestamp(value, tz=timezone.utc).replace(tzinfo=None)
+
+def to_timestamp(value: datetime) -> int:
+    return int(value.replace(tzinfo=timezone.utc).timestamp())
+
+def migrate_weather_data_schema(bind=None) -> dict:
+    """
+    Brings an existing weather_data table up to the current schema.
+
+    Older databases were created without the dt column (the observation time was
+    never stored), the humidity column and the (city, dt) index. This adds missing
+    columns and creates the composite index. Safe to run repeatedly.
+
+    Rows written before dt existed keep a NULL dt: their observation time is
+    unknown, and stamping them with any made-up time would count the whole old
+    history as observations of that moment. Every time-based query (ranges,
+    latest, frames, rollups) leaves them out.
+
+    :param bind: Engine to migrate; defaults to the configured engine.
+    :return: {"added_columns": [names], "undated": int, "created_index": bool},
+             undated being the number of rows without an observation time.
+    """
+    bind = bind if bind is not None else get_engine()
+    report = {"added_columns": [], "undated": 0, "created_index": False}
+    table = WeatherDataDB.__table__
+    inspector = inspect(bind)
+    if not inspector.has_table(table.name):
+        Base.metadata.create_all(bind=bind)
+        return report
+
+    with bind.begin() as conn:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns and column.nullable:
+                column_type = column.type.compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                report["added_columns"].append(column.name)
+
+        report["undated"] = conn.execute(
+            select(func.count()).select_from(table).where(table.c.dt.is_(None))
+        ).scalar()
+
+        indexes = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                index.create(bind=conn)
+                if index.name == "ix_weather_data_city_dt":
+                    report["created_index"] = True
+    return report
+
+def init_db(bind=None):
+    # Create all tables (if they don't exist already) and upgrade older schemas
+    bind = bind if bind is not None else get_engine()
+    Base.metadata.create_all(bind=bind)
+    migrate_weather_data_schema(bind)
 
 # Insert weather data into the database
-def insert_weather_data(weather_data: dict):
-    db_weather_data = WeatherDataDB(**weather_data)
-    db = SessionLocal()
+def insert_weather_data(weather_data: Union[dict, WeatherData]):
+    db_weather_data = WeatherDataDB(**_to_row(weather_data))
+    db = open_session()
     try:
         db.add(db_weather_data)
         db.commit()
@@ -45,11 +253,760 @@ def insert_weather_data(weather_data: dict):
     finally:
         db.close()
 
-# Retrieve daily weather data from the database
-def get_daily_weather_data(city: str):
-    db = SessionLocal()
+def _to_row(weather_data) -> dict:
+    # Accept either a WeatherData model or a plain dict, keeping only table columns.
+    if hasattr(weather_data, "model_dump"):
+        weather_data = weather_data.model_dump()
+    columns = WeatherDataDB.__table__.columns.keys()
+    row = {key: value for key, value in weather_data.items() if key in columns and key != "id"}
+    if row.get("dt") is not None:
+        row["dt"] = to_db_datetime(row["dt"])
+    return row
+
+# Insert a batch of weather data (e.g. a whole polling cycle) in a single transaction
+def insert_weather_data_bulk(weather_data_list: Iterable[Union[dict, WeatherData]]) -> int:
+    """
+    Writes all observations with one executemany INSERT and one commit.
+    No per-row refresh is done, so generated ids are not loaded back.
+
+    :param weather_data_list: WeatherData models or dicts with WeatherDataDB fields.
+    :return: Number of rows written.
+    """
+    rows = [_to_row(weather_data) for weather_data in weather_data_list]
+    if not rows:
+        return 0
+    db = open_session()
+    try:
+        db.execute(insert(WeatherDataDB), rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+    return len(rows)
+
+class WeatherDataBuffer:
+    """
+    In-memory write-behind buffer in front of insert_weather_data_bulk.
+
+    Observations are collected with add()/extend() and written in one batch once
+    the buffer holds max_size rows or its oldest row is older than max_age seconds.
+    Call flush() on shutdown so nothing buffered is lost.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 500,
+        max_age: float = 60.0,
+        writer: Callable[[List[dict]], int] = insert_weather_data_bulk,
+    ):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.writer = writer
+        self._rows: List[dict] = []
+        self._oldest = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def add(self, weather_data) -> int:
+        return self.extend([weather_data])
+
+    def extend(self, weather_data_list) -> int:
+        """
+        Buffers the observations and flushes if a size or age limit is reached.
+
+        :return: Number of rows written by this call (0 if nothing was flushed).
+        """
+        rows = [_to_row(weather_data) for weather_data in weather_data_list]
+        with self._lock:
+            if rows and self._oldest is None:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+        if self.is_due():
+            return self.flush()
+        return 0
+
+    def is_due(self) -> bool:
+        with self._lock:
+            if not self._rows:
+                return False
+            return (
+                len(self._rows) >= self.max_size
+                or time.monotonic() - self._oldest >= self.max_age
+            )
+
+    def flush(self) -> int:
+        """
+        Writes everything buffered in a single round-trip. On failure the rows are
+        put back so the next flush retries them.
+        """
+        with self._lock:
+            rows, self._rows = self._rows, []
+            oldest, self._oldest = self._oldest, None
+        if not rows:
+            return 0
+        try:
+            return self.writer(rows)
+        except Exception:
+            with self._lock:
+                self._rows = rows + self._rows
+                self._oldest = oldest
+            raise
+
+# Query builders shared with data.async_database, so both layers run the same SQL
+
+def city_filter(column, city: Union[str, List[str]]):
+    # One city, or several with a single IN (...)
+    return column == city if isinstance(city, str) else column.in_(city)
+
+def weather_range_query(city: Union[str, List[str]], start, end):
+    # A list of cities is ordered by (city, dt)
+    return (
+        select(WeatherDataDB)
+        .where(
+            city_filter(WeatherDataDB.city, city),
+            WeatherDataDB.dt >= to_db_datetime(start),
+            WeatherDataDB.dt < to_db_datetime(end),
+        )
+        .order_by(*([] if isinstance(city, str) else [WeatherDataDB.city]), WeatherDataDB.dt)
+    )
+
+def latest_query(city: str):
+    return (
+        select(WeatherDataDB)
+        .where(WeatherDataDB.city == city, WeatherDataDB.dt.isnot(None))
+        .order_by(WeatherDataDB.dt.desc())
+        .limit(1)
+    )
+
+# Retrieve the observations for a city (or several) within [start, end), oldest first
+def get_weather_range(
+    city: Union[str, List[str]],
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+) -> List[WeatherDataDB]:
+    db = open_session()
+    try:
+        return db.execute(weather_range_query(city, start, end)).scalars().all()
+    finally:
+        db.close()
+
+# Retrieve the most recent observation for a city (None if there is none)
+def get_latest(city: str) -> Optional[WeatherDataDB]:
+    db = open_session()
+    try:
+        return db.execute(latest_query(city)).scalars().first()
+    finally:
+        db.close()
+
+# Retrieve daily weather data from the database (one UTC day, today by default) for a city or several
+def get_daily_weather_data(city: Union[str, List[str]], day: Optional[date] = None) -> List[WeatherDataDB]:
+    day = day or datetime.now(timezone.utc).date()
+    return get_weather_range(city, day, day + timedelta(days=1))
+
+# Insert a batch of alerts (Alert models) in a single transaction
+def insert_alerts_bulk(alerts: Iterable[Alert]) -> int:
+    rows = [dict(alert.model_dump(), dt=to_db_datetime(alert.dt)) for alert in alerts]
+    if not rows:
+        return 0
+    db = open_session()
+    try:
+        db.execute(insert(AlertDB), rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+    return len(rows)
+
+def recent_alerts_query(cities: Optional[List[str]], limit: int):
+    ranked = select(
+        AlertDB.id,
+        func.row_number().over(partition_by=AlertDB.city, order_by=(AlertDB.dt.desc(), AlertDB.id.desc())).label("rank"),
+    )
+    if cities is not None:
+        ranked = ranked.where(AlertDB.city.in_(cities))
+    ranked = ranked.subquery()
+    return (
+        select(AlertDB)
+        .join(ranked, ranked.c.id == AlertDB.id)
+        .where(ranked.c.rank <= limit)
+        .order_by(AlertDB.city, AlertDB.dt, AlertDB.id)
+    )
+
+def group_by_city(rows) -> Dict[str, list]:
+    result: Dict[str, list] = {}
+    for row in rows:
+        result.setdefault(row.city, []).append(row)
+    return result
+
+# Retrieve the most recent alerts per city (oldest first), at most `limit` per city
+def get_recent_alerts(cities: Optional[List[str]] = None, limit: int = 100) -> Dict[str, List[AlertDB]]:
+    db = open_session()
     try:
-        result = db.query(WeatherDataDB).filter(WeatherDataDB.city == city).all()
-        return result
+        rows = db.execute(recent_alerts_query(cities, limit)).scalars().all()
     finally:
         db.close()
+    return group_by_city(rows)
+
+WEATHER_FRAME_COLUMNS = ["city", "dt", "main", "temp", "feels_like", "humidity"]
+
+def weather_frame_query(cities=None, start=None, end=None):
+    table = WeatherDataDB.__table__
+    # Rows without an observation time (see migrate_weather_data_schema) belong to no range
+    stmt = select(*(table.c[name] for name in WEATHER_FRAME_COLUMNS)).where(table.c.dt.isnot(None))
+    if cities is not None:
+        stmt = stmt.where(table.c.city.in_(cities))
+    if start is not None:
+        stmt = stmt.where(table.c.dt >= to_db_datetime(start))
+    if end is not None:
+        stmt = stmt.where(table.c.dt < to_db_datetime(end))
+    return stmt.order_by(table.c.city, table.c.dt)
+
+def finish_weather_frame(df):
+    # Column types of a loaded weather frame: datetime dt, categorical city and condition
+    import pandas as pd
+
+    df["dt"] = pd.to_datetime(df["dt"])
+    df["city"] = df["city"].astype("category")
+    df["main"] = df["main"].astype("category")
+    return df
+
+# Load observations for many cities into a DataFrame with a single query, ordered by (city, dt)
+def load_weather_frame(
+    cities: Optional[List[str]] = None,
+    start: Optional[Union[int, datetime, date]] = None,
+    end: Optional[Union[int, datetime, date]] = None,
+):
+    """
+    :param cities: Cities to load; None loads every city.
+    :param start: Inclusive lower bound on dt, if given.
+    :param end: Exclusive upper bound on dt, if given.
+    :return: DataFrame with columns city, dt, main, temp, feels_like, humidity.
+    """
+    import pandas as pd
+
+    with get_engine().connect() as conn:
+        df = pd.read_sql(weather_frame_query(cities, start, end), conn)
+    return finish_weather_frame(df)
+
+# Distinct cities with observations in [start, end)
+def get_observed_cities(
+    start: Optional[Union[int, datetime, date]] = None,
+    end: Optional[Union[int, datetime, date]] = None,
+) -> List[str]:
+    table = WeatherDataDB.__table__
+    stmt = select(table.c.city).distinct().where(table.c.dt.isnot(None))
+    if start is not None:
+        stmt = stmt.where(table.c.dt >= to_db_datetime(start))
+    if end is not None:
+        stmt = stmt.where(table.c.dt < to_db_datetime(end))
+    with get_engine().connect() as conn:
+        return sorted(conn.execute(stmt).scalars())
+
+def supports_rollups(dialect: str) -> bool:
+    # Rollups are computed by bucketing timestamps in SQL, which only some dialects allow
+    return _epoch_seconds(WeatherDataDB.__table__.c.dt, dialect) is not None
+
+def _epoch_seconds(column, dialect: str):
+    # Unix seconds of a naive-UTC DateTime column, for dialects we can push bucketing down to
+    if dialect == "sqlite":
+        return cast(func.strftime("%s", column), Integer)
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", column), BigInteger)
+    return None
+
+DOWNSAMPLED_COLUMNS = ["bucket", "temp", "temp_min", "temp_max", "feels_like", "humidity", "count"]
+DOWNSAMPLED_FRAME_COLUMNS = ["city", *DOWNSAMPLED_COLUMNS]
+
+# Vectorized in-memory equivalent of the SQL bucketing below, for frames from load_weather_frame;
+# by_city buckets each city separately and adds a leading city column
+def downsample_frame(df, start_ts: int, bucket_seconds: int, by_city: bool = False):
+    import pandas as pd
+
+    offset = (df["dt"] - pd.Timestamp(0)) // pd.Timedelta(seconds=1) - start_ts
+    bucket = (start_ts + offset // bucket_seconds * bucket_seconds).rename("bucket")
+    keys = [df["city"].astype(str), bucket] if by_city else bucket
+    grouped = df.groupby(keys, sort=True)
+    result = pd.DataFrame({
+        "temp": grouped["temp"].mean(), "temp_min": grouped["temp"].min(), "temp_max": grouped["temp"].max(),
+        "feels_like": grouped["feels_like"].mean(), "humidity": grouped["humidity"].mean(),
+        "count": grouped["temp"].count(),
+    }).reset_index()
+    return result[DOWNSAMPLED_FRAME_COLUMNS if by_city else DOWNSAMPLED_COLUMNS]
+
+def bucket_size(start_ts: int, end_ts: int, max_points: int) -> int:
+    # Smallest whole-second bucket that splits [start_ts, end_ts) into at most max_points buckets
+    return max(1, -(-(end_ts - start_ts) // max(1, max_points)))
+
+def bucket_window_end(days: int, points: int, now: Optional[float] = None) -> datetime:
+    """
+    End of a chart window over the last `days` days, downsampled to at most `points`
+    points: `now` (default: the clock) rounded up to a whole bucket, so the bucket
+    grid, and the ETag of the chart, only move once per bucket.
+
+    :return: Aware UTC datetime.
+    """
+    bucket = bucket_size(0, days * 86400, points)
+    now = int(time.time() if now is None else now)
+    return datetime.fromtimestamp(-(-now // bucket) * bucket, tz=timezone.utc)
+
+def downsampled_query(
+    city: Union[str, List[str]],
+    start,
+    end,
+    bucket_seconds: int,
+    dialect: str,
+    level: str = "raw",
+    origin: Optional[int] = None,
+):
+    """
+    Per-bucket aggregates computed in SQL; None if the dialect cannot bucket timestamps.
+    For a list of cities the rows are grouped and ordered by (city, bucket) and
+    start with a city column (DOWNSAMPLED_FRAME_COLUMNS).
+
+    :param level: "raw" reads weather_data; "hourly" or "daily" read that rollup table,
+                  whose buckets count where they start.
+    :param origin: Unix seconds of the grid's first bucket (default: start).
+    """
+    rollup = level != "raw"
+    table = ROLLUPS[level][0].__table__ if rollup else WeatherDataDB.__table__
+    time_column = table.c.bucket if rollup else table.c.dt
+    epoch = _epoch_seconds(time_column, dialect)
+    if epoch is None:
+        return None
+    origin = origin if origin is not None else to_timestamp(to_db_datetime(start))
+    bucket = origin + ((epoch - origin) // bucket_seconds) * bucket_seconds
+    if rollup:
+        count = func.sum(table.c.count)
+        aggregates = [
+            func.sum(table.c.temp_sum) / count, func.min(table.c.temp_min), func.max(table.c.temp_max),
+            func.sum(table.c.feels_like_sum) / count,
+            func.sum(table.c.humidity_sum) / func.nullif(func.sum(table.c.humidity_count), 0),
+            count,
+        ]
+    else:
+        aggregates = [
+            func.avg(table.c.temp), func.min(table.c.temp), func.max(table.c.temp),
+            func.avg(table.c.feels_like), func.avg(table.c.humidity), func.count(),
+        ]
+    many = not isinstance(city, str)
+    keys = [table.c.city, bucket] if many else [bucket]
+    return (
+        select(
+            *([table.c.city] if many else []),
+            bucket.label("bucket"),
+            *(aggregate.label(name) for aggregate, name in zip(aggregates, DOWNSAMPLED_COLUMNS[1:])),
+        )
+        .where(
+            table.c.city.in_(city) if many else table.c.city == city,
+            time_column >= to_db_datetime(start),
+            time_column < to_db_datetime(end),
+        )
+        .group_by(*keys)
+        .order_by(*keys)
+    )
+
+ROLLUP_STATE = "rollup"
+
+def rollup_coverage_query():
+    table = SharedStateDB.__table__
+    return select(table.c.key, table.c.value).where(table.c.namespace == ROLLUP_STATE)
+
+def parse_rollup_coverage(rows) -> Dict[str, int]:
+    return {row.key: int(row.value) for row in rows}
+
+# What weather_data and the rollup tables hold, as recorded by data.rollup.Compactor:
+# unix seconds raw_from (older raw rows were deleted), hourly_from, hourly_until and
+# daily_until. Empty before the first compaction.
+def get_rollup_coverage() -> Dict[str, int]:
+    with get_engine().connect() as conn:
+        return parse_rollup_coverage(conn.execute(rollup_coverage_query()))
+
+def plan_levels(start_ts: int, end_ts: int, bucket_seconds: int, coverage: Dict[str, int]) -> List[tuple]:
+    """
+    Splits [start_ts, end_ts) into (level, start, end) segments. Each segment is read
+    from the coarsest level whose buckets fit in bucket_seconds where that level holds
+    the data; elsewhere (hours not rolled up yet, raw rows past retention) from the
+    nearest level that does. Rollups are only used for whole buckets inside the range,
+    unless nothing finer is left.
+    """
+    spans = {"raw": (coverage.get("raw_from"), None)}
+    if "hourly_until" in coverage:
+        spans["hourly"] = (coverage.get("hourly_from"), coverage["hourly_until"])
+    if "daily_until" in coverage:
+        spans["daily"] = (None, coverage["daily_until"])
+    wanted = max(
+        i for i, level in enumerate(LEVELS) if level == "raw" or ROLLUPS[level][1] <= bucket_seconds
+    )
+    # Which levels hold data only changes at coverage boundaries and, for rollups,
+    # at the first and last whole bucket of the range
+    cuts = {start_ts, end_ts, *coverage.values()}
+    for _, width in ROLLUPS.values():
+        cuts.update((-(-start_ts // width) * width, end_ts // width * width))
+    cuts = sorted(t for t in cuts if start_ts <= t <= end_ts)
+    plan = []
+    for lo, hi in zip(cuts, cuts[1:]):
+        held = [
+            i for i, level in enumerate(LEVELS)
+            if level in spans
+            and (spans[level][0] is None or spans[level][0] <= lo)
+            and (spans[level][1] is None or lo < spans[level][1])
+        ]
+        whole = [i for i in held if LEVELS[i] == "raw" or not (lo % ROLLUPS[LEVELS[i]][1] or hi % ROLLUPS[LEVELS[i]][1])]
+        held = whole or held
+        level = LEVELS[min(held, key=lambda i: (abs(i - wanted), i))] if held else "raw"
+        if plan and plan[-1][0] == level:
+            plan[-1] = (level, plan[-1][1], hi)
+        else:
+            plan.append((level, lo, hi))
+    return plan or [("raw", start_ts, end_ts)]
+
+def downsampled_queries(city: Union[str, List[str]], start, end, bucket_seconds: int, dialect: str,
+                        coverage: Dict[str, int]):
+    # One downsampled_query per segment of plan_levels, all on start's grid;
+    # None if the dialect cannot bucket timestamps
+    start_ts, end_ts = to_timestamp(to_db_datetime(start)), to_timestamp(to_db_datetime(end))
+    stmts = [
+        downsampled_query(city, lo, hi, bucket_seconds, dialect, level=level, origin=start_ts)
+        for level, lo, hi in plan_levels(start_ts, end_ts, bucket_seconds, coverage)
+    ]
+    return None if any(stmt is None for stmt in stmts) else stmts
+
+def finish_downsampled(parts: List[list], by_city: bool = False):
+    """
+    DataFrame of the rows of each downsampled_queries statement. A bucket split
+    between two levels is merged into one, its means weighted by count.
+    """
+    import numpy as np
+    import pandas as pd
+
+    columns = DOWNSAMPLED_FRAME_COLUMNS if by_city else DOWNSAMPLED_COLUMNS
+    frames = [pd.DataFrame(rows, columns=columns) for rows in parts]
+    if len(frames) == 1:
+        return frames[0]
+    keys = ["city", "bucket"] if by_city else ["bucket"]
+    df = pd.concat([frame for frame in frames if not frame.empty] or frames[:1], ignore_index=True)
+    if not df.duplicated(keys).any():
+        return df.sort_values(keys, ignore_index=True)
+    weighted = df.assign(
+        temp=df["temp"] * df["count"],
+        feels_like=df["feels_like"] * df["count"],
+        humidity=df["humidity"] * df["count"],
+        humidity_count=df["count"].where(df["humidity"].notna(), 0),
+    )
+    result = weighted.groupby(keys, sort=True).agg(
+        temp=("temp", "sum"), temp_min=("temp_min", "min"), temp_max=("temp_max", "max"),
+        feels_like=("feels_like", "sum"), humidity=("humidity", "sum"),
+        humidity_count=("humidity_count", "sum"), count=("count", "sum"),
+    )
+    result["temp"] /= result["count"]
+    result["feels_like"] /= result["count"]
+    result["humidity"] /= result["humidity_count"].replace(0, np.nan)
+    return result.reset_index()[columns]
+
+# Load one city's time range reduced to at most max_points time buckets
+def load_downsampled_series(
+    city: str,
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+    max_points: int = 2000,
+):
+    """
+    Splits [start, end) into at most max_points equal time buckets and returns
+    per-bucket averages (plus min/max temperature) instead of raw rows. On SQLite
+    and PostgreSQL the bucketing runs in SQL, so only the buckets leave the
+    database, and buckets of an hour or more are read from the hourly or daily
+    rollup tables where they cover the range (see plan_levels); other backends
+    aggregate the raw range in one vectorized pass.
+
+    :return: DataFrame with columns bucket (unix seconds of the bucket start; buckets
+             are aligned to start),
+             temp, temp_min, temp_max, feels_like, humidity and count, ordered by bucket.
+    """
+    start_ts, end_ts = to_timestamp(to_db_datetime(start)), to_timestamp(to_db_datetime(end))
+    bucket_seconds = bucket_size(start_ts, end_ts, max_points)
+    stmts = downsampled_queries(city, start, end, bucket_seconds, get_engine().dialect.name, get_rollup_coverage())
+    if stmts is None:
+        return downsample_frame(load_weather_frame([city], start, end), start_ts, bucket_seconds)
+    with get_engine().connect() as conn:
+        parts = [conn.execute(stmt).all() for stmt in stmts]
+    return finish_downsampled(parts)
+
+# Load many cities' time ranges, each reduced to at most max_points buckets, with one query per level
+def load_downsampled_frame(
+    cities: List[str],
+    start: Union[int, datetime, date],
+    end: Union[int, datetime, date],
+    max_points: int = 2000,
+):
+    """
+    load_downsampled_series for several cities at once. Every city is bucketed on
+    the same grid, so series line up for comparison.
+
+    :return: DataFrame with columns city plus those of load_downsampled_series,
+             ordered by (city, bucket).
+    """
+    start_ts, end_ts = to_timestamp(to_db_datetime(start)), to_timestamp(to_db_datetime(end))
+    bucket_seconds = bucket_size(start_ts, end_ts, max_points)
+    stmts = downsampled_queries(
+        list(cities), start, end, bucket_seconds, get_engine().dialect.name, get_rollup_coverage()
+    )
+    if stmts is None:
+        return downsample_frame(load_weather_frame(cities, start, end), start_ts, bucket_seconds, by_city=True)
+    with get_engine().connect() as conn:
+        parts = [conn.execute(stmt).all() for stmt in stmts]
+    return finish_downsampled(parts, by_city=True)
+
+# Insert or replace rows (dicts with the model's fields) keyed by the model's primary key,
+# in one transaction
+def upsert_rows(model, rows: List[dict]) -> int:
+    if not rows:
+        return 0
+    table = model.__table__
+    keys = [column.name for column in table.primary_key.columns]
+    db = open_session()
+    try:
+        if get_engine().dialect.name in ("sqlite", "postgresql"):
+            if get_engine().dialect.name == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            stmt = dialect_insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c[name] for name in keys],
+                set_={name: stmt.excluded[name] for name in table.columns.keys() if name not in keys},
+            )
+            db.execute(stmt, rows)
+        else:
+            for row in rows:
+                db.merge(model(**row))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+    return len(rows)
+
+# Insert or replace daily summary rows (dicts with DailySummaryDB fields)
+def upsert_daily_summaries(rows: List[dict]) -> int:
+    return upsert_rows(DailySummaryDB, rows)
+
+# Retrieve daily summary rows, optionally limited to one city (or several) and/or a first day
+def daily_summaries_query(city: Optional[Union[str, List[str]]] = None, since: Optional[date] = None):
+    stmt = select(DailySummaryDB)
+    if city is not None:
+        stmt = stmt.where(city_filter(DailySummaryDB.city, city))
+    if since is not None:
+        stmt = stmt.where(DailySummaryDB.day >= since)
+    return stmt
+
+def get_daily_summaries(city: Optional[Union[str, List[str]]] = None, since: Optional[date] = None) -> List[DailySummaryDB]:
+    db = open_session()
+    try:
+        return db.execute(daily_summaries_query(city, since)).scalars().all()
+    finally:
+        db.close()
+
+# Retrieve rollup rows of one level ("hourly" or "daily") for a city (or several; None for
+# every city), buckets in [start, end)
+def rollups_query(level: str, city: Optional[Union[str, List[str]]], start, end):
+    model = ROLLUPS[level][0]
+    stmt = select(model).where(model.bucket >= to_db_datetime(start), model.bucket < to_db_datetime(end))
+    if city is not None:
+        stmt = stmt.where(city_filter(model.city, city))
+    return stmt.order_by(model.city, model.bucket)
+
+def get_rollups(level: str, city: Optional[Union[str, List[str]]], start, end) -> list:
+    db = open_session()
+    try:
+        return db.execute(rollups_query(level, city, start, end)).scalars().all()
+    finally:
+        db.close()
+
+ROLLUP_FIELDS = [
+    "count", "temp_sum", "temp_min", "temp_max", "feels_like_sum", "feels_like_min", "feels_like_max",
+    "humidity_sum", "humidity_count",
+]
+
+def rollup_queries(level: str, start, end, dialect: str):
+    """
+    The aggregation behind a rollup level, over source rows in [start, end): "hourly"
+    groups raw observations per (city, hour), "daily" groups hourly rollups per
+    (city, UTC day).
+
+    :return: (statistics query with city, bucket (unix seconds) and ROLLUP_FIELDS,
+             conditions query), or None if the dialect cannot bucket timestamps.
+             Condition rows are (city, bucket, condition, count) for "hourly" and
+             (city, bucket, conditions JSON) of every hour for "daily".
+    """
+    width = ROLLUPS[level][1]
+    hourly = level == "hourly"
+    source = WeatherDataDB.__table__ if hourly else HourlyRollupDB.__table__
+    c = source.c
+    time_column = c.dt if hourly else c.bucket
+    epoch = _epoch_seconds(time_column, dialect)
+    if epoch is None:
+        return None
+    bucket = (epoch // width) * width
+    window = (time_column >= to_db_datetime(start), time_column < to_db_datetime(end))
+    if hourly:
+        aggregates = [
+            func.count(), func.sum(c.temp), func.min(c.temp), func.max(c.temp),
+            func.sum(c.feels_like), func.min(c.feels_like), func.max(c.feels_like),
+            func.coalesce(func.sum(c.humidity), 0.0), func.count(c.humidity),
+        ]
+        conditions = (
+            select(c.city, bucket.label("bucket"), c.main.label("condition"), func.count().label("count"))
+            .where(*window)
+            .group_by(c.city, bucket, c.main)
+        )
+    else:
+        aggregates = [
+            func.sum(c.count), func.sum(c.temp_sum), func.min(c.temp_min), func.max(c.temp_max),
+            func.sum(c.feels_like_sum), func.min(c.feels_like_min), func.max(c.feels_like_max),
+            func.sum(c.humidity_sum), func.sum(c.humidity_count),
+        ]
+        conditions = select(c.city, bucket.label("bucket"), c.conditions).where(*window)
+    stats = (
+        select(c.city, bucket.label("bucket"), *(aggregate.label(name) for aggregate, name in zip(aggregates, ROLLUP_FIELDS)))
+        .where(*window)
+        .group_by(c.city, bucket)
+    )
+    return stats, conditions
+
+# Oldest observation time in weather_data as unix seconds (None when empty)
+def oldest_observation() -> Optional[int]:
+    with get_engine().connect() as conn:
+        oldest = conn.execute(select(func.min(WeatherDataDB.dt))).scalar()
+    return to_timestamp(oldest) if oldest is not None else None
+
+# Retrieve observations inserted after the row with id after_id, in insertion order
+def get_weather_after_id(after_id: int, limit: int = 10000) -> List[WeatherDataDB]:
+    db = open_session()
+    try:
+        return (
+            db.query(WeatherDataDB)
+            .filter(WeatherDataDB.id > after_id)
+            .order_by(WeatherDataDB.id)
+            .limit(limit)
+            .all()
+        )
+    finally:
+        db.close()
+
+# Retrieve alerts inserted after the row with id after_id, in insertion order
+def get_alerts_after_id(after_id: int, limit: int = 10000) -> List[AlertDB]:
+    db = open_session()
+    try:
+        return db.query(AlertDB).filter(AlertDB.id > after_id).order_by(AlertDB.id).limit(limit).all()
+    finally:
+        db.close()
+
+# Highest row id of a table (0 when empty), the starting point for get_*_after_id
+def max_id(model) -> int:
+    with get_engine().connect() as conn:
+        return conn.execute(select(func.max(model.id))).scalar() or 0
+
+# Shared state: read one live entry (None if missing or expired)
+def state_get(namespace: str, key: str) -> Optional[str]:
+    table = SharedStateDB.__table__
+    stmt = select(table.c.value).where(
+        table.c.namespace == namespace,
+        table.c.key == key,
+        or_(table.c.expires_at.is_(None), table.c.expires_at > time.time()),
+    )
+    with get_engine().connect() as conn:
+        return conn.execute(stmt).scalar()
+
+# Shared state: every live entry of a namespace as {key: value}
+def state_items(namespace: str) -> Dict[str, str]:
+    table = SharedStateDB.__table__
+    stmt = select(table.c.key, table.c.value).where(
+        table.c.namespace == namespace,
+        or_(table.c.expires_at.is_(None), table.c.expires_at > time.time()),
+    )
+    with get_engine().connect() as conn:
+        return {row.key: row.value for row in conn.execute(stmt)}
+
+# Shared state: the live entries among `keys` of a namespace, with one IN query
+def state_get_many(namespace: str, keys: List[str]) -> Dict[str, str]:
+    if not keys:
+        return {}
+    table = SharedStateDB.__table__
+    stmt = select(table.c.key, table.c.value).where(
+        table.c.namespace == namespace,
+        table.c.key.in_(keys),
+        or_(table.c.expires_at.is_(None), table.c.expires_at > time.time()),
+    )
+    with get_engine().connect() as conn:
+        return {row.key: row.value for row in conn.execute(stmt)}
+
+# Shared state: insert or replace an entry, optionally expiring after ttl seconds
+def state_set(namespace: str, key: str, value: str, ttl: Optional[float] = None):
+    table = SharedStateDB.__table__
+    expires_at = time.time() + ttl if ttl is not None else None
+    replace = (
+        update(table)
+        .where(table.c.namespace == namespace, table.c.key == key)
+        .values(value=value, expires_at=expires_at)
+    )
+    try:
+        with get_engine().begin() as conn:
+            if not conn.execute(replace).rowcount:
+                conn.execute(insert(table).values(namespace=namespace, key=key, value=value, expires_at=expires_at))
+    except IntegrityError:
+        # Another worker inserted the key between our update and insert
+        with get_engine().begin() as conn:
+            conn.execute(replace)
+
+# Shared state: remove an entry
+def state_delete(namespace: str, key: str):
+    table = SharedStateDB.__table__
+    with get_engine().begin() as conn:
+        conn.execute(delete(table).where(table.c.namespace == namespace, table.c.key == key))
+
+# Leader lease: take or renew `name` for owner for ttl seconds. Atomic across processes:
+# the conditional update only matches our own or an expired lease, and the insert
+# only succeeds for the first of several racing workers.
+def lease_acquire(name: str, owner: str, ttl: float) -> bool:
+    table = SharedStateDB.__table__
+    now = time.time()
+    try:
+        with get_engine().begin() as conn:
+            updated = conn.execute(
+                update(table)
+                .where(
+                    table.c.namespace == "lease",
+                    table.c.key == name,
+                    or_(table.c.value == owner, table.c.expires_at <= now),
+                )
+                .values(value=owner, expires_at=now + ttl)
+            ).rowcount
+            if updated:
+                return True
+            exists = conn.execute(
+                select(table.c.key).where(table.c.namespace == "lease", table.c.key == name)
+            ).first()
+            if exists:
+                return False
+            conn.execute(insert(table).values(namespace="lease", key=name, value=owner, expires_at=now + ttl))
+            return True
+    except IntegrityError:
+        return False
+
+# Leader lease: give up `name` if owner holds it
+def lease_release(name: str, owner: str):
+    table = SharedStateDB.__table__
+    with get_engine().begin() as conn:
+        conn.execute(
+            delete(table).where(table.c.namespace == "lease", table.c.key == name, table.c.value == owner)
+        )
+
+if __name__ == "__main__":
+    print(migrate_weather_data_schema())
@@ -0,0 +1,194 @@
+"""
+rollup.py
+
+Retention and compaction of the observation history.
+
+weather_data gains a row per city every poll and would otherwise grow forever.
+The Compactor rolls complete hours of raw rows up into the weather_hourly table
+and complete days into weather_daily (count, sum, min and max of temp and
+feels_like, humidity and condition counts), then deletes raw rows older than
+the raw retention window (exporting them to the archive first, when one is
+configured) and hourly rollups older than the hourly window. Daily rollups are
+kept forever. Raw retention is off unless a window is given. Rollups are computed
+in SQL; on other dialects than SQLite and PostgreSQL compaction is skipped.
+
+Each run continues where the previous one stopped, from the coverage it records
+in the shared_state table (namespace "rollup"), works through a backlog
+chunk_days at a time, and only ever deletes rows that are already rolled up.
+The chart loaders read the same coverage to serve each request from the
+coarsest table its resolution allows (database.plan_levels).
+
+Hours are rolled up `settle` seconds after they end; observations written for an
+hour after that are kept raw but are not added to its rollups.
+
+Run with: python -m data.rollup [--raw-retention-days N] [--hourly-retention-days N]
+"""
+
+import json
+import logging
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete
+
+from data import database
+from data.database import DailyRollupDB, HourlyRollupDB, WeatherDataDB
+
+logger = logging.getLogger(__name__)
+
+HOUR = 3600
+DAY = 86400
+
+
+def floor_to(ts: int, seconds: int) -> int:
+    return ts - ts % seconds
+
+
+def rollup_rows(level: str, start: int, end: int) -> List[dict]:
+    """
+    Rollup rows of one level ("hourly" or "daily") for source rows in [start, end),
+    as dicts with RollupColumns fields, aggregated in SQL.
+    """
+    dialect = database.get_engine().dialect.name
+    queries = database.rollup_queries(level, start, end, dialect)
+    if queries is None:
+        raise ValueError(f"Rollups are computed in SQL, which is not supported for {dialect!r} databases")
+    stats, conditions = queries
+    histograms: Dict[tuple, Counter] = {}
+    with database.get_engine().connect() as conn:
+        rows = {(row.city, row.bucket): dict(row._mapping) for row in conn.execute(stats)}
+        for row in conn.execute(conditions):
+            histogram = histograms.setdefault((row.city, row.bucket), Counter())
+            if level == "hourly":
+                histogram[row.condition] += row.count
+            else:
+                histogram.update(json.loads(row.conditions or "{}"))
+    for key, row in rows.items():
+        row["bucket"] = database.to_db_datetime(row["bucket"])
+        row["conditions"] = json.dumps(dict(histograms.get(key, {})))
+    return list(rows.values())
+
+
+class Compactor:
+    """
+    :param raw_retention_days: Days of raw observations kept (0: keep them forever).
+    :param hourly_retention_days: Days of hourly rollups kept (0: keep them forever).
+    :param archive: Optional data.archive.WeatherArchive that raw days are exported to
+                    before they are deleted.
+    :param settle: Seconds after an hour ends before it is rolled up, so observations
+                   still on their way to the database (write-behind buffer, a slow
+                   poll) are counted.
+    :param chunk_days: Days of backlog rolled up, exported or deleted per transaction.
+    """
+
+    def __init__(
+        self,
+        raw_retention_days: int = 0,
+        hourly_retention_days: int = 365,
+        archive=None,
+        settle: float = 900.0,
+        chunk_days: int = 7,
+    ):
+        self.raw_retention_days = raw_retention_days
+        self.hourly_retention_days = hourly_retention_days
+        self.archive = archive
+        self.settle = settle
+        self.chunk_days = chunk_days
+        self._unsupported_warned = False
+
+    def run(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        One compaction pass: roll up what is due, then apply retention.
+
+        :param now: Current unix time (default: the clock).
+        :return: Rows written ("hourly", "daily"), exported ("archived") and
+                 deleted ("raw_deleted", "hourly_deleted").
+        """
+        now = int(time.time() if now is None else now)
+        stats = dict.fromkeys(("hourly", "daily", "archived", "raw_deleted", "hourly_deleted"), 0)
+        dialect = database.get_engine().dialect.name
+        if not database.supports_rollups(dialect):
+            # Nothing is rolled up, so nothing may be deleted either
+            if not self._unsupported_warned:
+                logger.warning("Skipping compaction: rollups are not supported for %r databases", dialect)
+                self._unsupported_warned = True
+            return stats
+        coverage = database.get_rollup_coverage()
+        self.roll_up(coverage, floor_to(int(now - self.settle), HOUR), stats)
+        self.expire(coverage, now, stats)
+        return stats
+
+    def _record(self, coverage: Dict[str, int], **values: int):
+        # Coverage is only advanced once the rows it describes are written
+        for key, value in values.items():
+            database.state_set(database.ROLLUP_STATE, key, str(value))
+            coverage[key] = value
+
+    def roll_up(self, coverage: Dict[str, int], until: int, stats: Dict[str, int]):
+        # Hours in [hourly_until, until), then every day they complete (from its hourly rows)
+        start = coverage.get("hourly_until")
+        if start is None:
+            oldest = database.oldest_observation()
+            if oldest is None:
+                return
+            start = floor_to(oldest, HOUR)
+            self._record(coverage, hourly_from=start)
+        while start < until:
+            end = min(until, start + self.chunk_days * DAY)
+            stats["hourly"] += database.upsert_rows(HourlyRollupDB, rollup_rows("hourly", start, end))
+            day_start, day_end = floor_to(start, DAY), floor_to(end, DAY)
+            if day_end > day_start:
+                stats["daily"] += database.upsert_rows(DailyRollupDB, rollup_rows("daily", day_start, day_end))
+            self._record(coverage, hourly_until=end, daily_until=max(day_end, coverage.get("daily_until", day_end)))
+            start = end
+
+    def expire(self, coverage: Dict[str, int], now: int, stats: Dict[str, int]):
+        # Deletes whole days, and never past what the daily rollups cover
+        rolled = coverage.get("daily_until")
+        if rolled is None or rolled <= coverage.get("hourly_from", rolled):
+            return
+        if self.raw_retention_days:
+            cutoff = min(floor_to(now - self.raw_retention_days * DAY, DAY), rolled)
+            start = coverage.get("raw_from", floor_to(coverage["hourly_from"], DAY))
+            table = WeatherDataDB.__table__
+            while start < cutoff:
+                end = min(cutoff, start + self.chunk_days * DAY)
+                if self.archive is not None:
+                    stats["archived"] += self.archive.export(start, end)
+                with database.get_engine().begin() as conn:
+                    stats["raw_deleted"] += conn.execute(
+                        delete(table).where(table.c.dt < database.to_db_datetime(end))
+                    ).rowcount
+                self._record(coverage, raw_from=end)
+                start = end
+        if self.hourly_retention_days:
+            cutoff = min(floor_to(now - self.hourly_retention_days * DAY, DAY), rolled)
+            if cutoff > coverage["hourly_from"]:
+                table = HourlyRollupDB.__table__
+                with database.get_engine().begin() as conn:
+                    stats["hourly_deleted"] += conn.execute(
+                        delete(table).where(table.c.bucket < database.to_db_datetime(cutoff))
+                    ).rowcount
+                self._record(coverage, hourly_from=cutoff)
+
+
+if __name__ == "__main__":
+    import argparse
+    from config.settings import Settings
+
+    settings = Settings()
+    parser = argparse.ArgumentParser(description="Roll the weather history up and apply retention")
+    parser.add_argument("--raw-retention-days", type=int, default=settings.RAW_RETENTION_DAYS)
+    parser.add_argument("--hourly-retention-days", type=int, default=settings.HOURLY_RETENTION_DAYS)
+    args = parser.parse_args()
+
+    database.configure(settings.DATABASE_URL)
+    database.init_db()
+    archive = None
+    if settings.ARCHIVE_PATH:
+        from data.archive import WeatherArchive
+        archive = WeatherArchive(settings.ARCHIVE_PATH, format=settings.ARCHIVE_FORMAT)
+    compactor = Compactor(args.raw_retention_days, args.hourly_retention_days, archive=archive,
+                          settle=settings.COMPACTION_SETTLE)
+    print(compactor.run())
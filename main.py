@@ -1,82 +1,378 @@
-from fastapi import FastAPI, BackgroundTasks
+import asyncio
+from datetime import datetime, timedelta, timezone
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Annotated, AsyncIterator, List, Literal, Optional
 from fastapi.middleware.cors import CORSMiddleware
-from apscheduler.schedulers.background import BackgroundScheduler
+from contextlib import asynccontextmanager
+from sqlalchemy.ext.asyncio import AsyncSession
 from config.settings import Settings
-from services.weather_service import WeatherService
-from services.alert_service import AlertService
-from models.weather_data import WeatherData
-from utils.weather_analyzer import WeatherAnalyzer
-from visualization.charts import plot_temperature_over_time
-
-app = FastAPI()
-
-# CORS middleware setup
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-settings = Settings()
-weather_service = WeatherService(settings)
-alert_service = AlertService(settings)
-weather_analyzer = WeatherAnalyzer()
-
-scheduler = BackgroundScheduler()
-scheduler.add_job(weather_service.fetch_weather_data, 'interval', minutes=5)
-scheduler.start()
-
-# @app.on_event("shutdown")
-# async def startup_event():
-#     # Initialize database connection, etc.
-#     pass
-
-# @app.on_event("shutdown")
-# async def shutdown_event():
-#     scheduler.shutdown()
-
-@app.get("/")
+from services.container import ServiceContainer
+from services.resilience import CircuitOpenError
+from services.pubsub import sse_stream
+from models.alert import AlertRule
+from models.batch import BatchRequest
+from utils.responses import EncodedJSON, ORJSONResponse, json_response
+from utils import metrics
+from utils.temperature_converter import Units, convert_columns, convert_record, convert_records
+from visualization.renderer import FORMATS, data_version
+from data import async_database, database
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Settings, engines, services and the polling job are created here rather than at
+    # import time, so importing this module (tests, CLIs, workers) stays cheap
+    settings = app.state.settings or Settings()
+    services = app.state.services = ServiceContainer(settings)
+    await services.start()
+    try:
+        yield
+    finally:
+        await services.stop()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Builds the API. Nothing is connected or started until the app's lifespan runs.
+
+    :param settings: Application settings (default: read from the environment and .env at startup).
+    """
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+    app.state.settings = settings
+    # CORS middleware setup
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # Outermost, so request latency includes the other middleware
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.include_router(router)
+    return app
+
+def get_services(request: Request) -> ServiceContainer:
+    return request.app.state.services
+
+Services = Annotated[ServiceContainer, Depends(get_services)]
+
+async def get_db(services: Services) -> AsyncIterator[AsyncSession]:
+    async for session in services.async_db.session():
+        yield session
+
+def cached_json_response(services: ServiceContainer, request: Request, key, build) -> Response:
+    # Serialise build() once per key and reuse the bytes (and their compressed forms)
+    payload = services.response_cache.get(key)
+    if payload is None:
+        payload = EncodedJSON(build())
+        services.response_cache.set(key, payload)
+    return json_response(request, payload, min_size=services.settings.COMPRESS_MIN_SIZE)
+
+router = APIRouter()
+
+# Temperatures are stored in metric units and converted once per response, on whole series
+UnitsQuery = Annotated[Units, Query(description="metric (°C), imperial (°F) or standard (K)")]
+
+@router.get("/")
 async def root():
     return {"message": "Weather Monitoring System API"}
 
-@app.get("/current-weather/{city}")
-async def get_current_weather(city: str):
-    return await weather_service.get_current_weather(city)
+@router.get("/current-weather/{city}")
+async def get_current_weather(city: str, services: Services, units: UnitsQuery = "metric"):
+    try:
+        return convert_record(await services.weather_service.get_cached_weather(city), units)
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(int(e.retry_after or 0) + 1)},
+        )
+
+@router.get("/cache-stats")
+async def get_cache_stats(services: Services):
+    return services.weather_service.cache.stats()
+
+@router.get("/upstream-stats")
+async def get_upstream_stats(services: Services):
+    return services.weather_service.get_upstream_stats()
+
+@router.get("/stream")
+async def stream(
+    services: Services,
+    cities: Optional[str] = Query(None, description="Comma-separated cities; all if omitted"),
+):
+    # Server-Sent Events: one "observation" event per fetched city and one "alert"
+    # event per alert raised, pushed as each polling cycle completes. The generator subscribes
+    # when the body is first iterated, so a client gone before that leaves nothing behind.
+    topics = [city.strip() for city in cities.split(",") if city.strip()] if cities else None
+    return StreamingResponse(
+        sse_stream(services.pubsub, topics, keepalive=services.settings.STREAM_KEEPALIVE),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/db-stats")
+async def get_db_stats(services: Services):
+    return {"dialect": services.async_db.engine.dialect.name, "pool": services.async_db.pool_status()}
+
+@router.get("/stream-stats")
+async def get_stream_stats(services: Services):
+    return services.pubsub.stats()
+
+@router.get("/scheduler-stats")
+async def get_scheduler_stats(services: Services):
+    return {
+        **services.poller.get_stats(),
+        "state_backend": services.state_backend.name,
+        "leader": services.leader.is_leader,
+        "worker": services.leader.owner,
+    }
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus text exposition format
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+def require_profiler(services: Services):
+    if not services.settings.PROFILER_ENABLED:
+        raise HTTPException(status_code=403, detail="Profiler disabled; set PROFILER_ENABLED=true")
+
+@router.get("/profiler", dependencies=[Depends(require_profiler)])
+async def get_profiler_stats(services: Services):
+    return services.profiler.stats()
 
-@app.get("/daily-summary/{city}")
-async def get_daily_summary(city: str):
-    return weather_analyzer.get_daily_summary(city)
+@router.post("/profiler/start", dependencies=[Depends(require_profiler)])
+async def start_profiler(services: Services, interval: Optional[float] = Query(None, gt=0, le=1)):
+    if not services.profiler.start(interval):
+        raise HTTPException(status_code=409, detail="Profiler already running")
+    return services.profiler.stats()
 
-@app.post("/set-alert-threshold")
-async def set_alert_threshold(threshold: float, city: str):
-    alert_service.set_threshold(threshold, city)
+@router.post("/profiler/stop", response_class=PlainTextResponse, dependencies=[Depends(require_profiler)])
+async def stop_profiler(services: Services):
+    # Folded stacks, e.g. `flamegraph.pl profile.folded > profile.svg` or open in speedscope
+    return PlainTextResponse(await asyncio.to_thread(services.profiler.stop))
+
+@router.get("/history/{city}")
+async def get_history(
+    city: str,
+    request: Request,
+    services: Services,
+    last: int = Query(288, ge=1, le=100000),
+    start: Optional[int] = Query(None, description="Unix time; with end, read [start, end) from the database"),
+    end: Optional[int] = None,
+    units: UnitsQuery = "metric",
+    session: AsyncSession = Depends(get_db),
+):
+    if start is not None or end is not None:
+        # Arbitrary ranges come from the database, without blocking the event loop
+        end = end if end is not None else int(datetime.now(timezone.utc).timestamp())
+        start = start if start is not None else end - 86400
+        rows = await async_database.get_weather_range(session, city, start, end)
+        return json_response(
+            request, convert_records([row.to_model() for row in rows], units),
+            min_size=services.settings.COMPRESS_MIN_SIZE,
+        )
+    # Recent observations from the in-memory store; models are built and encoded
+    # only when the view has changed since the last request
+    view = services.observation_store.last(city, last)
+    key = ("history", city, units, len(view), int(view.dt[-1]) if len(view) else None)
+    return cached_json_response(services, request, key, lambda: view.to_models(units))
+
+@router.get("/daily-summary/{city}")
+async def get_daily_summary(city: str, services: Services, units: UnitsQuery = "metric"):
+    return convert_record(services.weather_analyzer.get_daily_summary(city), units)
+
+@router.get("/summary")
+async def get_summary(
+    request: Request,
+    services: Services,
+    cities: Optional[str] = None,
+    days: int = Query(1, ge=1, le=366),
+    freq: Literal["daily", "hourly"] = "daily",
+    units: UnitsQuery = "metric",
+    session: AsyncSession = Depends(get_db),
+):
+    # Comma-separated cities (default: all configured), summarised in one vectorized pass.
+    # The query runs on the async engine; only the pandas work takes a worker thread.
+    settings, analyzer = services.settings, services.weather_analyzer
+    city_list = [city.strip() for city in cities.split(",") if city.strip()] if cities else settings.get_cities()
+    if services.archive is not None:
+        summary = await asyncio.to_thread(analyzer.get_summary, city_list, days=days, freq=freq, units=units)
+    else:
+        # Days past raw retention are summarised from the rollups of the same frequency
+        start, end = analyzer.summary_window(days)
+        expired, start = analyzer.split_expired(start, end, await async_database.get_rollup_coverage(session))
+        rollups = await async_database.get_rollups(session, freq, city_list, *expired) if expired else []
+        df = await async_database.load_weather_frame(session, city_list, start, end)
+        summary = await asyncio.to_thread(
+            analyzer.summarize, df, city_list, freq=freq, units=units, rollups=rollups
+        )
+    return json_response(request, summary, min_size=settings.COMPRESS_MIN_SIZE)
+
+@router.post("/set-alert-threshold")
+async def set_alert_threshold(threshold: float, city: str, services: Services):
+    services.alert_service.set_threshold(threshold, city)
     return {"message": f"Alert threshold set to {threshold}°C for {city}"}
 
-@app.get("/alerts/{city}")
-async def get_alerts(city: str):
-    return alert_service.get_alerts(city)
+@router.post("/alert-rules")
+async def add_alert_rule(rule: AlertRule, services: Services):
+    return services.alert_service.add_rule(rule)
 
+@router.get("/alert-rules")
+async def get_alert_rules(services: Services, city: Optional[str] = None):
+    return services.alert_service.get_rules(city)
 
-# --- New Endpoint for Chart ---
-@app.get("/chart/temperature/{city}")
-def get_temperature_chart(city: str):
+@router.delete("/alert-rules/{rule_id}")
+async def delete_alert_rule(rule_id: str, services: Services):
+    rule = services.alert_service.remove_rule(rule_id)
+    if rule is None:
+        raise HTTPException(status_code=404, detail=f"No alert rule {rule_id}")
+    return rule
+
+@router.get("/alerts/{city}")
+async def get_alerts(city: str, request: Request, services: Services):
+    alerts = services.alert_service.get_alerts(city)
+    key = ("alerts", city, len(alerts), (alerts[-1].dt, alerts[-1].rule_id) if alerts else None)
+    return cached_json_response(services, request, key, lambda: alerts)
+
+# --- Batch reads: many cities per round-trip, {"results": {city: ...}, "errors": {city: message}} ---
+def batch_cities(services: ServiceContainer, batch: BatchRequest) -> List[str]:
+    cities = list(dict.fromkeys(city.strip() for city in batch.cities if city.strip()))
+    if len(cities) > services.settings.BATCH_MAX_CITIES:
+        raise HTTPException(status_code=422, detail=f"At most {services.settings.BATCH_MAX_CITIES} cities per batch")
+    return cities
+
+def batch_response(services: ServiceContainer, request: Request, results: dict, errors: dict) -> Response:
+    return json_response(request, {"results": results, "errors": errors}, min_size=services.settings.COMPRESS_MIN_SIZE)
+
+@router.post("/batch/current")
+async def get_current_weather_batch(
+    batch: BatchRequest, request: Request, services: Services, units: UnitsQuery = "metric"
+):
+    # One cache pass, one shared-cache multi-get and one concurrent upstream fan-out for the misses;
+    # a city that cannot be fetched is reported in "errors" without failing the others
+    results, errors = await services.weather_service.get_cached_weather_many(batch_cities(services, batch))
+    results = dict(zip(results, convert_records(results.values(), units)))
+    return batch_response(services, request, results, errors)
+
+@router.post("/batch/summary")
+async def get_daily_summary_batch(
+    batch: BatchRequest, request: Request, services: Services, units: UnitsQuery = "metric"
+):
+    # Today's summaries from the running aggregates, the rest with one IN (...) query per source
+    cities = batch_cities(services, batch)
+    summaries = await asyncio.to_thread(services.weather_analyzer.get_daily_summaries, cities)
+    results = {city: convert_record(summary, units) for city, summary in summaries.items() if summary}
+    errors = {city: "No observations today" for city in cities if city not in results}
+    return batch_response(services, request, results, errors)
+
+@router.post("/batch/alerts")
+async def get_alerts_batch(batch: BatchRequest, request: Request, services: Services):
+    # Recent alerts are held in memory per city, so this never touches the database
+    alert_service = services.alert_service
+    results = {city: alert_service.get_alerts(city) for city in batch_cities(services, batch)}
+    return batch_response(services, request, results, {})
+
+
+@router.get("/chart/compare")
+async def get_comparison_chart(
+    request: Request,
+    services: Services,
+    cities: Optional[str] = Query(None, description="Comma-separated cities; all configured if omitted"),
+    metric: Literal["temp", "humidity", "feels_like"] = "temp",
+    days: int = Query(1, ge=1, le=3660),
+    points: int = Query(500, ge=10, le=5000, description="Maximum points per city"),
+    format: Literal["png", "svg", "json"] = "png",
+    units: UnitsQuery = "metric",
+    session: AsyncSession = Depends(get_db),
+):
+    """
+    Compare one metric across cities over the last `days` days, each city downsampled
+    to at most `points` points on a shared time grid, as a PNG or SVG chart or as
+    compact JSON series ({city: {"t": [unix seconds], "v": [values]}}) to draw client-side.
+    Temperatures are in `units`.
     """
-    Generate a PNG image of the temperature-over-time chart for the specified city.
+    settings = services.settings
+    city_list = [city.strip() for city in cities.split(",") if city.strip()] if cities else settings.get_cities()
+    city_list = list(dict.fromkeys(city_list))
+    if len(city_list) > settings.CHART_COMPARE_MAX_CITIES:
+        raise HTTPException(
+            status_code=422, detail=f"At most {settings.CHART_COMPARE_MAX_CITIES} cities per comparison"
+        )
+    end = database.bucket_window_end(days, points)
+    start = end - timedelta(days=days)
+    if services.archive is not None:
+        df = await asyncio.to_thread(services.weather_service.get_comparison_data, city_list, start, end, points)
+    else:
+        frame = await async_database.load_downsampled_frame(session, city_list, start, end, points)
+        df = services.weather_service.to_chart_frame(frame)
+    column = "temperature" if metric == "temp" else metric
+    df = convert_columns(df[["timestamp", "city", column]], units)
+    version = data_version(df)
+    subject = f"{column}[{units}]:{','.join(city_list)}"
+    etag = services.chart_renderer.etag("compare", subject, version, format)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    if format == "json":
+        from visualization.series import comparison_series, series_payload
+
+        def build():
+            series = comparison_series(df, column, city_list)
+            return {"metric": metric, "units": units, "start": int(start.timestamp()),
+                    "end": int(end.timestamp()), "series": series_payload(series)}
+
+        response = cached_json_response(services, request, ("compare", subject, version), build)
+        response.headers.update(headers)
+        return response
+    image, _ = await services.chart_renderer.render(
+        "compare", subject, df, version, fmt=format,
+        options={"metric": column, "cities": city_list, "max_points": points, "units": units},
+    )
+    return Response(content=image, media_type=FORMATS[format], headers=headers)
+
+
+# --- New Endpoint for Chart ---
+@router.get("/chart/{chart}/{city}")
+async def get_chart(
+    chart: Literal["temperature", "humidity"],
+    city: str,
+    request: Request,
+    services: Services,
+    days: int = Query(1, ge=1, le=3660),
+    points: int = Query(2000, ge=10, le=20000),
+    units: UnitsQuery = "metric",
+    session: AsyncSession = Depends(get_db),
+):
     """
-    # 1. Retrieve data for the city. Replace the next line with your actual data-fetching method.
-    df = weather_service.get_city_weather_data(city)  # This method should return a DataFrame
+    Return a PNG chart of the given metric over the last `days` days for the specified city,
+    downsampled to at most `points` points, temperatures in `units`.
 
-    # 2. Generate the chart figure using the modified function (without showing or closing it)
-    fig = plot_temperature_over_time(df, city=city, show=False, return_fig=True)
+    Rendering happens in a worker process and PNGs are cached per data version;
+    clients sending the previous ETag in If-None-Match get a 304 while the data is unchanged.
+    """
+    end = database.bucket_window_end(days, points)
+    if services.archive is not None:
+        df = await asyncio.to_thread(
+            services.weather_service.get_city_weather_data, city, end - timedelta(days=days), end, points
+        )
+    else:
+        series = await async_database.load_downsampled_series(session, city, end - timedelta(days=days), end, points)
+        df = services.weather_service.to_chart_frame(series, city)
+    # Temperature charts are rendered (and cached) per unit; humidity is the same in every unit
+    subject, options = city, {"city": city}
+    if chart == "temperature" and units != "metric":
+        df = convert_columns(df, units)
+        subject, options = f"{city}[{units}]", {"city": city, "units": units}
+    version = data_version(df)
+    etag = services.chart_renderer.etag(chart, subject, version)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
 
-    # 3. Save the figure to an in-memory BytesIO buffer
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-    # Optionally, close the figure to free up memory
-    plt.close(fig)
+    png, _ = await services.chart_renderer.render(chart, subject, df, version, options=options)
+    return Response(content=png, media_type="image/png", headers=headers)
 
-    # 4. Return the image as a StreamingResponse
-    return StreamingResponse(buf, media_type="image/png")    
\ No newline at end of file
+# `uvicorn main:app`; the services start with the app's lifespan
+app = create_app()
@@ -0,0 +1,32 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import Literal, Optional
+from uuid import uuid4
+
+class AlertRule(BaseModel):
+    id: str = Field(default_factory=lambda: uuid4().hex)
+    city: str = "*"  # "*" applies the rule to every city
+    metric: Literal["temp", "feels_like", "condition"] = "temp"
+    operator: Literal[">", "<", "=="] = ">"
+    threshold: Optional[float] = None  # for temp / feels_like rules
+    condition: Optional[str] = None  # for condition rules, e.g. "Rain"
+    consecutive: int = Field(default=1, ge=1)  # observations in a row before the rule fires
+
+    @model_validator(mode="after")
+    def check_operands(self):
+        if self.metric == "condition":
+            if not self.condition or self.operator != "==":
+                raise ValueError("condition rules need a condition and the '==' operator")
+        elif self.threshold is None or self.operator == "==":
+            raise ValueError(f"{self.metric} rules need a threshold and a '>' or '<' operator")
+        return self
+
+class Alert(BaseModel):
+    rule_id: str
+    city: str
+    metric: str
+    operator: str
+    threshold: Optional[float] = None
+    condition: Optional[str] = None
+    value: Optional[float] = None  # the reading that crossed the threshold
+    main: str
+    dt: int
@@ -0,0 +1,5 @@
+from pydantic import BaseModel, Field
+from typing import List
+
+class BatchRequest(BaseModel):
+    cities: List[str] = Field(min_length=1)  # duplicates are answered once
@@ -1,11 +1,13 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Optional
 
 class WeatherData(BaseModel):
     city: str
     main: str
     temp: float
     feels_like: float
+    humidity: Optional[float] = None
     dt: int = Field(default_factory=lambda: int(datetime.now().timestamp()))  # Ensures dt gets a timestamp
 
     @property
@@ -1,34 +1,220 @@
 # services/alert_service.py
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+from data import database
+from models.alert import Alert, AlertRule
+from utils.weather_analyzer import DailyAggregate
+
+NUMERIC_METRICS = ("temp", "feels_like")
+
+
+class RuleIndex:
+    # Alert rules indexed by city and metric. Numeric rules are kept in sorted
+    # threshold arrays per (city, metric, operator), so one reading finds every
+    # crossed rule with a single bisection; condition rules are a dict lookup.
+
+    def __init__(self):
+        self.rules: Dict[str, AlertRule] = {}
+        self._numeric: Dict[Tuple[str, str, str], Tuple[List[float], List[str]]] = {}
+        self._conditions: Dict[Tuple[str, str], List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def add(self, rule: AlertRule):
+        if rule.id in self.rules:
+            self.remove(rule.id)
+        self.rules[rule.id] = rule
+        if rule.metric == "condition":
+            self._conditions.setdefault((rule.city, rule.condition.lower()), []).append(rule.id)
+        else:
+            thresholds, ids = self._numeric.setdefault((rule.city, rule.metric, rule.operator), ([], []))
+            position = bisect_right(thresholds, rule.threshold)
+            thresholds.insert(position, rule.threshold)
+            ids.insert(position, rule.id)
+
+    def remove(self, rule_id: str) -> Optional[AlertRule]:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return None
+        if rule.metric == "condition":
+            self._conditions[(rule.city, rule.condition.lower())].remove(rule_id)
+        else:
+            thresholds, ids = self._numeric[(rule.city, rule.metric, rule.operator)]
+            start = bisect_left(thresholds, rule.threshold)
+            position = ids.index(rule_id, start)
+            del thresholds[position]
+            del ids[position]
+        return rule
+
+    def match(self, weather_data) -> List[str]:
+        # Ids of all rules breached by this observation
+        matched = []
+        for city in (weather_data.city, "*"):
+            for metric in NUMERIC_METRICS:
+                value = getattr(weather_data, metric)
+                above = self._numeric.get((city, metric, ">"))
+                if above:
+                    matched.extend(above[1][:bisect_left(above[0], value)])
+                below = self._numeric.get((city, metric, "<"))
+                if below:
+                    matched.extend(below[1][bisect_right(below[0], value):])
+            matched.extend(self._conditions.get((city, weather_data.main.lower()), ()))
+        return matched
+
 
 class AlertService:
-    def __init__(self, settings):
+    def __init__(self, settings, state=None):
+        # state: optional services.state.StateBackend through which alert rules are
+        # shared with the other worker processes
         self.settings = settings
+        self.state = state
+        self.history_size = getattr(settings, "ALERT_HISTORY_SIZE", 100)
         self.thresholds = {}
-        self.alerts = {}
+        self.rules = RuleIndex()
+        self._rules_token: Optional[str] = None
+        # Per-city ring buffers of raised alerts, newest last
+        self.alerts: Dict[str, deque] = {}
+        self._streaks: Dict[str, Dict[str, int]] = {}
+        self._pending: List[Alert] = []
+        self._lock = threading.Lock()
 
     def set_threshold(self, threshold: float, city: str):
-        # Set the alert threshold for a given city
+        # Set the alert threshold for a given city (a "temp > threshold" rule)
         self.thresholds[city] = threshold
+        self.add_rule(AlertRule(id=f"threshold:{city}", city=city, metric="temp", operator=">", threshold=threshold))
 
-    def check_alert(self, weather_data):
-        # Check the weather data and, if it exceeds the threshold, add an alert.
+    def add_rule(self, rule: AlertRule) -> AlertRule:
+        with self._lock:
+            self.rules.add(rule)
+        if self.state is not None:
+            self.state.set("alert_rules", rule.id, rule.model_dump_json())
+            self.state.touch("alert_rules")
+        return rule
+
+    def remove_rule(self, rule_id: str) -> Optional[AlertRule]:
+        self.sync_rules()
+        with self._lock:
+            rule = self.rules.remove(rule_id)
+            for streaks in self._streaks.values():
+                streaks.pop(rule_id, None)
+            if rule is not None and rule_id.startswith("threshold:"):
+                self.thresholds.pop(rule.city, None)
+        if rule is not None and self.state is not None:
+            self.state.delete("alert_rules", rule_id)
+            self.state.touch("alert_rules")
+        return rule
+
+    def get_rules(self, city: Optional[str] = None) -> List[AlertRule]:
+        self.sync_rules()
+        return [rule for rule in self.rules.rules.values() if city is None or rule.city in (city, "*")]
+
+    def sync_rules(self) -> bool:
+        # Reload the rule index from the shared state if another worker changed it
+        if self.state is None:
+            return False
+        token = self.state.token("alert_rules")
+        if token is None or token == self._rules_token:
+            return False
+        rules = [AlertRule.model_validate_json(value) for value in self.state.items("alert_rules").values()]
+        index = RuleIndex()
+        for rule in rules:
+            index.add(rule)
+        with self._lock:
+            self.rules = index
+            self.thresholds = {
+                rule.city: rule.threshold for rule in rules if rule.id.startswith("threshold:")
+            }
+            for streaks in self._streaks.values():
+                for rule_id in [rule_id for rule_id in streaks if rule_id not in index.rules]:
+                    del streaks[rule_id]
+            self._rules_token = token
+        return True
+
+    def record_alerts(self, alerts: Iterable[Alert]) -> int:
+        # Add alerts raised by another worker to the in-memory history (not persisted again)
+        count = 0
+        with self._lock:
+            for alert in alerts:
+                history = self.alerts.get(alert.city)
+                if history is None:
+                    history = self.alerts[alert.city] = deque(maxlen=self.history_size)
+                history.append(alert)
+                count += 1
+        return count
+
+    def check_alert(self, weather_data) -> List[Alert]:
+        # Evaluate every rule against one observation and record the alerts it raises.
         city = weather_data.city
-        if city in self.thresholds and weather_data.temp > self.thresholds[city]:
-            if city not in self.alerts:
-                self.alerts[city] = []
-            self.alerts[city].append(weather_data)
+        raised = []
+        with self._lock:
+            previous = self._streaks.get(city, {})
+            streaks = {}
+            for rule_id in self.rules.match(weather_data):
+                rule = self.rules.rules[rule_id]
+                if rule.consecutive > 1:
+                    streaks[rule_id] = previous.get(rule_id, 0) + 1
+                    if streaks[rule_id] < rule.consecutive:
+                        continue
+                raised.append(Alert(
+                    rule_id=rule.id, city=city, metric=rule.metric, operator=rule.operator,
+                    threshold=rule.threshold, condition=rule.condition,
+                    value=None if rule.metric == "condition" else getattr(weather_data, rule.metric),
+                    main=weather_data.main, dt=weather_data.dt,
+                ))
+            # Rules not breached this time lose their streak
+            self._streaks[city] = streaks
+            if raised:
+                history = self.alerts.get(city)
+                if history is None:
+                    history = self.alerts[city] = deque(maxlen=self.history_size)
+                history.extend(raised)
+                self._pending.extend(raised)
+        return raised
+
+    def check_alerts(self, weather_data_list: Iterable) -> List[Alert]:
+        # Evaluate a whole polling cycle
+        raised = []
+        for weather_data in weather_data_list:
+            raised.extend(self.check_alert(weather_data))
+        return raised
+
+    def flush(self) -> int:
+        # Persist alerts raised since the last flush in one batch
+        with self._lock:
+            pending, self._pending = self._pending, []
+        try:
+            return database.insert_alerts_bulk(pending)
+        except Exception:
+            with self._lock:
+                self._pending = pending + self._pending
+            raise
+
+    def load_history(self, cities: Optional[List[str]] = None) -> int:
+        # Restore the ring buffers from the persistent alert history
+        loaded = 0
+        for city, rows in database.get_recent_alerts(cities, limit=self.history_size).items():
+            with self._lock:
+                self.alerts[city] = deque((row.to_model() for row in rows), maxlen=self.history_size)
+            loaded += len(rows)
+        return loaded
 
     def get_daily_summary(self, city: str, weather_data_list: list):
-        # Calculate a daily summary (average, min, max temperature) from a list of weather data entries.
-        temps = [data.temp for data in weather_data_list if data.city == city]
-        if temps:
+        # Calculate a daily summary (average, min, max temperature) from a list of weather data entries
+        # in a single pass. Live summaries should come from WeatherAnalyzer's running aggregates instead.
+        aggregate = DailyAggregate.from_observations(
+            city, None, (data for data in weather_data_list if data.city == city)
+        )
+        if aggregate.count:
             return {
-                "avg_temp": sum(temps) / len(temps),
-                "min_temp": min(temps),
-                "max_temp": max(temps)
+                "avg_temp": aggregate.temp_sum / aggregate.count,
+                "min_temp": aggregate.temp_min,
+                "max_temp": aggregate.temp_max
             }
         return {}
 
     def get_alerts(self, city: str):
-        # Return any alerts for the given city
-        return self.alerts.get(city, [])
+        # Return the recent alerts for the given city, oldest first
+        return list(self.alerts.get(city, ()))
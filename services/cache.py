@@ -0,0 +1,195 @@
+"""
+cache.py
+
+In-process TTL + LRU cache with request coalescing (single-flight) for async fetches.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+class TTLCache:
+    """
+    Caches values for `ttl` seconds, evicting the least recently used entry once
+    `maxsize` entries are held.
+
+    get_or_fetch() coalesces concurrent misses: while a fetch for a key is in
+    flight, every other caller for that key awaits the same result instead of
+    starting its own upstream request. The fetch runs in a task of its own, so
+    a caller that is cancelled (e.g. its client disconnected) stops waiting
+    without cancelling the fetch the others are waiting for. get_or_fetch_many()
+    does the same for a batch of keys fetched together, sharing the in-flight
+    map with get_or_fetch().
+
+    :param ttl: Seconds an entry stays fresh.
+    :param maxsize: Maximum number of entries kept.
+    :param clock: Monotonic time source (injectable for tests).
+    """
+
+    def __init__(self, ttl: float = 600.0, maxsize: int = 1024, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._batches: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._lookup(key)
+        return entry[1] if entry is not None else None
+
+    def get_many(self, keys: Iterable[Hashable]) -> Dict[Hashable, Any]:
+        """
+        {key: value} for the keys that are cached and fresh, in one pass; counts a
+        hit per key found and a miss per key not found.
+        """
+        found = {}
+        for key in keys:
+            entry = self._lookup(key)
+            if entry is not None:
+                found[key] = entry[1]
+                self.hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached value for key, or awaits fetch() to produce it.
+        Exceptions from fetch() are raised to every coalesced caller and are not cached.
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            inflight = self._inflight[key] = asyncio.ensure_future(self._fetch(key, fetch))
+            # Mark a failure as retrieved in case every caller has stopped waiting.
+            inflight.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return await asyncio.shield(inflight)
+
+    async def _fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            value = await fetch()
+            self.set(key, value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    async def get_or_fetch_many(
+        self,
+        keys: Iterable[Hashable],
+        fetch: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+    ) -> Tuple[Dict[Hashable, Any], Dict[Hashable, BaseException]]:
+        """
+        get_or_fetch for many keys: cached keys are returned as they are, keys another
+        caller is fetching are awaited, and the rest are fetched with a single
+        fetch(keys) call, registered as in flight until it returns.
+
+        :param fetch: Returns {key: value, or the exception it failed with} for the
+                      keys it is given; keys it leaves out fail with KeyError.
+        :return: ({key: value}, {key: exception}) for the keys that were resolved and
+                 for those that failed. Failures are not cached.
+        """
+        values, waiting, missing = {}, {}, []
+        for key in dict.fromkeys(keys):
+            entry = self._lookup(key)
+            if entry is not None:
+                self.hits += 1
+                values[key] = entry[1]
+            elif key in self._inflight:
+                self.coalesced += 1
+                waiting[key] = self._inflight[key]
+            else:
+                self.misses += 1
+                missing.append(key)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            for key, future in futures.items():
+                self._inflight[key] = future
+                future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            task = asyncio.ensure_future(self._fetch_many(futures, fetch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+            waiting.update(futures)
+
+        errors = {}
+        if waiting:
+            results = await asyncio.shield(asyncio.gather(*waiting.values(), return_exceptions=True))
+            for key, result in zip(waiting, results):
+                if isinstance(result, BaseException):
+                    errors[key] = result
+                else:
+                    values[key] = result
+        return values, errors
+
+    async def _fetch_many(self, futures: Dict[Hashable, asyncio.Future], fetch):
+        try:
+            results = await fetch(list(futures))
+        except asyncio.CancelledError:
+            for future in futures.values():
+                future.cancel()
+            raise
+        except Exception as e:
+            results = dict.fromkeys(futures, e)
+        finally:
+            for key in futures:
+                del self._inflight[key]
+        for key, future in futures.items():
+            result = results.get(key, KeyError(key))
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                self.set(key, result)
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,229 @@
+"""
+container.py
+
+Everything one API process runs: the database engines, the upstream client,
+alert rules, in-memory history, the stream hub, chart rendering and the polling
+scheduler and history compaction, built from one Settings object.
+
+main.create_app builds a ServiceContainer in the app's lifespan, so importing
+the app module opens no connections and starts no threads; start() loads
+persisted state and starts polling, stop() flushes and closes everything.
+"""
+
+import asyncio
+
+from config.settings import Settings
+from data import async_database, database
+from data.database import AlertDB, WeatherDataBuffer, WeatherDataDB
+from data.rollup import Compactor
+from services.alert_service import AlertService
+from services.cache import TTLCache
+from services.pubsub import PubSub
+from services.scheduler import PollingScheduler
+from services.state import LeaderElector, create_state_backend
+from services.weather_service import WeatherService
+from utils import metrics
+from utils.profiler import SamplingProfiler
+from utils.timeseries import ObservationStore
+from utils.weather_analyzer import WeatherAnalyzer
+from visualization.renderer import ChartRenderer
+
+
+class ServiceContainer:
+    """
+    :param settings: Application settings.
+    """
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        # Binds the sync engine the polling job and analytics use; nothing connects yet
+        database.configure(settings.DATABASE_URL)
+        if settings.ARCHIVE_PATH:
+            from data.archive import WeatherArchive
+            self.archive = WeatherArchive(settings.ARCHIVE_PATH, format=settings.ARCHIVE_FORMAT)
+        else:
+            self.archive = None
+        # Alert rules, the weather cache and the polling leader lease are shared by every
+        # worker process unless STATE_BACKEND is "memory" (single worker)
+        self.state_backend = create_state_backend(settings)
+        self.shared_state = self.state_backend.name != "memory"
+        shared = self.state_backend if self.shared_state else None
+        self.leader = LeaderElector(self.state_backend, "poll_weather", ttl=settings.LEADER_LEASE_TTL)
+        self.weather_service = WeatherService(settings, archive=self.archive, shared_cache=shared)
+        self.alert_service = AlertService(settings, state=shared)
+        # Request handlers read through the async engine; the polling job keeps the sync one
+        self.async_db = async_database.AsyncDatabase(
+            settings.DATABASE_URL,
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            statement_cache_size=settings.DB_STATEMENT_CACHE_SIZE,
+        )
+        self.weather_analyzer = WeatherAnalyzer(archive=self.archive)
+        self.chart_renderer = ChartRenderer(
+            workers=settings.CHART_RENDER_WORKERS, cache_size=settings.CHART_CACHE_SIZE
+        )
+        self.ingest_buffer = WeatherDataBuffer(
+            max_size=settings.INGEST_BATCH_SIZE, max_age=settings.INGEST_MAX_AGE
+        )
+        self.observation_store = ObservationStore(capacity=settings.OBSERVATION_HISTORY_SIZE)
+        self.pubsub = PubSub(queue_size=settings.STREAM_QUEUE_SIZE)
+        # Encoded bodies of hot bulk responses, keyed by what they were built from
+        self.response_cache = TTLCache(ttl=settings.CACHE_TTL, maxsize=settings.RESPONSE_CACHE_SIZE)
+        self.profiler = SamplingProfiler(
+            interval=settings.PROFILER_INTERVAL, max_duration=settings.PROFILER_MAX_DURATION
+        )
+        self.poller = PollingScheduler(
+            self.poll_weather, interval=settings.POLL_INTERVAL, jitter=settings.POLL_JITTER, run_immediately=True
+        )
+        self.compactor = Compactor(
+            raw_retention_days=settings.RAW_RETENTION_DAYS,
+            hourly_retention_days=settings.HOURLY_RETENTION_DAYS,
+            archive=self.archive,
+            settle=settings.COMPACTION_SETTLE,
+        )
+        self.compaction = PollingScheduler(
+            self.compact, interval=settings.COMPACTION_INTERVAL, job_id="compact"
+        ) if settings.COMPACTION_INTERVAL > 0 else None
+        self.follower = PollingScheduler(
+            self.sync_from_leader, interval=settings.FOLLOWER_SYNC_INTERVAL, job_id="follow_leader"
+        ) if self.shared_state else None
+        # Position of this worker in the leader's output: the last observation and alert
+        # rows it has seen, and the leader's last cycle token (set by load())
+        self.follow_cursor = {"token": None, "weather_id": 0, "alert_id": 0}
+
+    def load(self):
+        # Blocking startup I/O: schema, persisted rules, alerts and daily aggregates
+        database.init_db()
+        self.alert_service.sync_rules()
+        self.alert_service.load_history()
+        self.weather_analyzer.aggregator.load()
+        self.follow_cursor.update(
+            token=self.state_backend.token("cycle") if self.shared_state else None,
+            weather_id=database.max_id(WeatherDataDB),
+            alert_id=database.max_id(AlertDB),
+        )
+
+    async def start(self):
+        # Polling runs on this event loop for the lifetime of the app; with shared state,
+        # only the leader worker polls and the others follow what it persists
+        await asyncio.to_thread(self.load)
+        metrics.REGISTRY.register_collector("app", self.collect_metrics)
+        if self.settings.POLL_ENABLED:
+            self.poller.start()
+            if self.compaction is not None:
+                self.compaction.start()
+            if self.follower is not None:
+                self.follower.start()
+
+    async def stop(self):
+        # Open /stream responses end first, so they do not hold up the shutdown
+        self.pubsub.close()
+        if self.settings.POLL_ENABLED:
+            self.poller.shutdown()
+            if self.compaction is not None:
+                self.compaction.shutdown()
+            if self.follower is not None:
+                self.follower.shutdown()
+        await self.weather_service.close()
+        await asyncio.to_thread(self.flush)
+        await asyncio.to_thread(self.leader.release)
+        self.profiler.stop()
+        self.chart_renderer.shutdown()
+        await self.async_db.dispose()
+        metrics.REGISTRY.unregister_collector("app")
+
+    def flush(self):
+        self.ingest_buffer.flush()
+        self.weather_analyzer.aggregator.flush()
+        self.alert_service.flush()
+
+    def collect_metrics(self):
+        # Counters kept by the services themselves, read at scrape time
+        yield from metrics.cache_samples({
+            "weather": self.weather_service.cache, "response": self.response_cache,
+            "chart": self.chart_renderer.cache,
+        })
+        upstream = self.weather_service.get_upstream_stats()
+        yield ("upstream_breaker_open", "gauge", "1 while the upstream circuit breaker is open",
+               [({}, 1.0 if upstream["breaker_state"] == "open" else 0.0)])
+        yield ("upstream_retries_total", "counter", "Upstream requests retried", [({}, upstream["retries"])])
+        yield ("upstream_rate_limit_wait_seconds_total", "counter", "Time spent waiting for the rate limiter",
+               [({}, upstream["rate_limit_wait_time"])])
+        stream = self.pubsub.stats()
+        yield ("stream_subscribers", "gauge", "Open /stream connections", [({}, stream["subscribers"])])
+        yield ("stream_dropped_total", "counter", "Stream messages dropped for slow clients",
+               [({}, stream["dropped"])])
+        yield ("ingest_buffer_rows", "gauge", "Observations waiting in the write-behind buffer",
+               [({}, len(self.ingest_buffer))])
+        yield ("poll_leader", "gauge", "1 while this worker runs the polling job",
+               [({}, 1.0 if self.leader.is_leader else 0.0)])
+
+    def persist_cycle(self, observations):
+        # Hand the whole cycle to the write-behind buffer, which writes it in a single
+        # batch when due, then update recent history, daily aggregates and alert rules.
+        self.ingest_buffer.extend(observations)
+        self.observation_store.extend(observations)
+        self.weather_analyzer.aggregator.update_many(observations)
+        self.weather_analyzer.aggregator.flush()
+        self.alert_service.sync_rules()
+        alerts = self.alert_service.check_alerts(observations)
+        self.alert_service.flush()
+        if self.shared_state:
+            # Followers replay the cycle from the database, so it must be written now
+            self.ingest_buffer.flush()
+            self.state_backend.touch("cycle")
+        return alerts
+
+    async def poll_weather(self):
+        # One polling cycle, run only by the leader worker: fetch every city (requests
+        # spread over POLL_STAGGER seconds), push the observations to stream subscribers,
+        # then persist off the event loop and push any alerts raised.
+        if not await asyncio.to_thread(self.leader.try_acquire):
+            return
+        observations = await self.weather_service.fetch_weather_data(stagger=self.settings.POLL_STAGGER)
+        for weather_data in observations:
+            self.pubsub.publish(weather_data.city, "observation", weather_data)
+        alerts = await asyncio.to_thread(self.persist_cycle, observations)
+        for alert in alerts:
+            self.pubsub.publish(alert.city, "alert", alert)
+
+    async def compact(self):
+        # Rollups and retention, run by the polling leader only, after buffered
+        # observations are written
+        if not await asyncio.to_thread(self.leader.try_acquire):
+            return
+        await asyncio.to_thread(self.ingest_buffer.flush)
+        await asyncio.to_thread(self.compactor.run)
+
+    def follow_leader(self, limit: int = 10000):
+        # Load what the leader persisted since the last call, and apply it here unless
+        # this worker is the leader itself (which applied it while polling)
+        cursor = self.follow_cursor
+        token = self.state_backend.token("cycle")
+        if token == cursor["token"]:
+            return [], []
+        rows = database.get_weather_after_id(cursor["weather_id"], limit=limit)
+        alert_rows = database.get_alerts_after_id(cursor["alert_id"], limit=limit)
+        if rows:
+            cursor["weather_id"] = rows[-1].id
+        if alert_rows:
+            cursor["alert_id"] = alert_rows[-1].id
+        if len(rows) < limit and len(alert_rows) < limit:
+            cursor["token"] = token
+        if self.leader.is_leader:
+            return [], []
+        observations = [row.to_model() for row in rows]
+        alerts = [row.to_model() for row in alert_rows]
+        self.observation_store.extend(observations)
+        self.alert_service.record_alerts(alerts)
+        self.weather_analyzer.aggregator.load()
+        return observations, alerts
+
+    async def sync_from_leader(self):
+        observations, alerts = await asyncio.to_thread(self.follow_leader)
+        for weather_data in observations:
+            self.pubsub.publish(weather_data.city, "observation", weather_data)
+        for alert in alerts:
+            self.pubsub.publish(alert.city, "alert", alert)
@@ -0,0 +1,179 @@
+"""
+pubsub.py
+
+In-process publish/subscribe for pushing new observations and alerts to
+streaming clients (see the /stream endpoint).
+
+Every subscriber gets its own bounded queue. Publishing never blocks: when a
+slow subscriber's queue is full, its oldest undelivered message is dropped
+(and counted) so one stalled client cannot hold back the polling job or the
+other subscribers.
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, NamedTuple, Optional, Set
+
+
+class Message(NamedTuple):
+    """
+    A published event, encoded once and shared by every subscriber.
+
+    :param topic: Topic (city name) the event was published on.
+    :param event: Event type, e.g. "observation" or "alert".
+    :param data: JSON-encoded payload.
+    """
+    topic: str
+    event: str
+    data: str
+
+    def sse(self) -> str:
+        return f"event: {self.event}\ndata: {self.data}\n\n"
+
+
+class Subscription:
+    """
+    One subscriber's bounded, drop-oldest message queue.
+
+    :param topics: Topics to receive, or None for every topic.
+    :param maxsize: Messages buffered before the oldest is dropped.
+    """
+
+    def __init__(self, topics: Optional[Set[str]], maxsize: int):
+        self.topics = topics
+        self.queue: "deque[Message]" = deque(maxlen=maxsize)
+        self.dropped = 0
+        self.closed = False
+        self._ready = asyncio.Event()
+
+    def put(self, message: Message) -> bool:
+        # Returns True if the oldest queued message had to be dropped
+        full = len(self.queue) == self.queue.maxlen
+        if full:
+            self.dropped += 1
+        self.queue.append(message)
+        self._ready.set()
+        return full
+
+    async def get(self, timeout: Optional[float] = None) -> Optional[Message]:
+        """
+        Returns the next message, or None if `timeout` seconds pass first or the
+        subscription is closed.
+        """
+        while not self.queue and not self.closed:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return self.queue.popleft() if self.queue else None
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+
+class PubSub:
+    """
+    Topic-based fan-out to subscribers on the running event loop. publish() and
+    subscribe() must be called from the event loop thread.
+
+    :param queue_size: Per-subscriber queue length.
+    """
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._by_topic: Dict[str, Set[Subscription]] = {}
+        self._all: Set[Subscription] = set()
+        self._subscriptions: Set[Subscription] = set()
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None) -> Subscription:
+        # After close() the subscription comes back already closed
+        subscription = Subscription(set(topics) if topics is not None else None, self.queue_size)
+        if self.closed:
+            subscription.close()
+            return subscription
+        self._subscriptions.add(subscription)
+        if subscription.topics is None:
+            self._all.add(subscription)
+        for topic in subscription.topics or ():
+            self._by_topic.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscription.close()
+        self._subscriptions.discard(subscription)
+        self._all.discard(subscription)
+        for topic in subscription.topics or ():
+            subs = self._by_topic.get(topic)
+            if subs is not None:
+                subs.discard(subscription)
+                if not subs:
+                    del self._by_topic[topic]
+
+    def close(self):
+        """
+        Ends every subscription (on shutdown): waiting subscribers wake up and
+        their streams finish, and later subscriptions start out closed.
+        """
+        self.closed = True
+        for subscription in list(self._subscriptions):
+            self.unsubscribe(subscription)
+
+    def publish(self, topic: str, event: str, payload) -> int:
+        """
+        Publishes a JSON-serialisable payload (or pydantic model) to subscribers
+        of `topic` and to wildcard subscribers.
+
+        :return: Number of subscribers the message was queued for.
+        """
+        if hasattr(payload, "model_dump"):
+            payload = payload.model_dump(mode="json")
+        message = Message(topic, event, json.dumps(payload, separators=(",", ":")))
+        self.published += 1
+        count = 0
+        for subs in (self._by_topic.get(topic, ()), self._all):
+            for subscription in subs:
+                self.dropped += subscription.put(message)
+                count += 1
+        self.delivered += count
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "subscribers": len(self._subscriptions),
+            "topics": len(self._by_topic),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+
+async def sse_stream(
+    pubsub: PubSub, topics: Optional[Iterable[str]] = None, keepalive: float = 15.0
+) -> AsyncIterator[str]:
+    """
+    Subscribes to `topics` and yields the subscription as Server-Sent Events, with
+    a comment line every `keepalive` idle seconds so proxies keep the connection
+    open. The subscription only exists while the stream is iterated: it is made on
+    the first chunk and dropped when the client goes away or the PubSub is closed.
+    """
+    subscription = pubsub.subscribe(topics)
+    try:
+        yield ": connected\n\n"
+        while not subscription.closed:
+            message = await subscription.get(timeout=keepalive)
+            if message is not None:
+                yield message.sse()
+            elif not subscription.closed:
+                yield ": keepalive\n\n"
+    finally:
+        pubsub.unsubscribe(subscription)
@@ -0,0 +1,194 @@
+"""
+resilience.py
+
+Building blocks that keep a slow or failing upstream from stalling the service:
+a token-bucket rate limiter, jittered exponential backoff and a circuit breaker.
+"""
+
+import asyncio
+import random
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+class UpstreamError(Exception):
+    """
+    A failed upstream call.
+
+    :param message: Human-readable description.
+    :param status: HTTP status, or None for timeouts and connection errors.
+    :param retry_after: Seconds the upstream asked us to wait (Retry-After), if any.
+    """
+
+    def __init__(self, message: str, status: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        # Timeouts/connection errors, throttling and server errors are transient;
+        # other 4xx (unknown city, bad API key) will fail the same way again.
+        return self.status is None or self.status == 429 or self.status >= 500
+
+
+class CircuitOpenError(UpstreamError):
+    """
+    Raised instead of calling the upstream while the circuit breaker is open.
+    """
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    # Only the delay-seconds form is supported; HTTP-dates are ignored.
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float, maximum: float, rng: Callable[[], float] = random.random) -> float:
+    """
+    "Full jitter" exponential backoff: a random delay between 0 and
+    min(maximum, base * 2 ** attempt), so clients that failed together do not
+    retry together.
+
+    :param attempt: Zero-based retry number.
+    """
+    return rng() * min(maximum, base * (2 ** attempt))
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter for async callers.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. acquire()
+    takes one token, sleeping until it is available; callers are served in the
+    order they ask, because each one reserves its token (the balance may go
+    negative) before sleeping.
+
+    :param rate: Tokens added per second; 0 or less disables limiting.
+    :param capacity: Maximum burst size.
+    :param clock: Monotonic time source (injectable for tests).
+    """
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.clock = clock
+        self.tokens = self.capacity
+        self._updated = clock()
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def reserve(self) -> float:
+        """
+        Takes a token and returns how many seconds the caller must wait before using it.
+        """
+        if self.rate <= 0:
+            return 0.0
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    async def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            self.waits += 1
+            self.wait_time += wait
+            await asyncio.sleep(wait)
+        return wait
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after `failure_threshold` consecutive failures.
+
+    closed: calls go through. open: calls are refused for `reset_timeout`
+    seconds. half_open: one trial call is let through; success closes the
+    circuit, failure opens it again. Every allowed call must end in
+    record_success, record_failure or release.
+
+    :param failure_threshold: Consecutive failures that open the circuit.
+    :param reset_timeout: Seconds to stay open before allowing a trial call.
+    :param clock: Monotonic time source (injectable for tests).
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.opens = 0
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def retry_in(self) -> float:
+        if self._state != self.OPEN:
+            return 0.0
+        return max(0.0, self.reset_timeout - (self.clock() - self.opened_at))
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release(self):
+        # Ends a call without an outcome (e.g. cancelled): a half-open circuit lets the next trial through
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self._state = self.CLOSED
+        self.failures = 0
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                self.opens += 1
+            self._state = self.OPEN
+            self.opened_at = self.clock()
+            self._trial_in_flight = False
+
+
+@dataclass
+class UpstreamStats:
+    """
+    Counters for calls to the upstream API.
+
+    :param requests: HTTP requests sent (including retries).
+    :param retries: Requests that were retries of a failed attempt.
+    :param throttled: 429 responses received.
+    :param timeouts: Requests that timed out or could not connect.
+    :param failures: Calls that failed after exhausting their retries.
+    :param rejected: Calls refused because the circuit was open.
+    :param stale_served: Responses served from the last known observation while open.
+    """
+    requests: int = 0
+    retries: int = 0
+    throttled: int = 0
+    timeouts: int = 0
+    failures: int = 0
+    rejected: int = 0
+    stale_served: int = 0
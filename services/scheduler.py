@@ -0,0 +1,149 @@
+"""
+scheduler.py
+
+Runs the weather polling job on the application's asyncio event loop.
+"""
+
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_SUBMITTED
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+CYCLE_SECONDS = metrics.histogram("poll_cycle_seconds", "Wall time of a scheduled cycle", ["job"])
+CYCLE_LAG_SECONDS = metrics.histogram(
+    "poll_lag_seconds", "Delay between the scheduled and actual start of a cycle", ["job"]
+)
+CYCLES = metrics.counter("poll_cycles_total", "Scheduled cycles by outcome (ok, failed, skipped)", ["job", "outcome"])
+
+
+@dataclass
+class PollingStats:
+    """
+    :param cycles: Completed cycles (successful or not).
+    :param failures: Cycles that raised.
+    :param skipped: Ticks dropped because the previous cycle was still running.
+    :param running: Whether a cycle is in progress right now.
+    :param last_duration: Wall time of the last cycle in seconds.
+    :param max_duration: Longest cycle seen, in seconds.
+    :param last_lag: Delay between the scheduled and actual start of the last cycle.
+    :param max_lag: Largest start delay seen, in seconds.
+    :param last_started_at: Unix timestamp of the last cycle start.
+    :param last_error: Message of the last failure, if any.
+    """
+    cycles: int = 0
+    failures: int = 0
+    skipped: int = 0
+    running: bool = False
+    last_duration: float = 0.0
+    max_duration: float = 0.0
+    last_lag: float = 0.0
+    max_lag: float = 0.0
+    last_started_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+
+class PollingScheduler:
+    """
+    Schedules an async job every `interval` seconds with an AsyncIOScheduler, so the
+    coroutine is awaited on the running event loop rather than in a worker thread.
+
+    A tick is started up to `jitter` seconds late so that several deployments do
+    not all hit the upstream at the same instant. At most one cycle runs at a
+    time: if a cycle overruns, the ticks it overlaps are skipped (and counted)
+    instead of piling up.
+
+    :param job: Coroutine function run on every tick.
+    :param interval: Seconds between ticks.
+    :param jitter: Maximum random delay added to each tick, in seconds.
+    :param run_immediately: Run the first cycle right away instead of after one interval.
+    :param job_id: Scheduler job id.
+    """
+
+    def __init__(
+        self,
+        job: Callable[[], Awaitable[Any]],
+        interval: float,
+        jitter: float = 0.0,
+        run_immediately: bool = False,
+        job_id: str = "poll_weather",
+    ):
+        self.job = job
+        self.interval = interval
+        self.jitter = jitter
+        self.run_immediately = run_immediately
+        self.job_id = job_id
+        self.stats = PollingStats()
+        self._scheduler: Optional[AsyncIOScheduler] = None
+
+    @property
+    def running(self) -> bool:
+        return self._scheduler is not None and self._scheduler.running
+
+    def start(self):
+        """
+        Starts ticking. Must be called from inside the running event loop
+        (e.g. a FastAPI lifespan handler).
+        """
+        if self.running:
+            return
+        self._scheduler = AsyncIOScheduler()
+        self._scheduler.add_listener(self._on_submitted, EVENT_JOB_SUBMITTED)
+        self._scheduler.add_listener(self._on_max_instances, EVENT_JOB_MAX_INSTANCES)
+        self._scheduler.add_job(
+            self._run_cycle,
+            "interval",
+            seconds=self.interval,
+            jitter=self.jitter or None,
+            max_instances=1,
+            coalesce=True,
+            misfire_grace_time=max(1, int(self.interval)),
+            next_run_time=datetime.now(timezone.utc) if self.run_immediately else None,
+            id=self.job_id,
+        )
+        self._scheduler.start()
+
+    def shutdown(self):
+        if self.running:
+            self._scheduler.shutdown(wait=False)
+        self._scheduler = None
+
+    def _on_submitted(self, event):
+        lag = (datetime.now(timezone.utc) - event.scheduled_run_times[-1]).total_seconds()
+        self.stats.last_lag = max(0.0, lag)
+        self.stats.max_lag = max(self.stats.max_lag, self.stats.last_lag)
+        CYCLE_LAG_SECONDS.observe(self.stats.last_lag, job=self.job_id)
+
+    def _on_max_instances(self, event):
+        self.stats.skipped += 1
+        CYCLES.inc(job=self.job_id, outcome="skipped")
+
+    async def _run_cycle(self):
+        self.stats.running = True
+        self.stats.last_started_at = time.time()
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            await self.job()
+        except Exception as e:
+            outcome = "failed"
+            self.stats.failures += 1
+            self.stats.last_error = str(e)
+            logger.exception("Scheduled %s cycle failed", self.job_id)
+        finally:
+            self.stats.running = False
+            self.stats.cycles += 1
+            self.stats.last_duration = time.perf_counter() - start
+            self.stats.max_duration = max(self.stats.max_duration, self.stats.last_duration)
+            CYCLE_SECONDS.observe(self.stats.last_duration, job=self.job_id)
+            CYCLES.inc(job=self.job_id, outcome=outcome)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return asdict(self.stats)
@@ -0,0 +1,301 @@
+"""
+state.py
+
+State shared by every worker process of a multi-worker deployment
+(`uvicorn main:app --workers N`): alert rules, the current-weather cache,
+change tokens and the leader lease that makes exactly one worker run the
+polling job.
+
+Backends, selected with settings.STATE_BACKEND:
+
+- "memory": per-process dicts; the default, correct for a single worker.
+- "sql": the shared_state table in the application database.
+- "redis": a Redis-compatible server at settings.REDIS_URL (requires `redis`).
+
+Values are strings (callers store JSON). Entries may expire after a TTL.
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """
+    Interface of a shared-state backend. Every method is synchronous and may do
+    I/O; call it through asyncio.to_thread from the event loop when that matters.
+    """
+
+    name = "base"
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def items(self, namespace: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def get_many(self, namespace: str, keys: List[str]) -> Dict[str, str]:
+        # {key: value} for the live keys among `keys`; backends override it with one round-trip
+        values = {key: self.get(namespace, key) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        Takes or renews the lease `name` for owner for ttl seconds. Returns
+        False if another owner holds an unexpired lease.
+        """
+        raise NotImplementedError
+
+    def release_lease(self, name: str, owner: str):
+        raise NotImplementedError
+
+    def touch(self, name: str) -> str:
+        # Publishes a new change token for `name` so other workers know to reload
+        token = uuid.uuid4().hex
+        self.set("version", name, token)
+        return token
+
+    def token(self, name: str) -> Optional[str]:
+        return self.get("version", name)
+
+
+class MemoryStateBackend(StateBackend):
+    """
+    Per-process state. Only shared between workers that are threads of one process.
+
+    :param clock: Wall-clock time source (injectable for tests).
+    """
+
+    name = "memory"
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._entries: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, entry) -> bool:
+        return entry is not None and (entry[1] is None or entry[1] > self.clock())
+
+    def get(self, namespace, key):
+        with self._lock:
+            entry = self._entries.get(namespace, {}).get(key)
+            return entry[0] if self._live(entry) else None
+
+    def set(self, namespace, key, value, ttl=None):
+        with self._lock:
+            expires_at = self.clock() + ttl if ttl is not None else None
+            self._entries.setdefault(namespace, {})[key] = (value, expires_at)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._entries.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace):
+        with self._lock:
+            return {
+                key: entry[0] for key, entry in self._entries.get(namespace, {}).items() if self._live(entry)
+            }
+
+    def get_many(self, namespace, keys):
+        with self._lock:
+            entries = self._entries.get(namespace, {})
+            return {key: entries[key][0] for key in keys if self._live(entries.get(key))}
+
+    def acquire_lease(self, name, owner, ttl):
+        with self._lock:
+            leases = self._entries.setdefault("lease", {})
+            entry = leases.get(name)
+            if self._live(entry) and entry[0] != owner:
+                return False
+            leases[name] = (owner, self.clock() + ttl)
+            return True
+
+    def release_lease(self, name, owner):
+        with self._lock:
+            leases = self._entries.get("lease", {})
+            if leases.get(name, (None,))[0] == owner:
+                del leases[name]
+
+
+class SQLStateBackend(StateBackend):
+    """
+    State in the shared_state table of the application database (see data.database).
+    """
+
+    name = "sql"
+
+    def __init__(self):
+        from data import database
+        self.db = database
+
+    def get(self, namespace, key):
+        return self.db.state_get(namespace, key)
+
+    def set(self, namespace, key, value, ttl=None):
+        self.db.state_set(namespace, key, value, ttl)
+
+    def delete(self, namespace, key):
+        self.db.state_delete(namespace, key)
+
+    def items(self, namespace):
+        return self.db.state_items(namespace)
+
+    def get_many(self, namespace, keys):
+        return self.db.state_get_many(namespace, keys)
+
+    def acquire_lease(self, name, owner, ttl):
+        return self.db.lease_acquire(name, owner, ttl)
+
+    def release_lease(self, name, owner):
+        self.db.lease_release(name, owner)
+
+
+class RedisStateBackend(StateBackend):
+    """
+    State in a Redis-compatible server. Each entry is a string key
+    "<prefix>:<namespace>:<key>" (expiring natively); a set per namespace
+    indexes its keys for items().
+
+    :param url: Server URL, e.g. redis://localhost:6379/0.
+    :param prefix: Key prefix, so several deployments can share one server.
+    :param client: Ready-made client (e.g. for tests); overrides url.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = "redis://localhost:6379/0", prefix: str = "weather", client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("STATE_BACKEND=redis requires the redis package: pip install redis")
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, namespace, key):
+        return f"{self.prefix}:{namespace}:{key}"
+
+    def _index(self, namespace):
+        return f"{self.prefix}:{namespace}"
+
+    def get(self, namespace, key):
+        return self.client.get(self._key(namespace, key))
+
+    def set(self, namespace, key, value, ttl=None):
+        pipe = self.client.pipeline()
+        pipe.set(self._key(namespace, key), value, px=int(ttl * 1000) if ttl is not None else None)
+        pipe.sadd(self._index(namespace), key)
+        pipe.execute()
+
+    def delete(self, namespace, key):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(namespace, key))
+        pipe.srem(self._index(namespace), key)
+        pipe.execute()
+
+    def items(self, namespace):
+        keys = sorted(self.client.smembers(self._index(namespace)))
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(namespace, key) for key in keys])
+        expired = [key for key, value in zip(keys, values) if value is None]
+        if expired:
+            self.client.srem(self._index(namespace), *expired)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def get_many(self, namespace, keys):
+        if not keys:
+            return {}
+        values = self.client.mget([self._key(namespace, key) for key in keys])
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def acquire_lease(self, name, owner, ttl):
+        key = self._key("lease", name)
+        if self.client.set(key, owner, nx=True, px=int(ttl * 1000)):
+            return True
+        return self._if_owner(key, owner, lambda pipe: pipe.pexpire(key, int(ttl * 1000)))
+
+    def release_lease(self, name, owner):
+        key = self._key("lease", name)
+        self._if_owner(key, owner, lambda pipe: pipe.delete(key))
+
+    def _if_owner(self, key, owner, command) -> bool:
+        # Runs command on the lease key only while owner holds it (WATCH/MULTI, so the
+        # lease cannot change hands in between)
+        import redis
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.get(key) != owner:
+                    return False
+                pipe.multi()
+                command(pipe)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+
+def create_state_backend(settings) -> StateBackend:
+    backend = getattr(settings, "STATE_BACKEND", "memory")
+    if backend == "memory":
+        return MemoryStateBackend()
+    if backend == "sql":
+        return SQLStateBackend()
+    if backend == "redis":
+        return RedisStateBackend(getattr(settings, "REDIS_URL", "redis://localhost:6379/0"))
+    raise ValueError(f"Unknown STATE_BACKEND {backend!r}; expected memory, sql or redis")
+
+
+class LeaderElector:
+    """
+    Lease-based leader election: the worker holding the lease `name` is the
+    leader. try_acquire() takes a free or expired lease, or renews our own, so
+    calling it at least once per `ttl` seconds keeps leadership; if the leader
+    dies, another worker takes over once the lease expires (or at once, if it
+    released the lease on shutdown).
+
+    :param backend: Shared-state backend holding the lease.
+    :param name: Lease name.
+    :param ttl: Lease lifetime in seconds.
+    :param owner: Unique id of this worker (default: hostname, pid and a random suffix).
+    """
+
+    def __init__(self, backend: StateBackend, name: str = "poll_weather", ttl: float = 900.0, owner: Optional[str] = None):
+        self.backend = backend
+        self.name = name
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.transitions = 0
+
+    def try_acquire(self) -> bool:
+        try:
+            leader = self.backend.acquire_lease(self.name, self.owner, self.ttl)
+        except Exception as e:
+            # Cannot reach the backend: step down rather than risk two leaders
+            logger.warning("Leader election failed: %s", e)
+            leader = False
+        if leader != self.is_leader:
+            self.transitions += 1
+            logger.info("Worker %s %s the %s leader", self.owner, "became" if leader else "is no longer", self.name)
+        self.is_leader = leader
+        return leader
+
+    def release(self):
+        if self.is_leader:
+            self.backend.release_lease(self.name, self.owner)
+            self.is_leader = False
@@ -1,10 +1,56 @@
+import asyncio
+import logging
+import time
 import aiohttp
-import pandas as pd
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
 from models.weather_data import WeatherData
-from datetime import datetime
+from services.cache import TTLCache
+from utils import metrics
+from services.resilience import (
+    CircuitBreaker, CircuitOpenError, TokenBucket, UpstreamError, UpstreamStats,
+    backoff_delay, parse_retry_after,
+)
+from datetime import datetime, timedelta, timezone
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_SECONDS = metrics.histogram(
+    "upstream_request_seconds", "OpenWeatherMap request latency per attempt", ["city"]
+)
+UPSTREAM_RESPONSES = metrics.counter(
+    "upstream_responses_total", "OpenWeatherMap attempts by outcome (HTTP status, timeout or rejected)",
+    ["city", "status"],
+)
+
+
+@dataclass
+class FetchCycleStats:
+    """
+    Timing report for a single polling cycle.
+
+    :param started_at: Unix timestamp at which the cycle started.
+    :param wall_time: Total wall-clock duration of the cycle in seconds.
+    :param latencies: Per-city request latency in seconds.
+    :param errors: Per-city error message for cities that failed.
+    :param requests: Number of upstream HTTP requests made during the cycle.
+    """
+    started_at: float
+    wall_time: float = 0.0
+    latencies: Dict[str, float] = field(default_factory=dict)
+    errors: Dict[str, str] = field(default_factory=dict)
+    requests: int = 0
+
+    @property
+    def succeeded(self) -> int:
+        return len(self.latencies) - len(self.errors)
+
 
 class WeatherService:
-    def __init__(self, settings):
+    def __init__(self, settings, archive=None, shared_cache=None):
         """
         Initializes the WeatherService with the given settings.
 
@@ -12,10 +58,157 @@ class WeatherService:
                          - OPENWEATHERMAP_API_KEY: Your API key for OpenWeatherMap.
                          - get_city_coords(city): A method to fetch coordinates for a city.
                          - get_cities(): A method to return a list of cities to fetch weather data for.
+        :param archive: Optional data.archive.WeatherArchive that stored history is read
+                        from for the days it covers.
+        :param shared_cache: Optional services.state.StateBackend holding a second-level
+                             current-weather cache shared by every worker process.
         """
         self.settings = settings
+        self.archive = archive
+        self.shared_cache = shared_cache
         self.api_key = settings.OPENWEATHERMAP_API_KEY
-        self.base_url = "http://api.openweathermap.org/data/2.5/weather"
+        api_root = getattr(settings, "OPENWEATHERMAP_BASE_URL", "http://api.openweathermap.org/data/2.5")
+        self.base_url = f"{api_root}/weather"
+        self.group_url = f"{api_root}/group"
+        self.group_size = getattr(settings, "FETCH_GROUP_SIZE", 20)
+        self.concurrency = getattr(settings, "FETCH_CONCURRENCY", 20)
+        self.limit_per_host = getattr(settings, "FETCH_LIMIT_PER_HOST", 20)
+        self.timeout = getattr(settings, "FETCH_TIMEOUT", 10.0)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.last_cycle: Optional[FetchCycleStats] = None
+        self.cache = TTLCache(
+            ttl=getattr(settings, "CACHE_TTL", 600.0),
+            maxsize=getattr(settings, "CACHE_MAX_ENTRIES", 1024),
+        )
+        self.prewarm_cache = getattr(settings, "CACHE_PREWARM", True)
+        # Resilience: quota-matched rate limit, retries and a circuit breaker
+        self.rate_limiter = TokenBucket(
+            rate=getattr(settings, "UPSTREAM_RATE_LIMIT", 60.0) / 60.0,
+            capacity=getattr(settings, "UPSTREAM_BURST", 60),
+        )
+        self.max_retries = getattr(settings, "UPSTREAM_MAX_RETRIES", 3)
+        self.backoff_base = getattr(settings, "UPSTREAM_BACKOFF_BASE", 0.5)
+        self.backoff_max = getattr(settings, "UPSTREAM_BACKOFF_MAX", 30.0)
+        self.breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, "BREAKER_FAILURE_THRESHOLD", 5),
+            reset_timeout=getattr(settings, "BREAKER_RESET_TIMEOUT", 30.0),
+        )
+        self.upstream_stats = UpstreamStats()
+        # Last good observation per cache key, served while the circuit is open
+        self._last_known: Dict[object, WeatherData] = {}
+
+    async def get_session(self) -> aiohttp.ClientSession:
+        """
+        Returns the shared, connection-pooled HTTP session for this service,
+        creating it on first use (or after it has been closed).
+
+        Reusing one session keeps TCP connections and DNS lookups alive between
+        requests instead of paying a fresh handshake for every city.
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=max(self.concurrency, self.limit_per_host),
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        """
+        Closes the shared HTTP session. Safe to call more than once.
+        """
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _request(self, url: str, params: dict, what: str, city: str = "group") -> dict:
+        """
+        GETs an upstream URL and returns the decoded JSON body.
+
+        Each attempt waits for a rate-limiter token and is bounded by
+        settings.FETCH_TIMEOUT. Timeouts, connection errors, 429 and 5xx
+        responses are retried up to settings.UPSTREAM_MAX_RETRIES times with
+        jittered exponential backoff, honouring Retry-After. Calls are refused
+        with CircuitOpenError while the circuit breaker is open.
+
+        :param what: Description of the call used in error messages.
+        :param city: City label of the latency and status metrics ("group" for group calls).
+        :raises UpstreamError: If the call fails for good.
+        :raises CircuitOpenError: If the circuit is open.
+        """
+        stats = self.upstream_stats
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                stats.rejected += 1
+                UPSTREAM_RESPONSES.inc(city=city, status="rejected")
+                raise CircuitOpenError(
+                    f"Upstream circuit open; not fetching {what}",
+                    retry_after=self.breaker.retry_in(),
+                )
+            await self.rate_limiter.acquire()
+            stats.requests += 1
+            if attempt:
+                stats.retries += 1
+            start = time.perf_counter()
+            try:
+                session = await self.get_session()
+                async with session.get(
+                    url, params=params, timeout=aiohttp.ClientTimeout(total=self.timeout)
+                ) as response:
+                    UPSTREAM_RESPONSES.inc(city=city, status=str(response.status))
+                    if response.status == 200:
+                        data = await response.json()
+                        UPSTREAM_SECONDS.observe(time.perf_counter() - start, city=city)
+                        self.breaker.record_success()
+                        return data
+                    error_text = await response.text()
+                    error = UpstreamError(
+                        f"Failed to fetch {what}. "
+                        f"Status: {response.status}. Response: {error_text}",
+                        status=response.status,
+                        retry_after=parse_retry_after(response.headers.get("Retry-After")),
+                    )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats.timeouts += 1
+                UPSTREAM_RESPONSES.inc(city=city, status="timeout")
+                error = UpstreamError(f"Failed to fetch {what}: {e!r}")
+            except ValueError as e:
+                # A 200 whose body is not JSON: the upstream is misbehaving
+                error = UpstreamError(f"Malformed response for {what}: {e!r}")
+            except BaseException:
+                # Cancelled (e.g. the client went away) or an unexpected error: no verdict on
+                # the upstream, but a half-open circuit must not keep its trial slot
+                self.breaker.release()
+                raise
+            UPSTREAM_SECONDS.observe(time.perf_counter() - start, city=city)
+
+            if error.status == 429:
+                stats.throttled += 1
+            if not error.retryable:
+                # The upstream answered; it is healthy even if the request was bad.
+                self.breaker.record_success()
+                raise error
+            self.breaker.record_failure()
+            delay = backoff_delay(attempt, self.backoff_base, self.backoff_max)
+            if error.retry_after is not None:
+                delay = max(delay, error.retry_after)
+            if attempt == self.max_retries or delay > self.backoff_max:
+                stats.failures += 1
+                raise error
+            await asyncio.sleep(delay)
+
+    def get_upstream_stats(self) -> dict:
+        return {
+            **asdict(self.upstream_stats),
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+            "rate_limit_waits": self.rate_limiter.waits,
+            "rate_limit_wait_time": self.rate_limiter.wait_time,
+        }
 
     async def get_current_weather(self, city: str) -> WeatherData:
         """
@@ -26,7 +219,7 @@ class WeatherService:
 
         :param city: Name of the city.
         :return: WeatherData instance containing the fetched weather details.
-        :raises Exception: If the API call fails.
+        :raises UpstreamError: If the API call fails (CircuitOpenError while the circuit is open).
         """
         # Determine query parameters based on available coordinates
         coords = self.settings.get_city_coords(city)
@@ -45,58 +238,309 @@ class WeatherService:
             }
         
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(self.base_url, params=params) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        return WeatherData(
-                            city=city,
-                            temp=data['main']['temp'],
-                            feels_like=data['main']['feels_like'],
-                            main=data['weather'][0]['main'],
-                            dt=int(data['dt'])  # Keep timestamp as an integer
-                        )
-                    else:
-                        error_text = await response.text()
-                        raise Exception(
-                            f"Failed to fetch weather data for {city}. "
-                            f"Status: {response.status}. Response: {error_text}"
-                        )
+            data = await self._request(self.base_url, params, f"weather data for {city}", city=city)
         except Exception as e:
-            print(f"Exception occurred in get_current_weather for {city}: {e}")
+            logger.warning("Fetching weather data for %s failed: %s", city, e)
             raise
+        weather_data = self._parse_weather(city, data)
+        self._last_known[self.cache_key(city)] = weather_data
+        return weather_data
+
+    @staticmethod
+    def _parse_weather(city: str, data: dict) -> WeatherData:
+        return WeatherData(
+            city=city,
+            temp=data['main']['temp'],
+            feels_like=data['main']['feels_like'],
+            humidity=data['main'].get('humidity'),
+            main=data['weather'][0]['main'],
+            dt=int(data['dt'])  # Keep timestamp as an integer
+        )
 
-    async def fetch_weather_data(self):
+    async def get_weather_group(self, city_ids: Dict[int, str]) -> Dict[str, WeatherData]:
         """
-        Iterates over all cities provided by settings.get_cities() and fetches weather data
-        for each one. The fetched data can then be saved to a database or processed further.
+        Fetches the current weather for several cities in one request to the
+        OpenWeatherMap group endpoint.
+
+        :param city_ids: Mapping of OpenWeatherMap city id -> configured city name
+                         (at most 20 ids, the upstream limit).
+        :return: Dict of city name -> WeatherData. Ids the upstream did not
+                 return are simply missing from the result.
+        :raises UpstreamError: If the API call fails.
         """
-        cities = self.settings.get_cities()
+        params = {
+            "id": ",".join(str(city_id) for city_id in city_ids),
+            "appid": self.api_key,
+            "units": "metric"
+        }
+        data = await self._request(self.group_url, params, f"weather data for group {params['id']}")
+        results = {}
+        for item in data.get("list", []):
+            city = city_ids.get(int(item.get("id", -1)))
+            if city is not None:
+                results[city] = self._parse_weather(city, item)
+                self._last_known[self.cache_key(city)] = results[city]
+        return results
+
+    def _plan_requests(self, cities: List[str]) -> List[List[str]]:
+        # Cities with a configured id are packed into group requests of up to
+        # group_size; everything else gets a request of its own.
+        grouped, singles = [], []
         for city in cities:
-            try:
-                weather_data = await self.get_current_weather(city)
-                # TODO: Save weather_data to your database or process it further.
-                print(f"Fetched weather data for {city}: {weather_data}")
-            except Exception as e:
-                print(f"Error fetching weather data for {city}: {str(e)}")
+            if self.group_size > 1 and self.settings.get_city_id(city) is not None:
+                grouped.append(city)
+            else:
+                singles.append([city])
+        groups = [grouped[i:i + self.group_size] for i in range(0, len(grouped), self.group_size)]
+        return groups + singles
+
+    def _share(self, weather_data_list: List[WeatherData]):
+        for weather_data in weather_data_list:
+            self.shared_cache.set(
+                "weather", str(self.cache_key(weather_data.city)), weather_data.model_dump_json(), self.cache.ttl
+            )
+
+    def cache_key(self, city: str):
+        # Cities configured with coordinates are cached by coordinates, others by name.
+        coords = self.settings.get_city_coords(city)
+        if coords:
+            return (round(coords["lat"], 4), round(coords["lon"], 4))
+        return city.strip().lower()
 
-    def get_city_weather_data(self, city: str) -> pd.DataFrame:
+    async def get_cached_weather(self, city: str) -> WeatherData:
         """
-        Returns a Pandas DataFrame with weather data for the specified city.
-        This is a dummy implementation for testing purposes. In production, replace this method
-        with your actual data retrieval logic (e.g., querying your database).
+        Returns the current weather for a city from the TTL cache, fetching it
+        upstream on a miss. Concurrent misses for the same city share a single
+        upstream request. With a shared cache, a miss is first looked up there, so
+        the workers of a deployment fetch each city once per TTL between them (an
+        entry is then at most twice CACHE_TTL old). While the upstream circuit is
+        open, the last observation fetched for the city is served instead, however old.
+
+        :param city: Name of the city.
+        :return: WeatherData instance, at most settings.CACHE_TTL seconds old
+                 unless the circuit is open.
+        :raises CircuitOpenError: If the circuit is open and the city was never fetched.
+        """
+        key = self.cache_key(city)
+
+        async def fetch() -> WeatherData:
+            if self.shared_cache is not None:
+                shared = await asyncio.to_thread(self.shared_cache.get, "weather", str(key))
+                if shared is not None:
+                    return WeatherData.model_validate_json(shared)
+            weather_data = await self.get_current_weather(city)
+            if self.shared_cache is not None:
+                await asyncio.to_thread(self._share, [weather_data])
+            return weather_data
+
+        try:
+            return await self.cache.get_or_fetch(key, fetch)
+        except CircuitOpenError:
+            stale = self._last_known.get(key)
+            if stale is None:
+                raise
+            self.upstream_stats.stale_served += 1
+            return stale
+
+    async def get_cached_weather_many(self, cities: List[str]) -> Tuple[Dict[str, WeatherData], Dict[str, str]]:
+        """
+        get_cached_weather for many cities at once: one pass over the TTL cache, one
+        multi-get in the shared cache (if any) for the misses, and a single concurrent
+        fan-out upstream for the rest, through group requests where city ids are
+        configured. Cities another request is already fetching are awaited instead of
+        fetched again. While the upstream circuit is open, cities fetched before are
+        served from their last observation.
+
+        :param cities: City names.
+        :return: ({city: WeatherData} for every city resolved, {city: error message}
+                 for the others), both in the order of cities.
+        """
+        keys = {city: self.cache_key(city) for city in cities}
+        cities_by_key = {key: city for city, key in keys.items()}
+
+        async def fetch(missing_keys: list) -> dict:
+            # Misses nobody else is fetching: the shared cache first, then one upstream fan-out
+            missing = [cities_by_key[key] for key in missing_keys]
+            found = {}
+            if self.shared_cache is not None:
+                shared = await asyncio.to_thread(self.shared_cache.get_many, "weather", [str(keys[c]) for c in missing])
+                found = {
+                    city: WeatherData.model_validate_json(shared[str(keys[city])])
+                    for city in missing if str(keys[city]) in shared
+                }
+                missing = [city for city in missing if city not in found]
+            if missing:
+                stats = FetchCycleStats(started_at=time.time())
+                fetched = await self._fetch_cities(missing, stats)
+                found.update((weather_data.city, weather_data) for weather_data in fetched)
+                if fetched and self.shared_cache is not None:
+                    await asyncio.to_thread(self._share, fetched)
+                for city in missing:
+                    if city not in found:
+                        found[city] = UpstreamError(stats.errors.get(city, "No data returned"))
+            return {keys[city]: result for city, result in found.items()}
+
+        # Keys already being fetched (by another batch or get_cached_weather) are awaited
+        # through the cache's in-flight map rather than requested again
+        values, failures = await self.cache.get_or_fetch_many(keys.values(), fetch)
+        found, errors = {}, {}
+        circuit_open = self.breaker.state == CircuitBreaker.OPEN
+        for city, key in keys.items():
+            if key in values:
+                found[city] = values[key]
+                continue
+            stale = self._last_known.get(key) if circuit_open else None
+            if stale is not None:
+                found[city] = stale
+                self.upstream_stats.stale_served += 1
+            else:
+                errors[city] = str(failures.get(key) or "No data returned")
+        return found, errors
+
+    async def _fetch_cities(self, cities: List[str], stats: FetchCycleStats, stagger: float = 0.0) -> List[WeatherData]:
+        # Concurrent fan-out over the shared session: group requests for cities with an
+        # id (failed or incomplete groups retried city by city), single requests for the rest.
+        # Failures are recorded in stats.errors.
+        batches = self._plan_requests(cities)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch_single(city: str) -> Optional[WeatherData]:
+            async with semaphore:
+                start = time.perf_counter()
+                stats.requests += 1
+                try:
+                    return await self.get_current_weather(city)
+                except Exception as e:
+                    stats.errors[city] = str(e)
+                    return None
+                finally:
+                    stats.latencies[city] = time.perf_counter() - start
+
+        async def fetch_group(batch: List[str]) -> List[Optional[WeatherData]]:
+            async with semaphore:
+                start = time.perf_counter()
+                stats.requests += 1
+                try:
+                    found = await self.get_weather_group(
+                        {self.settings.get_city_id(city): city for city in batch}
+                    )
+                except Exception as e:
+                    logger.warning("Group request failed, falling back to single requests: %s", e)
+                    found = {}
+                elapsed = time.perf_counter() - start
+            for city in found:
+                stats.latencies[city] = elapsed
+            missing = [city for city in batch if city not in found]
+            retried = await asyncio.gather(*(fetch_single(city) for city in missing))
+            return list(found.values()) + list(retried)
+
+        async def fetch_batch(index: int, batch: List[str]) -> List[Optional[WeatherData]]:
+            if stagger and batches:
+                await asyncio.sleep(stagger * index / len(batches))
+            if len(batch) == 1 and self.settings.get_city_id(batch[0]) is None:
+                return [await fetch_single(batch[0])]
+            return await fetch_group(batch)
+
+        nested = await asyncio.gather(*(fetch_batch(i, batch) for i, batch in enumerate(batches)))
+        return [weather_data for batch in nested for weather_data in batch if weather_data is not None]
+
+    async def fetch_weather_data(self, stagger: float = 0.0) -> List[WeatherData]:
+        """
+        Fetches weather data for all cities provided by settings.get_cities().
+
+        Cities configured with an OpenWeatherMap id are fetched in batches of up to
+        settings.FETCH_GROUP_SIZE through the group endpoint; the rest are fetched one
+        request per city. If a batch fails, or omits some of its cities, those cities
+        are retried individually in the same cycle.
+
+        Requests are fanned out concurrently over the shared session, with at most
+        settings.FETCH_CONCURRENCY requests in flight at once. Cities that fail are
+        reported in the cycle stats and skipped. Timing for the cycle is stored in
+        self.last_cycle. Unless settings.CACHE_PREWARM is off, fresh results also
+        refresh the current-weather cache.
+
+        :param stagger: Spread request start times evenly over this many seconds
+                        instead of sending every request at the top of the cycle.
+        :return: List of WeatherData for every city that was fetched successfully.
+        """
+        cities = self.settings.get_cities()
+        stats = FetchCycleStats(started_at=time.time())
+        cycle_start = time.perf_counter()
+        results = await self._fetch_cities(cities, stats, stagger=stagger)
+        stats.wall_time = time.perf_counter() - cycle_start
+        if self.prewarm_cache:
+            for weather_data in results:
+                self.cache.set(self.cache_key(weather_data.city), weather_data)
+            if self.shared_cache is not None:
+                await asyncio.to_thread(self._share, results)
+        self.last_cycle = stats
+        logger.info(
+            "Fetched weather data for %d/%d cities in %.2fs (%d requests)",
+            stats.succeeded, len(cities), stats.wall_time, stats.requests,
+        )
+        return results
+
+    def get_city_weather_data(
+        self,
+        city: str,
+        start: Optional[Union[int, datetime]] = None,
+        end: Optional[Union[int, datetime]] = None,
+        max_points: int = 2000,
+    ) -> "pd.DataFrame":
+        """
+        Returns a Pandas DataFrame with stored weather data for the specified city,
+        downsampled to at most max_points time buckets (see
+        data.database.load_downsampled_series), ready for visualization.charts.
+        Days covered by the archive, if one is configured, are read from it.
 
         :param city: The city name.
-        :return: A Pandas DataFrame containing columns 'timestamp', 'city', 'temperature', and 'humidity'.
-        """
-        # Dummy data for demonstration
-        data = {
-            "timestamp": ["2025-02-20 10:00", "2025-02-20 11:00", "2025-02-20 12:00"],
-            "city": [city, city, city],
-            "temperature": [25, 26, 27],
-            "humidity": [30, 35, 40],
-        }
-        df = pd.DataFrame(data)
-        # Ensure the timestamp column is in datetime format
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        :param start: Start of the range (default: 24 hours before end).
+        :param end: End of the range, exclusive (default: now).
+        :param max_points: Maximum number of points returned.
+        :return: A Pandas DataFrame containing columns 'timestamp', 'city', 'temperature',
+                 'temperature_min', 'temperature_max', 'feels_like', 'humidity' and 'count'.
+        """
+        from data import database
+
+        end = end if end is not None else datetime.now(timezone.utc)
+        start = start if start is not None else database.to_db_datetime(end) - timedelta(days=1)
+        if self.archive is not None:
+            from data import archive
+            df = archive.load_downsampled_series(self.archive, city, start, end, max_points=max_points)
+        else:
+            df = database.load_downsampled_series(city, start, end, max_points=max_points)
+        return self.to_chart_frame(df, city)
+
+    def get_comparison_data(
+        self,
+        cities: List[str],
+        start: Union[int, datetime],
+        end: Union[int, datetime],
+        max_points: int = 500,
+    ) -> "pd.DataFrame":
+        """
+        get_city_weather_data for several cities in one query: every city is
+        downsampled to at most max_points buckets on a shared time grid.
+
+        :return: The same columns, ordered by (city, timestamp).
+        """
+        from data import database
+
+        if self.archive is not None:
+            from data import archive
+            df = archive.load_downsampled_frame(self.archive, cities, start, end, max_points=max_points)
+        else:
+            df = database.load_downsampled_frame(cities, start, end, max_points=max_points)
+        return self.to_chart_frame(df)
+
+    @staticmethod
+    def to_chart_frame(df: "pd.DataFrame", city: Optional[str] = None) -> "pd.DataFrame":
+        # Downsampled series (bucket, temp, ...) -> the columns visualization.charts expects;
+        # multi-city frames already carry their city column
+        import pandas as pd
+
+        df = df.rename(columns={"temp": "temperature", "temp_min": "temperature_min", "temp_max": "temperature_max"})
+        if city is not None:
+            df.insert(0, "city", city)
+        df.insert(0, "timestamp", pd.to_datetime(df.pop("bucket"), unit="s"))
         return df
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Point the data layer at a throwaway SQLite database before any test module
+# uses data.database (which reads DATABASE_URL when the engine is first needed).
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test_weather.db")
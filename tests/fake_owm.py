@@ -0,0 +1,140 @@
+"""
+fake_owm.py
+
+A small local stand-in for the OpenWeatherMap current-weather and group APIs, used by tests
+and benchmarks so they never touch the real upstream.
+"""
+
+import asyncio
+import zlib
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from config.settings import Settings
+from services.weather_service import WeatherService
+
+
+def city_temp(city: str) -> float:
+    # Deterministic, city-specific temperature so callers can assert on values.
+    return round(10 + (zlib.crc32(city.encode()) % 2500) / 100, 2)
+
+
+class FakeOpenWeatherMap:
+    """
+    In-process fake of the /data/2.5/weather and /data/2.5/group endpoints.
+
+    :param latency: Seconds to sleep before answering each request.
+    :param fail_cities: City names that always get a 500 response.
+    :param city_ids: OpenWeatherMap id -> city name known to the group endpoint;
+                     unknown ids are silently left out of group responses.
+    :param fail_groups: Answer every group request with a 500.
+    :param statuses: City name -> status codes to answer that city's next requests
+                     with, one per request, before behaving normally again.
+    :param retry_after: Retry-After header sent with scripted 429 responses.
+    :param malformed_cities: City names answered with a 200 whose body is not JSON.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        fail_cities: Optional[Set[str]] = None,
+        city_ids: Optional[Dict[int, str]] = None,
+        fail_groups: bool = False,
+        statuses: Optional[Dict[str, List[int]]] = None,
+        retry_after: Optional[str] = None,
+        malformed_cities: Optional[Set[str]] = None,
+    ):
+        self.latency = latency
+        self.fail_cities = set(fail_cities or ())
+        self.city_ids = dict(city_ids or {})
+        self.fail_groups = fail_groups
+        self.statuses = {city: list(codes) for city, codes in (statuses or {}).items()}
+        self.retry_after = retry_after
+        self.malformed_cities = set(malformed_cities or ())
+        self.requests = 0
+        self.group_requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.peers = set()
+        self._server: Optional[TestServer] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/data/2.5/weather", self.handle_weather)
+        app.router.add_get("/data/2.5/group", self.handle_group)
+        return app
+
+    async def handle_weather(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.peers.add(request.transport.get_extra_info("peername"))
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            city = request.query.get("q") or f"{request.query.get('lat')},{request.query.get('lon')}"
+            if city in self.fail_cities:
+                return web.json_response({"cod": 500, "message": "boom"}, status=500)
+            if city in self.malformed_cities:
+                return web.Response(text="{not json", content_type="application/json")
+            scripted = self.statuses.get(city)
+            if scripted:
+                status = scripted.pop(0)
+                headers = {"Retry-After": self.retry_after} if status == 429 and self.retry_after else None
+                return web.json_response({"cod": status, "message": "scripted"}, status=status, headers=headers)
+            return web.json_response(self.observation(city))
+        finally:
+            self.in_flight -= 1
+
+    async def handle_group(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        self.group_requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.fail_groups:
+            return web.json_response({"cod": 500, "message": "boom"}, status=500)
+        items = []
+        for city_id in map(int, request.query["id"].split(",")):
+            city = self.city_ids.get(city_id)
+            if city is not None and city not in self.fail_cities:
+                items.append({"id": city_id, **self.observation(city)})
+        return web.json_response({"cnt": len(items), "list": items})
+
+    @staticmethod
+    def observation(city: str, dt: int = 1622555555) -> dict:
+        temp = city_temp(city)
+        return {
+            "name": city,
+            "weather": [{"main": "Clear"}],
+            "main": {"temp": temp, "feels_like": temp + 1, "humidity": 50},
+            "dt": dt,
+        }
+
+    async def start(self) -> str:
+        """
+        Starts the server on a free local port and returns its base URL.
+        """
+        self._server = TestServer(self.build_app())
+        await self._server.start_server()
+        return str(self._server.make_url("/data/2.5"))
+
+    async def stop(self):
+        if self._server is not None:
+            await self._server.close()
+            self._server = None
+
+
+def make_service(base_url: str, cities, shared_cache=None, **overrides) -> WeatherService:
+    """
+    Builds a WeatherService for the given cities that talks to a fake upstream.
+    """
+    settings = Settings(
+        OPENWEATHERMAP_API_KEY="test_key",
+        DATABASE_URL="sqlite:///./test.db",
+        CITIES=cities,
+        OPENWEATHERMAP_BASE_URL=base_url,
+        **overrides,
+    )
+    return WeatherService(settings, shared_cache=shared_cache)
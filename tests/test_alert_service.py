@@ -1,6 +1,9 @@
+import random
 import pytest
 from datetime import datetime
+from data.database import Base, engine
 from services.alert_service import AlertService
+from models.alert import AlertRule
 from models.weather_data import WeatherData
 
 @pytest.fixture
@@ -20,16 +23,84 @@ def test_set_threshold(alert_service):
 
 def test_check_alert(alert_service):
     alert_service.set_threshold(30, "TestCity")
-    weather_data = WeatherData(city="TestCity", main="Clear", temp=32, feels_like=34, dt=datetime.fromtimestamp(1622555555))
+    weather_data = WeatherData(city="TestCity", main="Clear", temp=32, feels_like=34, dt=1622555555)
     alert_service.check_alert(weather_data)
     assert len(alert_service.alerts["TestCity"]) == 1
+    assert alert_service.get_alerts("TestCity")[0].value == 32
 
 def test_get_daily_summary(alert_service):
     weather_data = [
-        WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=datetime.fromtimestamp(1622555555)),
-        WeatherData(city="TestCity", main="Cloudy", temp=25, feels_like=26, dt=datetime.fromtimestamp(1622565555))
+        WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555),
+        WeatherData(city="TestCity", main="Cloudy", temp=25, feels_like=26, dt=1622565555)
     ]
     summary = alert_service.get_daily_summary("TestCity", weather_data)
     assert summary["avg_temp"] == 22.5
     assert summary["max_temp"] == 25
     assert summary["min_temp"] == 20
+
+
+def observation(temp, city="TestCity", main="Clear", feels_like=None, dt=1622555555):
+    return WeatherData(city=city, main=main, temp=temp, feels_like=temp if feels_like is None else feels_like, dt=dt)
+
+
+def test_rule_index_matches_brute_force(alert_service):
+    rng = random.Random(7)
+    rules = [
+        AlertRule(city=rng.choice(["TestCity", "OtherCity", "*"]), metric=rng.choice(["temp", "feels_like"]),
+                  operator=rng.choice([">", "<"]), threshold=rng.randint(0, 40))
+        for _ in range(2000)
+    ]
+    for rule in rules:
+        alert_service.add_rule(rule)
+    for rule in rules[:500]:
+        alert_service.remove_rule(rule.id)
+
+    weather_data = observation(21.5, feels_like=17)
+    expected = {
+        rule.id for rule in rules[500:]
+        if rule.city in ("TestCity", "*") and (
+            getattr(weather_data, rule.metric) > rule.threshold if rule.operator == ">"
+            else getattr(weather_data, rule.metric) < rule.threshold
+        )
+    }
+    assert {alert.rule_id for alert in alert_service.check_alert(weather_data)} == expected
+
+
+def test_threshold_boundaries_and_replacement(alert_service):
+    alert_service.set_threshold(30, "TestCity")
+    assert alert_service.check_alert(observation(30)) == []
+    alert_service.set_threshold(25, "TestCity")
+    assert len(alert_service.rules) == 1
+    assert len(alert_service.check_alert(observation(30))) == 1
+
+
+def test_consecutive_breach_rule(alert_service):
+    alert_service.add_rule(AlertRule(id="cold", metric="feels_like", operator="<", threshold=0, consecutive=3))
+    readings = [-1, -2, 5, -1, -2, -3, -4]
+    fired = [bool(alert_service.check_alert(observation(1, feels_like=value))) for value in readings]
+    assert fired == [False, False, False, False, False, True, True]
+
+
+def test_condition_rule(alert_service):
+    alert_service.add_rule(AlertRule(id="rain", city="TestCity", metric="condition", operator="==", condition="Rain"))
+    assert alert_service.check_alert(observation(20, main="Clear")) == []
+    alerts = alert_service.check_alert(observation(20, main="rain"))
+    assert alerts[0].rule_id == "rain" and alerts[0].value is None
+    with pytest.raises(ValueError):
+        AlertRule(metric="condition", operator=">", condition="Rain")
+
+
+def test_alert_history_is_bounded_and_persisted(mock_settings):
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    mock_settings.ALERT_HISTORY_SIZE = 5
+    service = AlertService(mock_settings)
+    service.set_threshold(0, "TestCity")
+    service.check_alerts([observation(i, dt=1622555555 + i) for i in range(1, 13)])
+    assert [alert.value for alert in service.get_alerts("TestCity")] == [8, 9, 10, 11, 12]
+    assert service.flush() == 12
+    assert service.flush() == 0
+
+    restarted = AlertService(mock_settings)
+    assert restarted.load_history() == 5
+    assert [alert.value for alert in restarted.get_alerts("TestCity")] == [8, 9, 10, 11, 12]
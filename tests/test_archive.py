@@ -0,0 +1,159 @@
+from datetime import date, datetime
+
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from data import archive as archive_module
+from data.archive import WeatherArchive
+from data.database import (
+    Base, engine, get_weather_range, insert_weather_data_bulk, load_downsampled_series,
+    load_weather_frame, to_db_datetime,
+)
+from utils.weather_analyzer import WeatherAnalyzer
+
+START = 1622505600  # 2021-06-01 00:00 UTC
+
+
+@pytest.fixture
+def clean_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def seed(days=5, cities=("Delhi", "New York")):
+    rows = [
+        {"city": city, "main": "Rain" if i % 3 == 0 else "Clear", "temp": 20.0 + i % 10, "feels_like": 21.0,
+         "humidity": None if i % 7 == 0 else 50.0, "dt": to_db_datetime(START + i * 3600)}
+        for city in cities for i in range(24 * days)
+    ]
+    insert_weather_data_bulk(rows)
+    return rows
+
+
+@pytest.fixture(params=["parquet", "arrow"])
+def archive(request, tmp_path):
+    return WeatherArchive(str(tmp_path / "archive"), format=request.param)
+
+
+def test_export_partitions_by_city_and_day(clean_db, archive):
+    seed()
+    assert archive.export(date(2021, 6, 1), date(2021, 6, 4)) == 2 * 3 * 24
+    assert archive.days("New York") == [date(2021, 6, 1), date(2021, 6, 2), date(2021, 6, 3)]
+    assert archive.covered_until() == date(2021, 6, 4)
+    # Re-exporting a day replaces its partition instead of duplicating rows
+    archive.export(date(2021, 6, 2), date(2021, 6, 3))
+    assert len(archive.load_frame()) == 2 * 3 * 24
+
+
+def test_load_frame_matches_database(clean_db, archive):
+    seed()
+    archive.export(date(2021, 6, 1), date(2021, 6, 6))
+    start, end = START + 30 * 3600 + 1, START + 70 * 3600
+    from_archive = archive.load_frame(["New York"], start, end)
+    from_db = load_weather_frame(["New York"], start, end)
+
+    assert list(from_archive.columns) == list(from_db.columns)
+    assert from_archive["dt"].tolist() == from_db["dt"].tolist()
+    assert from_archive["temp"].tolist() == from_db["temp"].tolist()
+    assert from_archive["main"].astype(str).tolist() == from_db["main"].astype(str).tolist()
+    assert from_archive["humidity"].isna().tolist() == from_db["humidity"].isna().tolist()
+
+
+def test_load_frame_prunes_columns(clean_db, archive):
+    seed(days=1)
+    archive.export(date(2021, 6, 1), date(2021, 6, 2))
+    df = archive.load_frame(["Delhi"], columns=["temp"])
+    assert list(df.columns) == ["city", "dt", "temp"]
+    assert len(df) == 24
+
+
+def test_downsampled_series_matches_database(clean_db, archive):
+    seed()
+    archive.export(date(2021, 6, 1), date(2021, 6, 6))
+    expected = load_downsampled_series("Delhi", START, START + 5 * 86400, max_points=20)
+    actual = archive.load_downsampled_series("Delhi", START, START + 5 * 86400, max_points=20)
+    assert actual["bucket"].tolist() == expected["bucket"].tolist()
+    assert actual["temp"].tolist() == pytest.approx(expected["temp"].tolist())
+    assert actual["count"].tolist() == expected["count"].tolist()
+
+
+def test_hybrid_load_reads_archived_days_from_archive(clean_db, archive, monkeypatch):
+    seed()
+    archive.export(date(2021, 6, 1), date(2021, 6, 3))
+
+    calls = []
+    original = archive_module.database.load_weather_frame
+
+    def spy(cities=None, start=None, end=None):
+        calls.append((to_db_datetime(start), to_db_datetime(end)))
+        return original(cities, start, end)
+
+    monkeypatch.setattr(archive_module.database, "load_weather_frame", spy)
+    df = archive_module.load_weather_frame(archive, ["Delhi"], date(2021, 6, 1), date(2021, 6, 6))
+
+    assert len(df) == 5 * 24
+    assert df["dt"].is_monotonic_increasing
+    # Only the days after the archive were read from the database
+    assert calls == [(datetime(2021, 6, 3), datetime(2021, 6, 6))]
+
+    calls.clear()
+    assert len(archive_module.load_weather_frame(archive, None, date(2021, 6, 1), date(2021, 6, 3))) == 2 * 2 * 24
+    assert calls == []
+
+
+def test_hybrid_load_falls_back_per_city(clean_db, archive):
+    seed()
+    # Only Delhi is archived: New York's days must still come from the database
+    archive.export(date(2021, 6, 1), date(2021, 6, 4), cities=["Delhi"])
+    assert archive.covered_until("New York") is None
+
+    df = archive_module.load_weather_frame(archive, None, date(2021, 6, 1), date(2021, 6, 4))
+    assert df.groupby("city", observed=True).size().to_dict() == {"Delhi": 3 * 24, "New York": 3 * 24}
+
+    series = archive_module.load_downsampled_series(archive, "New York", START, START + 3 * 86400, max_points=3)
+    assert series["count"].tolist() == [24, 24, 24]
+
+
+def test_partition_listing_is_cached(clean_db, tmp_path):
+    seed(days=2)
+    reader = WeatherArchive(str(tmp_path / "archive"), refresh_interval=3600)
+    writer = WeatherArchive(str(tmp_path / "archive"))
+    assert reader.days() == []
+
+    writer.export(date(2021, 6, 1), date(2021, 6, 2))
+    assert writer.days() == [date(2021, 6, 1)]
+    assert reader.days() == []  # another instance's export shows up on the next refresh
+    reader.refresh()
+    assert reader.days() == [date(2021, 6, 1)]
+
+
+def test_analyzer_summary_from_archive(clean_db, archive):
+    seed(days=2)
+    archive.export(date(2021, 6, 1), date(2021, 6, 3))
+    expected = WeatherAnalyzer().load_frame(["Delhi"], date(2021, 6, 1), date(2021, 6, 3))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    df = WeatherAnalyzer(archive=archive).load_frame(["Delhi"], date(2021, 6, 1), date(2021, 6, 3))
+    assert df["temp"].tolist() == expected["temp"].tolist()
+
+
+def test_import_backfills_missing_rows_only(clean_db, archive):
+    rows = seed(days=2)
+    archive.export(date(2021, 6, 1), date(2021, 6, 3))
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    insert_weather_data_bulk(rows[:10])
+
+    assert archive.import_into_database() == len(rows) - 10
+    assert archive.import_into_database() == 0
+    restored = get_weather_range("New York", START, START + 2 * 86400)
+    assert len(restored) == 48
+    assert [row.humidity for row in restored] == [row["humidity"] for row in rows if row["city"] == "New York"]
+
+
+def test_missing_archive_directory_loads_empty(tmp_path):
+    archive = WeatherArchive(str(tmp_path / "nothing"))
+    assert archive.covered_until() is None
+    assert archive.load_frame(["Delhi"]).empty
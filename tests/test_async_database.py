@@ -0,0 +1,100 @@
+import asyncio
+from datetime import date
+
+import pytest
+from sqlalchemy.pool import StaticPool
+
+from data import async_database
+from data.async_database import AsyncDatabase, async_database_url
+from data.database import (
+    Base, engine, get_daily_weather_data, get_latest, get_weather_range, insert_weather_data_bulk,
+    load_downsampled_frame, load_downsampled_series, load_weather_frame, DATABASE_URL,
+)
+from models.weather_data import WeatherData
+
+
+@pytest.fixture
+def seeded():
+    # Fresh tables in the SQLite test database (see conftest.py), two cities of 5-minute data
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = 1622505600
+    insert_weather_data_bulk([
+        WeatherData(city=city, main="Clear" if i % 3 else "Rain", temp=i % 40, feels_like=i % 7,
+                    humidity=i % 100, dt=start + i * 300)
+        for city in ("TestCity", "OtherCity")
+        for i in range(2 * 288)
+    ])
+    return start, start + 2 * 86400
+
+
+def run(query):
+    # Runs query(session) on a fresh engine, as one request handler would
+    async def main():
+        db = AsyncDatabase(DATABASE_URL, pool_size=2, max_overflow=0)
+        try:
+            async for session in db.session():
+                return await query(session)
+        finally:
+            await db.dispose()
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("sqlite:///./weather.db", "sqlite+aiosqlite:///./weather.db"),
+    ("sqlite+pysqlite:////tmp/weather.db", "sqlite+aiosqlite:////tmp/weather.db"),
+    ("postgresql://u:p@db/weather", "postgresql+asyncpg://u:p@db/weather"),
+    ("postgresql+psycopg2://u:p@db/weather", "postgresql+asyncpg://u:p@db/weather"),
+    ("postgres://u:p@db/weather", "postgresql+asyncpg://u:p@db/weather"),
+])
+def test_async_database_url(url, expected):
+    assert async_database_url(url) == expected
+
+
+def test_async_database_url_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        async_database_url("mysql://u:p@db/weather")
+
+
+def test_pool_options(tmp_path):
+    db = AsyncDatabase(f"sqlite:///{tmp_path}/pool.db", pool_size=3, max_overflow=4, pool_timeout=5, pool_recycle=60)
+    pool = db.engine.pool
+    assert (pool.size(), pool._max_overflow, pool._timeout, pool._recycle) == (3, 4, 5, 60)
+    assert pool._pre_ping
+    assert db.pool_status() == {"size": 3, "checked_out": 0, "overflow": -3, "idle": 0}
+    asyncio.run(db.dispose())
+
+    memory = AsyncDatabase("sqlite:///:memory:")
+    assert isinstance(memory.engine.pool, StaticPool)
+    assert memory.pool_status() == {}
+    asyncio.run(memory.dispose())
+
+
+def test_range_and_latest_match_sync_layer(seeded):
+    start, end = seeded
+    rows = run(lambda s: async_database.get_weather_range(s, "TestCity", start, start + 86400))
+    expected = get_weather_range("TestCity", start, start + 86400)
+    assert [(r.dt, r.temp) for r in rows] == [(r.dt, r.temp) for r in expected]
+    assert len(rows) == 288
+
+    latest = run(lambda s: async_database.get_latest(s, "TestCity"))
+    assert latest.dt == get_latest("TestCity").dt
+
+    daily = run(lambda s: async_database.get_daily_weather_data(s, "OtherCity", date(2021, 6, 1)))
+    assert len(daily) == len(get_daily_weather_data("OtherCity", date(2021, 6, 1))) == 288
+
+
+def test_frames_match_sync_layer(seeded):
+    start, end = seeded
+    frame = run(lambda s: async_database.load_weather_frame(s, ["TestCity"], start, end))
+    assert frame.equals(load_weather_frame(["TestCity"], start, end))
+
+    series = run(lambda s: async_database.load_downsampled_series(s, "TestCity", start, end, max_points=48))
+    expected = load_downsampled_series("TestCity", start, end, max_points=48)
+    assert list(series["bucket"]) == list(expected["bucket"])
+    assert series["temp"].tolist() == pytest.approx(expected["temp"].tolist())
+    assert series["count"].sum() == 2 * 288
+
+    many = run(lambda s: async_database.load_downsampled_frame(s, ["TestCity", "OtherCity"], start, end, max_points=48))
+    assert many.equals(load_downsampled_frame(["TestCity", "OtherCity"], start, end, max_points=48))
@@ -0,0 +1,199 @@
+import asyncio
+from services.cache import TTLCache
+from tests.fake_owm import FakeOpenWeatherMap, make_service
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("delhi", 1)
+    clock.now = 9.9
+    assert cache.get("delhi") == 1
+    clock.now = 10
+    assert cache.get("delhi") is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = TTLCache(ttl=60, maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_concurrent_misses_are_coalesced():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def run():
+        results = await asyncio.gather(*(cache.get_or_fetch("delhi", fetch) for _ in range(50)))
+        results.append(await cache.get_or_fetch("delhi", fetch))
+        return results
+
+    assert asyncio.run(run()) == ["value"] * 51
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["coalesced"] == 49
+    assert cache.stats()["hits"] == 1
+
+
+def test_cancelled_owner_does_not_fail_coalesced_callers():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return "value"
+
+    async def run():
+        owner = asyncio.create_task(cache.get_or_fetch("delhi", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(cache.get_or_fetch("delhi", fetch))
+        await asyncio.sleep(0.005)
+        owner.cancel()
+        result = await waiter
+        try:
+            await owner
+        except asyncio.CancelledError:
+            pass
+        return owner, result
+
+    owner, result = asyncio.run(run())
+    assert owner.cancelled() and result == "value"
+    assert len(calls) == 1
+    assert cache.get("delhi") == "value"
+
+
+def test_fetch_errors_propagate_and_are_not_cached():
+    cache = TTLCache(ttl=60)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*(cache.get_or_fetch("delhi", fail) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert cache.get("delhi") is None
+
+
+def test_get_or_fetch_many_shares_in_flight_keys():
+    cache = TTLCache(ttl=60)
+    batches = []
+
+    async def fetch_many(keys):
+        batches.append(keys)
+        await asyncio.sleep(0.01)
+        return {key: key.upper() for key in keys if key != "nowhere"}
+
+    async def fetch_one():
+        await asyncio.sleep(0.01)
+        return "PUNE"
+
+    async def run():
+        cache.set("delhi", "DELHI")
+        single = asyncio.ensure_future(cache.get_or_fetch("pune", fetch_one))
+        await asyncio.sleep(0)
+        first, second, third = await asyncio.gather(
+            cache.get_or_fetch_many(["delhi", "mumbai", "pune", "nowhere"], fetch_many),
+            cache.get_or_fetch_many(["mumbai", "nowhere"], fetch_many),
+            cache.get_or_fetch("mumbai", fetch_one),
+        )
+        return first, second, third, await single
+
+    (values, errors), second, third, single = asyncio.run(run())
+    assert values == {"delhi": "DELHI", "mumbai": "MUMBAI", "pune": "PUNE"}
+    assert list(errors) == ["nowhere"] and isinstance(errors["nowhere"], KeyError)
+    assert second[0] == {"mumbai": "MUMBAI"} and list(second[1]) == ["nowhere"]
+    assert third == "MUMBAI" and single == "PUNE"
+    # One batch fetch for the keys nobody was fetching; everything else waited for it
+    assert batches == [["mumbai", "nowhere"]]
+    assert cache.get("nowhere") is None
+
+
+def test_weather_service_cache_and_prewarm():
+    async def run():
+        upstream = FakeOpenWeatherMap(latency=0.02)
+        base_url = await upstream.start()
+        service = make_service(base_url, ["Delhi", "Mumbai"])
+        try:
+            results = await asyncio.gather(*(service.get_cached_weather("Delhi") for _ in range(100)))
+            after_burst = upstream.requests
+            await service.fetch_weather_data()
+            await service.get_cached_weather("Mumbai")
+            await service.get_cached_weather(" mumbai ")
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, results, after_burst
+
+    upstream, results, after_burst = asyncio.run(run())
+    assert after_burst == 1
+    assert {result.city for result in results} == {"Delhi"}
+    # One request per city from the polling cycle; cached reads afterwards cost nothing
+    assert upstream.requests == 3
+
+
+def test_get_many_batches_cache_and_upstream():
+    async def run():
+        upstream = FakeOpenWeatherMap(city_ids={1: "Delhi", 2: "Mumbai"}, fail_cities={"Nowhere"})
+        base_url = await upstream.start()
+        cities = {"Delhi": {"id": 1}, "Mumbai": {"id": 2}, "Pune": {}, "Nowhere": {}}
+        service = make_service(base_url, cities, UPSTREAM_MAX_RETRIES=0)
+        try:
+            await service.get_cached_weather("Pune")
+            found, errors = await service.get_cached_weather_many(["Nowhere", "Pune", "Delhi", "Mumbai"])
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, service, found, errors
+
+    upstream, service, found, errors = asyncio.run(run())
+    assert list(found) == ["Pune", "Delhi", "Mumbai"]
+    assert list(errors) == ["Nowhere"]
+    # Pune came from the cache; Delhi and Mumbai shared one group request
+    assert (upstream.group_requests, upstream.requests) == (1, 3)
+    assert service.cache.hits == 1
+
+
+def test_concurrent_batches_share_upstream_fetches():
+    async def run():
+        upstream = FakeOpenWeatherMap(latency=0.02)
+        base_url = await upstream.start()
+        service = make_service(base_url, ["Delhi", "Mumbai", "Pune"])
+        try:
+            results = await asyncio.gather(
+                service.get_cached_weather_many(["Delhi", "Mumbai"]),
+                service.get_cached_weather_many(["Mumbai", "Delhi", "Pune"]),
+                service.get_cached_weather("Pune"),
+            )
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, results
+
+    upstream, (first, second, pune) = asyncio.run(run())
+    assert list(first[0]) == ["Delhi", "Mumbai"] and list(second[0]) == ["Mumbai", "Delhi", "Pune"]
+    assert second[0]["Pune"] == pune
+    # Each city was requested once, however many callers asked for it
+    assert upstream.requests == 3
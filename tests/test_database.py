@@ -1,31 +1,207 @@
 # Content of test_database.py
 import pytest
+from datetime import date, datetime
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import Session
-from data.database import insert_weather_data, get_daily_weather_data, WeatherDataDB
+from data.database import (
+    insert_weather_data, insert_weather_data_bulk, get_daily_weather_data,
+    get_weather_range, get_latest, migrate_weather_data_schema, to_db_datetime, load_downsampled_series,
+    WeatherDataDB, WeatherDataBuffer, Base, engine, SessionLocal, weather_frame_query, bucket_window_end,
+)
 from models.weather_data import WeatherData
 
 @pytest.fixture
 def db_session():
-    # Set up a test database session
-    # This could be an in-memory SQLite database for testing
-    pass
-
-async def test_insert_weather_data(db_session):
-    weather_data = WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555)
-    await insert_weather_data(weather_data)
-    
-    result = db_session.query(WeatherDataDB).filter_by(city="TestCity").first()
-    assert result is not None
-    assert result.temp == 20
+    # Fresh tables in the SQLite test database (see conftest.py) for every test
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    yield db
+    db.close()
+
+def test_insert_weather_data(db_session):
+    insert_weather_data(WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555))
+    insert_weather_data({"city": "TestCity", "main": "Rain", "temp": 25, "feels_like": 27, "dt": 1622559155})
+
+    result = db_session.query(WeatherDataDB).filter_by(city="TestCity").order_by(WeatherDataDB.dt).all()
+    assert len(result) == 2
+    assert result[0].temp == 20
     assert result[1].temp == 25
+    assert result[0].dt == to_db_datetime(1622555555)
 
 
 def test_get_daily_weather_data(db_session):
     # Insert some test data
-    db_session.add(WeatherDataDB(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555))
-    db_session.add(WeatherDataDB(city="TestCity", main="Cloudy", temp=25, feels_like=26, dt=1622565555))
+    db_session.add(WeatherDataDB(city="TestCity", main="Clear", temp=20, feels_like=22, dt=to_db_datetime(1622555555)))
+    db_session.add(WeatherDataDB(city="TestCity", main="Cloudy", temp=25, feels_like=26, dt=to_db_datetime(1622565555)))
+    db_session.add(WeatherDataDB(city="TestCity", main="Rain", temp=15, feels_like=14, dt=to_db_datetime(1622665555)))
     db_session.commit()
 
-    result = get_daily_weather_data("TestCity")
+    result = get_daily_weather_data("TestCity", date(2021, 6, 1))
     assert len(result) == 2
-    assert result[0].temp == 20
\ No newline at end of file
+    assert result[0].temp == 20
+
+
+def test_insert_weather_data_bulk(db_session):
+    batch = [
+        WeatherData(city=f"City{i}", main="Clear", temp=20 + i, feels_like=21 + i, dt=1622555555)
+        for i in range(50)
+    ]
+    assert insert_weather_data_bulk(batch) == 50
+    assert insert_weather_data_bulk([]) == 0
+
+    rows = db_session.query(WeatherDataDB).order_by(WeatherDataDB.temp).all()
+    assert len(rows) == 50
+    assert rows[0].city == "City0"
+    assert rows[-1].feels_like == 70
+
+
+def test_weather_data_buffer_flushes_by_size(db_session):
+    batches = []
+    buffer = WeatherDataBuffer(max_size=3, max_age=3600, writer=lambda rows: batches.append(rows) or len(rows))
+    weather_data = WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22)
+
+    assert buffer.add(weather_data) == 0
+    assert buffer.add(weather_data) == 0
+    assert buffer.add(weather_data) == 3
+    assert len(batches) == 1 and len(batches[0]) == 3
+    assert len(buffer) == 0
+
+
+def test_weather_data_buffer_flushes_by_age(db_session):
+    buffer = WeatherDataBuffer(max_size=1000, max_age=0)
+    cycle = [WeatherData(city=f"City{i}", main="Clear", temp=20, feels_like=22) for i in range(5)]
+
+    assert buffer.extend(cycle) == 5
+    assert db_session.query(WeatherDataDB).count() == 5
+
+
+def test_weather_data_buffer_keeps_rows_on_failure(db_session):
+    def failing_writer(rows):
+        raise RuntimeError("db down")
+
+    buffer = WeatherDataBuffer(max_size=1000, max_age=3600, writer=failing_writer)
+    buffer.add(WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22))
+    with pytest.raises(RuntimeError):
+        buffer.flush()
+    assert len(buffer) == 1
+
+    buffer.writer = insert_weather_data_bulk
+    assert buffer.flush() == 1
+    assert db_session.query(WeatherDataDB).count() == 1
+
+
+def test_bulk_insert_stores_observation_time(db_session):
+    insert_weather_data_bulk([WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555)])
+
+    row = db_session.query(WeatherDataDB).one()
+    assert row.dt == datetime(2021, 6, 1, 13, 52, 35)
+    assert row.to_model().dt == 1622555555
+
+
+def test_get_weather_range_and_latest(db_session):
+    insert_weather_data_bulk([
+        WeatherData(city=city, main="Clear", temp=i, feels_like=i, dt=1622505600 + i * 3600)
+        for i in range(48)
+        for city in ("TestCity", "OtherCity")
+    ])
+
+    rows = get_weather_range("TestCity", 1622505600 + 10 * 3600, 1622505600 + 20 * 3600)
+    assert [row.temp for row in rows] == list(range(10, 20))
+    assert {row.city for row in rows} == {"TestCity"}
+
+    latest = get_latest("TestCity")
+    assert latest.temp == 47
+    assert get_latest("Nowhere") is None
+
+
+def test_range_query_uses_city_dt_index(db_session):
+    plan = db_session.execute(text(
+        "EXPLAIN QUERY PLAN SELECT * FROM weather_data WHERE city = 'TestCity' AND dt >= '2021-06-01' AND dt < '2021-06-02'"
+    )).fetchall()
+    assert "ix_weather_data_city_dt" in " ".join(str(row) for row in plan)
+
+
+def test_migrate_weather_data_schema_adds_dt_and_leaves_old_rows_undated(tmp_path):
+    legacy = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with legacy.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE weather_data (id INTEGER PRIMARY KEY, city VARCHAR, main VARCHAR, temp FLOAT, feels_like FLOAT)"
+        ))
+        conn.execute(text("INSERT INTO weather_data (city, main, temp, feels_like) VALUES ('TestCity', 'Clear', 20, 22)"))
+
+    report = migrate_weather_data_schema(legacy)
+    assert report == {"added_columns": ["humidity", "dt"], "undated": 1, "created_index": True}
+    assert "ix_weather_data_city_dt" in {index["name"] for index in inspect(legacy).get_indexes("weather_data")}
+    with legacy.connect() as conn:
+        assert conn.execute(text("SELECT dt FROM weather_data")).scalar() is None
+        # Undated rows are in no time range, bounded or not
+        assert conn.execute(weather_frame_query()).all() == []
+
+    assert migrate_weather_data_schema(legacy) == {"added_columns": [], "undated": 1, "created_index": False}
+
+
+def seed_series(city="TestCity", start=1622505600, n=30 * 288, step=300):
+    insert_weather_data_bulk([
+        WeatherData(city=city, main="Clear", temp=(i % 288) / 10, feels_like=i % 7, humidity=i % 100, dt=start + i * step)
+        for i in range(n)
+    ])
+    return start, start + n * step
+
+
+def test_load_downsampled_series(db_session):
+    start, end = seed_series()
+    seed_series(city="OtherCity", n=10)
+
+    df = load_downsampled_series("TestCity", start, end, max_points=100)
+    assert 0 < len(df) <= 100
+    assert df["count"].sum() == 30 * 288
+    assert df["bucket"].is_monotonic_increasing
+    assert df["temp_min"].min() == 0
+    assert df["temp_max"].max() == pytest.approx(28.7)
+    assert (df["temp_min"] <= df["temp"]).all() and (df["temp"] <= df["temp_max"]).all()
+
+    raw = load_downsampled_series("TestCity", start, start + 3600, max_points=1000)
+    assert list(raw["count"]) == [1] * 12
+
+
+def test_load_downsampled_series_vectorized_fallback(db_session, monkeypatch):
+    import data.database as database
+
+    start, end = seed_series(n=2000)
+    in_sql = load_downsampled_series("TestCity", start, end, max_points=50)
+    monkeypatch.setattr(database, "_epoch_seconds", lambda column, dialect: None)
+    vectorized = load_downsampled_series("TestCity", start, end, max_points=50)
+
+    assert list(vectorized["bucket"]) == list(in_sql["bucket"])
+    assert list(vectorized["count"]) == list(in_sql["count"])
+    assert vectorized["temp"].tolist() == pytest.approx(in_sql["temp"].tolist())
+
+
+def test_load_downsampled_frame_matches_per_city_series(db_session, monkeypatch):
+    import data.database as database
+
+    start, end = seed_series(n=2000)
+    seed_series(city="OtherCity", n=1000)
+    frame = database.load_downsampled_frame(["TestCity", "OtherCity"], start, end, max_points=50)
+    assert list(frame.columns) == database.DOWNSAMPLED_FRAME_COLUMNS
+    assert list(frame["city"].unique()) == ["OtherCity", "TestCity"]
+    for city in ("TestCity", "OtherCity"):
+        series = load_downsampled_series(city, start, end, max_points=50)
+        rows = frame[frame["city"] == city]
+        assert list(rows["bucket"]) == list(series["bucket"])
+        assert rows["temp"].tolist() == pytest.approx(series["temp"].tolist())
+
+    monkeypatch.setattr(database, "_epoch_seconds", lambda column, dialect: None)
+    vectorized = database.load_downsampled_frame(["TestCity", "OtherCity"], start, end, max_points=50)
+    assert vectorized["city"].tolist() == frame["city"].tolist()
+    assert vectorized["count"].tolist() == frame["count"].tolist()
+
+
+def test_bucket_window_end_rounds_up_to_whole_buckets():
+    # One day in at most 10 points: 8640-second buckets
+    start = 1622505600
+    assert bucket_window_end(1, 10, now=start).timestamp() == start
+    assert bucket_window_end(1, 10, now=start + 1) == bucket_window_end(1, 10, now=start + 8640)
+    assert bucket_window_end(1, 10, now=start + 1).timestamp() == start + 8640
+    assert bucket_window_end(1, 10, now=start + 8641).timestamp() == start + 2 * 8640
@@ -1,69 +1,248 @@
+import os
+import subprocess
+import sys
+import time
+
 import pytest
 from fastapi.testclient import TestClient
-from main import app, get_weather_api, get_alert_service
-from datetime import datetime
 
-client = TestClient(app)
+from config.settings import Settings
+from data import database
+from data.database import Base, engine, insert_weather_data_bulk
+from main import create_app
+from models.alert import Alert
+from models.weather_data import WeatherData
+
 
 @pytest.fixture
-def mock_weather_api(mocker):
-    mock_api = mocker.Mock()
-    mock_api.get_current_weather.return_value = {
-        "city": "TestCity",
-        "temperature": 25,
-        "feels_like": 26,
-        "humidity": 60,
-        "description": "Sunny"
-    }
-    mocker.patch('main.get_weather_api', return_value=mock_api)
-    return mock_api
+def client():
+    # A fresh app per test on empty tables, so rules and alerts do not leak between
+    # tests; the lifespan builds the services but the polling job stays off
+    Base.metadata.drop_all(bind=engine)
+    app = create_app(Settings(POLL_ENABLED=False, CHART_RENDER_WORKERS=0))
+    with TestClient(app) as client:
+        yield client
+
 
 @pytest.fixture
-def mock_alert_service(mocker):
-    mock_service = mocker.Mock()
-    mock_service.get_alerts.return_value = ["Alert 1", "Alert 2"]
-    mock_service.get_daily_summary.return_value = {
-        "avg_temp": 22.5,
-        "max_temp": 25,
-        "min_temp": 20,
-        "dominant_condition": "Sunny"
-    }
-    mocker.patch('main.get_alert_service', return_value=mock_service)
-    return mock_service
+def services(client):
+    return client.app.state.services
+
+
+@pytest.fixture
+def mock_weather_service(services, monkeypatch):
+    async def get_cached_weather(city):
+        return WeatherData(city=city, main="Clear", temp=25, feels_like=26, humidity=60, dt=1622555555)
+
+    monkeypatch.setattr(services.weather_service, "get_cached_weather", get_cached_weather)
+    return services.weather_service
+
+
+@pytest.fixture
+def alert_service(services):
+    return services.alert_service
+
 
-def test_read_main():
+def test_read_main(client):
     response = client.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Weather Monitoring System API"}
 
-def test_get_current_weather(mock_weather_api):
+
+def test_get_current_weather(client, mock_weather_service):
     response = client.get("/current-weather/TestCity")
     assert response.status_code == 200
     assert response.json() == {
         "city": "TestCity",
-        "temperature": 25,
-        "feels_like": 26,
-        "humidity": 60,
-        "description": "Sunny"
+        "main": "Clear",
+        "temp": 25.0,
+        "feels_like": 26.0,
+        "humidity": 60.0,
+        "dt": 1622555555,
     }
+    imperial = client.get("/current-weather/TestCity", params={"units": "imperial"}).json()
+    assert (imperial["temp"], imperial["feels_like"], imperial["humidity"]) == pytest.approx((77, 78.8, 60))
+    assert client.get("/current-weather/TestCity", params={"units": "rankine"}).status_code == 422
+
 
-def test_get_daily_summary(mock_alert_service):
+def test_get_daily_summary(client, services, monkeypatch):
+    summary = {"avg_temp": 22.5, "max_temp": 25, "min_temp": 20, "dominant_condition": "Sunny"}
+    monkeypatch.setattr(services.weather_analyzer, "get_daily_summary", lambda city: summary)
     response = client.get("/daily-summary/TestCity")
     assert response.status_code == 200
-    assert response.json() == {
-        "avg_temp": 22.5,
-        "max_temp": 25,
-        "min_temp": 20,
-        "dominant_condition": "Sunny"
-    }
+    assert response.json() == summary
 
-def test_set_alert_threshold(mock_alert_service):
-    response = client.post("/set-alert-threshold", json={"threshold": 30, "city": "TestCity"})
+
+def test_set_alert_threshold(client, alert_service):
+    response = client.post("/set-alert-threshold", params={"threshold": 30, "city": "TestCity"})
     assert response.status_code == 200
-    assert response.json() == {"message": "Alert threshold set to 30°C for TestCity"}
-    mock_alert_service.set_threshold.assert_called_once_with(30, "TestCity")
+    assert response.json() == {"message": "Alert threshold set to 30.0°C for TestCity"}
+    assert alert_service.thresholds == {"TestCity": 30}
+    assert [rule["id"] for rule in client.get("/alert-rules").json()] == ["threshold:TestCity"]
+
 
-def test_get_alerts(mock_alert_service):
+def test_get_alerts(client, alert_service):
+    alert_service.record_alerts([
+        Alert(rule_id="threshold:TestCity", city="TestCity", metric="temp", operator=">",
+              threshold=30, value=31 + i, main="Clear", dt=1622555555 + i)
+        for i in range(2)
+    ])
     response = client.get("/alerts/TestCity")
     assert response.status_code == 200
-    assert response.json() == ["Alert 1", "Alert 2"]
\ No newline at end of file
+    assert [alert["value"] for alert in response.json()] == [31, 32]
+
+
+def test_delete_unknown_alert_rule(client, alert_service):
+    assert client.delete("/alert-rules/nope").status_code == 404
+
+
+def test_metrics_endpoint(client):
+    client.get("/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/",status="200"}' in response.text
+
+
+def test_history_range_reads_database(client):
+    insert_weather_data_bulk([
+        WeatherData(city="TestCity", main="Clear", temp=20 + i, feels_like=21, dt=1622555555 + 300 * i)
+        for i in range(10)
+    ])
+    response = client.get("/history/TestCity", params={"start": 1622555555 + 300, "end": 1622555555 + 1500})
+    assert response.status_code == 200
+    assert [row["temp"] for row in response.json()] == [21, 22, 23, 24]
+    params = {"start": 1622555555, "end": 1622555555 + 600, "units": "standard"}
+    assert [row["temp"] for row in client.get("/history/TestCity", params=params).json()] == [293.15, 294.15]
+    assert client.get("/db-stats").json()["dialect"] == "sqlite"
+
+
+def test_import_has_no_side_effects(tmp_path):
+    # In a fresh interpreter: importing the app loads neither pandas nor matplotlib
+    # and does not touch the database; the lifespan does that
+    db_path = tmp_path / "untouched.db"
+    code = "import sys, main; print([m for m in ('pandas', 'matplotlib') if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env={**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"},
+    )
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+    assert not db_path.exists()
+
+
+def test_lifespan_creates_tables(client):
+    from sqlalchemy import inspect
+
+    assert {"weather_data", "daily_weather_summary", "alerts", "shared_state"} <= set(inspect(engine).get_table_names())
+
+
+def test_chart_compare(client):
+    insert_weather_data_bulk([
+        WeatherData(city=city, main="Clear", temp=20 + i, feels_like=21, humidity=50, dt=1622555555 + 300 * i)
+        for city in ("A", "B")
+        for i in range(10)
+    ])
+    services = client.app.state.services
+    services.settings.CHART_COMPARE_MAX_CITIES = 2
+    params = {"cities": "A,B", "days": 3660, "format": "json"}
+    response = client.get("/chart/compare", params=params)
+    assert response.status_code == 200
+    series = response.json()["series"]
+    assert list(series) == ["A", "B"]
+    assert sum(len(city["v"]) for city in series.values()) > 0
+    assert client.get("/chart/compare", params=params, headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+
+    fahrenheit = client.get("/chart/compare", params={**params, "units": "imperial"}).json()
+    assert fahrenheit["units"] == "imperial"
+    assert fahrenheit["series"]["A"]["v"] == pytest.approx([v * 1.8 + 32 for v in series["A"]["v"]], abs=0.01)
+
+    svg = client.get("/chart/compare", params={**params, "format": "svg", "metric": "humidity"})
+    assert svg.headers["content-type"] == "image/svg+xml"
+    assert client.get("/chart/compare", params={**params, "cities": "A,B,C"}).status_code == 422
+
+
+def test_batch_endpoints(client, services, alert_service, monkeypatch):
+    calls = []
+
+    async def get_current_weather(city):
+        calls.append(city)
+        if city == "Nowhere":
+            raise ValueError("city not found")
+        return WeatherData(city=city, main="Clear", temp=25, feels_like=26, humidity=60, dt=1622555555)
+
+    monkeypatch.setattr(services.weather_service, "get_current_weather", get_current_weather)
+    body = {"cities": ["A", "B", "A", "Nowhere"]}
+    response = client.post("/batch/current", json=body)
+    assert response.status_code == 200
+    assert list(response.json()["results"]) == ["A", "B"]
+    assert response.json()["errors"] == {"Nowhere": "city not found"}
+    # The second batch is served from the cache, except for the city that failed
+    client.post("/batch/current", json=body)
+    assert sorted(calls) == ["A", "B", "Nowhere", "Nowhere"]
+
+    now = int(time.time())
+    insert_weather_data_bulk([WeatherData(city="A", main="Rain", temp=t, feels_like=t, dt=now) for t in (10, 20)])
+    response = client.post("/batch/summary", json={"cities": ["A", "B"]})
+    assert response.json()["results"]["A"]["avg_temp"] == 15
+    assert list(response.json()["errors"]) == ["B"]
+
+    alert_service.record_alerts([Alert(rule_id="r", city="A", metric="temp", operator=">", threshold=0,
+                                       value=1, main="Clear", dt=now)])
+    response = client.post("/batch/alerts", json={"cities": ["A", "B"]})
+    assert {city: len(alerts) for city, alerts in response.json()["results"].items()} == {"A": 1, "B": 0}
+
+    services.settings.BATCH_MAX_CITIES = 2
+    assert client.post("/batch/alerts", json={"cities": ["A", "B", "C"]}).status_code == 422
+    assert client.post("/batch/alerts", json={"cities": []}).status_code == 422
+
+
+def test_units_on_store_history_and_summary(client, services):
+    now = int(time.time())
+    observations = [WeatherData(city="A", main="Clear", temp=t, feels_like=t, humidity=50, dt=now + t) for t in (10, 20)]
+    services.observation_store.extend(observations)
+    insert_weather_data_bulk(observations)
+
+    history = client.get("/history/A", params={"units": "imperial"}).json()
+    assert [row["temp"] for row in history] == [50, 68]
+    assert [row["temp"] for row in client.get("/history/A").json()] == [10, 20]
+
+    summary = client.get("/summary", params={"cities": "A", "units": "standard"}).json()["A"][0]
+    assert (summary["min_temp"], summary["max_temp"], summary["count"]) == (283.15, 293.15, 2)
+    daily = client.get("/daily-summary/A", params={"units": "imperial"}).json()
+    assert daily["avg_temp"] == pytest.approx(59)
+
+
+def test_temperature_chart_units(client):
+    insert_weather_data_bulk([
+        WeatherData(city="A", main="Clear", temp=20 + i, feels_like=21, humidity=50, dt=int(time.time()) - 300 * i)
+        for i in range(10)
+    ])
+    celsius = client.get("/chart/temperature/A")
+    fahrenheit = client.get("/chart/temperature/A", params={"units": "imperial"})
+    assert celsius.status_code == fahrenheit.status_code == 200
+    assert fahrenheit.headers["content-type"] == "image/png"
+    assert celsius.headers["etag"] != fahrenheit.headers["etag"]
+    # Humidity does not depend on the units: same chart, same ETag
+    humidity = [client.get("/chart/humidity/A", params={"units": units}).headers["etag"] for units in ("metric", "standard")]
+    assert humidity[0] == humidity[1]
+
+
+def test_chart_etags_are_stable_within_a_bucket(client, monkeypatch):
+    insert_weather_data_bulk([
+        WeatherData(city=city, main="Clear", temp=20 + i, feels_like=21, humidity=50, dt=int(time.time()) - 300 * i)
+        for city in ("A", "B")
+        for i in range(10)
+    ])
+    client.app.state.services.settings.CHART_COMPARE_MAX_CITIES = 2
+    # Two requests a minute apart, inside the same 8640-second bucket
+    bucket_start = int(time.time()) // 8640 * 8640 + 1
+    etags = {"/chart/temperature/A": [], "/chart/compare": []}
+    for now in (bucket_start, bucket_start + 60):
+        monkeypatch.setattr(database.time, "time", lambda: now)
+        for path, seen in etags.items():
+            params = {"days": 1, "points": 10, **({"cities": "A,B"} if path == "/chart/compare" else {})}
+            response = client.get(path, params=params)
+            assert response.status_code == 200
+            seen.append(response.headers["etag"])
+    assert all(first == second for first, second in etags.values())
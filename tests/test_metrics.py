@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from services.scheduler import PollingScheduler
+from utils import metrics
+from utils.metrics import MetricsMiddleware, Registry, cache_samples, instrument_engine
+from services.cache import TTLCache
+
+
+def parse(body: str) -> dict:
+    # metric line -> value, ignoring HELP/TYPE comments
+    values = {}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            values[name] = float(value.replace("+Inf", "inf"))
+    return values
+
+
+def test_counter_and_gauge_render():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    requests.inc(route="/a")
+    requests.inc(2, route="/a")
+    requests.inc(route='/b"x')
+    registry.gauge("temperature", "Temperature").set(21.5)
+
+    body = registry.render()
+    assert "# TYPE requests_total counter" in body
+    assert parse(body) == {
+        'requests_total{route="/a"}': 3,
+        'requests_total{route="/b\\"x"}': 1,
+        "temperature": 21.5,
+    }
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ["route"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, route="/a")
+
+    values = parse(registry.render())
+    assert values['latency_seconds_bucket{route="/a",le="0.1"}'] == 2
+    assert values['latency_seconds_bucket{route="/a",le="1"}'] == 3
+    assert values['latency_seconds_bucket{route="/a",le="+Inf"}'] == 4
+    assert values['latency_seconds_count{route="/a"}'] == 4
+    assert values['latency_seconds_sum{route="/a"}'] == pytest.approx(3.65)
+
+
+def test_labels_must_match_definition():
+    registry = Registry()
+    requests = registry.counter("requests_total", "Requests", ["route"])
+    with pytest.raises(ValueError):
+        requests.inc(city="Delhi")
+    assert registry.counter("requests_total", "Requests", ["route"]) is requests
+    with pytest.raises(ValueError):
+        registry.gauge("requests_total", "Requests", ["route"])
+
+
+def test_collectors_and_cache_samples():
+    registry = Registry()
+    cache = TTLCache()
+    cache.set("Delhi", 1)
+
+    async def lookups():
+        await cache.get_or_fetch("Delhi", None)
+        await cache.get_or_fetch("Pune", lambda: asyncio.sleep(0, 2))
+
+    asyncio.run(lookups())
+    registry.register_collector("caches", lambda: cache_samples({"weather": cache}))
+    registry.register_collector("broken", lambda: 1 / 0)
+
+    values = parse(registry.render())
+    assert values['cache_hits_total{cache="weather"}'] == 1
+    assert values['cache_misses_total{cache="weather"}'] == 1
+    assert values['cache_hit_ratio{cache="weather"}'] == 0.5
+
+
+def test_instrument_engine_times_statements_and_transactions():
+    registry = Registry()
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, registry)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (x INTEGER)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        conn.execute(text("SELECT x FROM t")).all()
+
+    queries = registry.get("db_query_seconds")
+    assert queries.count(operation="INSERT") == 1
+    assert queries.count(operation="SELECT") == 1
+    assert registry.get("db_transaction_seconds").count(outcome="commit") == 1
+
+
+def test_middleware_records_route_templates():
+    registry = Registry()
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware, registry=registry)
+
+    @app.get("/weather/{city}")
+    async def weather(city: str):
+        if city == "Nowhere":
+            raise HTTPException(status_code=404)
+        return {"city": city}
+
+    client = TestClient(app)
+    for city in ("Delhi", "Pune", "Nowhere"):
+        client.get(f"/weather/{city}")
+    client.get("/missing")
+
+    requests = registry.get("http_requests_total")
+    assert requests.value(method="GET", route="/weather/{city}", status="200") == 2
+    assert requests.value(method="GET", route="/weather/{city}", status="404") == 1
+    assert requests.value(method="GET", route="<unmatched>", status="404") == 1
+    assert registry.get("http_request_duration_seconds").count(method="GET", route="/weather/{city}") == 3
+
+
+def test_scheduler_cycles_are_recorded():
+    async def failing_job():
+        raise RuntimeError("boom")
+
+    cycles = metrics.REGISTRY.get("poll_cycles_total")
+    before = cycles.value(job="test_metrics_job", outcome="failed")
+    scheduler = PollingScheduler(failing_job, interval=60, job_id="test_metrics_job")
+    asyncio.run(scheduler._run_cycle())
+    assert cycles.value(job="test_metrics_job", outcome="failed") == before + 1
+    assert metrics.REGISTRY.get("poll_cycle_seconds").count(job="test_metrics_job") >= 1
@@ -0,0 +1,50 @@
+import threading
+import time
+
+from utils.profiler import SamplingProfiler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profiler_samples_running_threads():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    worker.start()
+    profiler = SamplingProfiler(interval=0.001)
+    try:
+        assert profiler.start()
+        assert not profiler.start()  # already running
+        time.sleep(0.2)
+        folded = profiler.stop()
+    finally:
+        stop.set()
+        worker.join()
+
+    assert profiler.samples > 0
+    assert not profiler.running
+    busy = [line for line in folded.splitlines() if line.startswith("busy;")]
+    assert busy and all(":busy_loop:" in line for line in busy)
+    # Folded format: stack, a space, the sample count
+    stack, count = busy[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert "sampling-profiler" not in folded
+
+
+def test_profiler_stops_after_max_duration():
+    profiler = SamplingProfiler(interval=0.001, max_duration=0.05)
+    profiler.start()
+    time.sleep(0.3)
+    assert not profiler.running
+    assert profiler.stats()["stopped_at"] is not None
+
+
+def test_restart_clears_previous_samples():
+    profiler = SamplingProfiler(interval=10)
+    profiler.sample()
+    assert profiler.samples == 1
+    profiler.start()
+    assert profiler.stop() == ""
+    assert profiler.stats()["samples"] == 0
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from models.weather_data import WeatherData
+from services.pubsub import PubSub, sse_stream
+
+
+def make_weather(city, temp=30.0, dt=1622555555):
+    return WeatherData(city=city, main="Clear", temp=temp, feels_like=temp + 1, humidity=50, dt=dt)
+
+
+def test_publish_routes_by_topic_and_wildcard():
+    async def run():
+        pubsub = PubSub()
+        delhi = pubsub.subscribe(["Delhi"])
+        both = pubsub.subscribe(["Delhi", "Mumbai"])
+        everything = pubsub.subscribe()
+        assert pubsub.publish("Delhi", "observation", make_weather("Delhi")) == 3
+        assert pubsub.publish("Mumbai", "observation", make_weather("Mumbai")) == 2
+        assert pubsub.publish("Pune", "observation", make_weather("Pune")) == 1
+        return pubsub, delhi, both, everything
+
+    pubsub, delhi, both, everything = asyncio.run(run())
+
+    assert [m.topic for m in delhi.queue] == ["Delhi"]
+    assert [m.topic for m in both.queue] == ["Delhi", "Mumbai"]
+    assert [m.topic for m in everything.queue] == ["Delhi", "Mumbai", "Pune"]
+    # Encoded once and shared by every subscriber
+    assert delhi.queue[0] is everything.queue[0]
+    assert json.loads(delhi.queue[0].data)["temp"] == 30.0
+    assert pubsub.stats()["delivered"] == 6
+
+
+def test_slow_subscriber_drops_oldest():
+    async def run():
+        pubsub = PubSub(queue_size=3)
+        slow = pubsub.subscribe(["Delhi"])
+        for dt in range(10):
+            pubsub.publish("Delhi", "observation", make_weather("Delhi", dt=dt))
+        return pubsub, slow
+
+    pubsub, slow = asyncio.run(run())
+
+    assert [json.loads(m.data)["dt"] for m in slow.queue] == [7, 8, 9]
+    assert slow.dropped == 7
+    assert pubsub.stats()["dropped"] == 7
+
+
+def test_get_waits_for_messages_and_times_out():
+    async def run():
+        pubsub = PubSub()
+        subscription = pubsub.subscribe(["Delhi"])
+        idle = await subscription.get(timeout=0.01)
+        waiter = asyncio.ensure_future(subscription.get(timeout=1))
+        await asyncio.sleep(0)
+        pubsub.publish("Delhi", "alert", {"city": "Delhi"})
+        return idle, await waiter
+
+    idle, message = asyncio.run(run())
+
+    assert idle is None
+    assert message.event == "alert"
+
+
+def test_sse_stream_formats_events_and_unsubscribes():
+    async def run():
+        pubsub = PubSub()
+        stream = sse_stream(pubsub, ["Delhi"], keepalive=0.01)
+        assert len(pubsub) == 0  # nothing is subscribed until the stream is iterated
+        chunks = [await stream.__anext__()]
+        assert len(pubsub) == 1
+        chunks.append(await stream.__anext__())  # idle -> keepalive comment
+        pubsub.publish("Delhi", "observation", make_weather("Delhi"))
+        chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return pubsub, chunks
+
+    pubsub, chunks = asyncio.run(run())
+
+    assert chunks[0].startswith(":") and chunks[1] == ": keepalive\n\n"
+    event, data = chunks[2].strip().split("\n")
+    assert event == "event: observation"
+    assert json.loads(data[len("data: "):])["city"] == "Delhi"
+    assert len(pubsub) == 0
+
+
+async def drain(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_close_ends_every_stream():
+    async def run():
+        pubsub = PubSub()
+        stream = sse_stream(pubsub, None, keepalive=10)
+        await stream.__anext__()
+        rest = asyncio.ensure_future(asyncio.wait_for(drain(stream), 1))
+        await asyncio.sleep(0)
+        pubsub.close()
+        return pubsub, await rest, pubsub.subscribe(["Delhi"])
+
+    pubsub, rest, late = asyncio.run(run())
+
+    assert rest == []
+    assert len(pubsub) == 0
+    assert late.closed and pubsub.publish("Delhi", "alert", {}) == 0
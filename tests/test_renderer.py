@@ -0,0 +1,98 @@
+import asyncio
+import pandas as pd
+import pytest
+from visualization.renderer import ChartRenderer, data_version, render_png
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+
+
+def make_frame(city="TestCity", temperatures=(25, 26, 27)):
+    return pd.DataFrame({
+        "timestamp": pd.date_range("2025-02-20 10:00", periods=len(temperatures), freq="h"),
+        "city": [city] * len(temperatures),
+        "temperature": list(temperatures),
+        "humidity": [30 + i for i in range(len(temperatures))],
+    })
+
+
+def test_render_png_without_pyplot():
+    png = render_png("humidity", make_frame(), city="TestCity")
+    assert png.startswith(PNG_MAGIC)
+
+
+def test_data_version_tracks_content():
+    assert data_version(make_frame()) == data_version(make_frame())
+    assert data_version(make_frame()) != data_version(make_frame(temperatures=(25, 26, 28)))
+
+
+def test_renders_are_cached_per_data_version():
+    renderer = ChartRenderer(workers=0)
+
+    async def run():
+        first = await asyncio.gather(*(renderer.render("temperature", "TestCity", make_frame()) for _ in range(5)))
+        again = await renderer.render("temperature", "TestCity", make_frame())
+        changed = await renderer.render("temperature", "TestCity", make_frame(temperatures=(1, 2, 3)))
+        return first, again, changed
+
+    try:
+        first, again, changed = asyncio.run(run())
+    finally:
+        renderer.shutdown()
+
+    assert renderer.renders == 2
+    assert {etag for _, etag in first} == {again[1]}
+    assert again[0] == first[0][0]
+    assert changed[1] != again[1]
+
+
+def test_render_in_process_pool():
+    renderer = ChartRenderer(workers=1)
+    try:
+        png, etag = asyncio.run(renderer.render("temperature", "TestCity", make_frame()))
+    finally:
+        renderer.shutdown()
+    assert png.startswith(PNG_MAGIC)
+    assert etag.startswith('"')
+
+
+def test_unknown_chart():
+    with pytest.raises(ValueError):
+        asyncio.run(ChartRenderer(workers=0).render("pressure", "TestCity", make_frame()))
+
+
+def make_cities_frame(cities=("B", "A", "C"), points=5):
+    # Interleaved and unsorted, as a careless caller might pass it
+    frame = pd.concat([make_frame(city, [10 * i + p for p in range(points)]) for i, city in enumerate(cities)])
+    return frame.sample(frac=1, random_state=0).reset_index(drop=True)
+
+
+def test_comparison_series_single_pass():
+    from visualization.series import comparison_series, series_payload
+
+    df = make_cities_frame()
+    df["timestamp"] = df["timestamp"].astype(str)
+    before = df.copy()
+    series = comparison_series(df, "temperature", ["C", "A", "missing"])
+    assert df.equals(before)
+    assert list(series) == ["C", "A"]
+    assert series["C"][1].tolist() == [20, 21, 22, 23, 24]
+    assert (series["A"][0][1:] > series["A"][0][:-1]).all()
+
+    reduced = comparison_series(make_cities_frame(points=10), "temperature", max_points=3)
+    assert list(reduced) == ["A", "B", "C"]
+    assert reduced["B"][1].tolist() == [1.5, 5.5, 8.5]
+    payload = series_payload(reduced)
+    assert payload["B"]["t"][0] == int(pd.Timestamp("2025-02-20 10:00").timestamp())
+
+
+def test_render_comparison_chart_formats():
+    renderer = ChartRenderer(workers=0)
+    options = {"metric": "temperature", "cities": ["A", "B", "C"]}
+    try:
+        png, png_etag = asyncio.run(renderer.render("compare", "A,B,C", make_cities_frame(), options=options))
+        svg, svg_etag = asyncio.run(renderer.render("compare", "A,B,C", make_cities_frame(), fmt="svg", options=options))
+    finally:
+        renderer.shutdown()
+    assert png.startswith(PNG_MAGIC)
+    assert b"<svg" in svg[:500]
+    assert png_etag != svg_etag
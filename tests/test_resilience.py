@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from services.resilience import (
+    CircuitBreaker, TokenBucket, UpstreamError, backoff_delay, parse_retry_after,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_allows_burst_then_paces():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2.0, capacity=3, clock=clock)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # Waiting callers queue up behind each other at 1 / rate seconds apart
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)
+    clock.now = 10.0
+    assert bucket.reserve() == 0.0
+    assert bucket.tokens == pytest.approx(2.0)  # refill is capped at capacity
+
+
+def test_token_bucket_disabled_and_async_acquire():
+    assert TokenBucket(rate=0, capacity=1).reserve() == 0.0
+
+    bucket = TokenBucket(rate=100.0, capacity=1)
+
+    async def run():
+        return [await bucket.acquire() for _ in range(3)]
+
+    waits = asyncio.run(run())
+    assert waits[0] == 0.0 and waits[1] > 0
+    assert bucket.waits == 2
+
+
+def test_backoff_delay_is_jittered_and_capped():
+    assert backoff_delay(0, 0.5, 30, rng=lambda: 1.0) == 0.5
+    assert backoff_delay(3, 0.5, 30, rng=lambda: 1.0) == 4.0
+    assert backoff_delay(10, 0.5, 30, rng=lambda: 1.0) == 30
+    assert backoff_delay(3, 0.5, 30, rng=lambda: 0.25) == 1.0
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") is None
+
+
+def test_upstream_error_retryable():
+    assert UpstreamError("timeout").retryable
+    assert UpstreamError("throttled", status=429).retryable
+    assert UpstreamError("down", status=503).retryable
+    assert not UpstreamError("no such city", status=404).retryable
+
+
+def test_circuit_breaker_opens_half_opens_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.retry_in() == 30
+
+    clock.now = 30
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+    assert not breaker.allow()  # only one trial request at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_circuit_breaker_release_frees_the_trial_slot():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock)
+    breaker.record_failure()
+    clock.now = 30
+    assert breaker.allow() and not breaker.allow()
+    breaker.release()
+    assert breaker.state == "half_open" and breaker.allow()
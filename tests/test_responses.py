@@ -0,0 +1,84 @@
+import gzip
+from datetime import datetime, timezone
+
+import numpy as np
+import orjson
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from models.weather_data import WeatherData
+from utils import responses
+from utils.responses import EncodedJSON, dumps, json_response, negotiate_encoding
+
+
+def make_weather(i):
+    return WeatherData(city="Delhi", main="Clear", temp=20.0 + i, feels_like=21.0, humidity=50, dt=1622555555 + i)
+
+
+def test_dumps_handles_models_numpy_and_datetimes():
+    content = {
+        "observations": [make_weather(0)],
+        "mean": np.float32(1.5),
+        "temps": np.array([1.0, 2.0]),
+        "at": datetime(2021, 6, 1, tzinfo=timezone.utc),
+        1: "non-str key",
+    }
+    decoded = orjson.loads(dumps(content))
+    assert decoded["observations"][0]["temp"] == 20.0
+    assert decoded["mean"] == 1.5
+    assert decoded["temps"] == [1.0, 2.0]
+    assert decoded["at"] == "2021-06-01T00:00:00+00:00"
+    assert decoded["1"] == "non-str key"
+
+
+def test_negotiate_encoding(monkeypatch):
+    assert negotiate_encoding(None) is None
+    assert negotiate_encoding("identity") is None
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0, deflate") is None
+    # An explicit refusal is not overridden by the wildcard
+    assert negotiate_encoding("gzip;q=0, *") == ("br" if responses.brotli is not None else None)
+    assert negotiate_encoding("gzip;q=0, br;q=0, *") is None
+    assert negotiate_encoding("*;q=0, gzip") == "gzip"
+    if responses.brotli is not None:
+        assert negotiate_encoding("gzip, br") == "br"
+    monkeypatch.setattr(responses, "brotli", None)
+    assert negotiate_encoding("gzip, br") == "gzip"
+    assert negotiate_encoding("br") is None
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding("gzip;q=0, *") is None
+
+
+def test_encoded_json_compresses_once():
+    payload = EncodedJSON([make_weather(i) for i in range(100)])
+    compressed = payload.encoded("gzip")
+    assert payload.encoded("gzip") is compressed
+    assert orjson.loads(gzip.decompress(compressed)) == orjson.loads(payload.body)
+    assert payload.encoded(None) is payload.body
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/bulk")
+    async def bulk(request: Request, n: int = 100):
+        return json_response(request, [make_weather(i) for i in range(n)], min_size=1024)
+
+    return TestClient(app)
+
+
+def test_json_response_compresses_above_threshold(client):
+    response = client.get("/bulk", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert len(response.json()) == 100
+
+    small = client.get("/bulk?n=1", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    assert small.json()[0]["city"] == "Delhi"
+
+    plain = client.get("/bulk", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.json() == response.json()
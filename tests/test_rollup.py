@@ -0,0 +1,197 @@
+import asyncio
+import json
+from datetime import date, datetime
+
+import pytest
+
+from data import async_database, database
+from data.async_database import AsyncDatabase
+from data.database import (
+    Base, DailyRollupDB, HourlyRollupDB, WeatherDataDB, engine, get_rollup_coverage, insert_weather_data_bulk,
+    load_downsampled_frame, load_downsampled_series, plan_levels, DATABASE_URL,
+)
+from data.rollup import DAY, HOUR, Compactor
+from models.weather_data import WeatherData
+from utils.weather_analyzer import WeatherAnalyzer
+
+START = 1622505600  # 2021-06-01 00:00 UTC
+DAYS = 10
+END = START + DAYS * DAY
+CONDITIONS = ["Clear", "Clouds", "Rain"]
+
+
+@pytest.fixture
+def seeded():
+    # Fresh tables in the SQLite test database (see conftest.py), ten days of 5-minute data
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    insert_weather_data_bulk([
+        WeatherData(city=city, main=CONDITIONS[i % 7 % 3], temp=(i % 288) / 10 + offset, feels_like=i % 11,
+                    humidity=None if i % 5 == 0 else i % 100, dt=START + i * 300)
+        for offset, city in enumerate(("TestCity", "OtherCity"))
+        for i in range(DAYS * 288)
+    ])
+
+
+def count(model) -> int:
+    with engine.connect() as conn:
+        return conn.execute(database.select(database.func.count()).select_from(model)).scalar()
+
+
+def test_plan_levels():
+    assert plan_levels(START, END, 300, {}) == [("raw", START, END)]
+    assert plan_levels(START, END, DAY, {}) == [("raw", START, END)]
+
+    coverage = {"raw_from": START + 3 * DAY, "hourly_from": START + DAY, "hourly_until": START + 8 * DAY + 5 * HOUR,
+                "daily_until": START + 8 * DAY}
+    # Daily buckets: daily rollups, then hourly and raw for what is not rolled up yet
+    assert plan_levels(START, END, DAY, coverage) == [
+        ("daily", START, START + 8 * DAY), ("hourly", START + 8 * DAY, START + 8 * DAY + 5 * HOUR),
+        ("raw", START + 8 * DAY + 5 * HOUR, END),
+    ]
+    # Hourly buckets: daily where hourly rows have expired
+    assert plan_levels(START, END, 2 * HOUR, coverage) == [
+        ("daily", START, START + DAY), ("hourly", START + DAY, START + 8 * DAY + 5 * HOUR),
+        ("raw", START + 8 * DAY + 5 * HOUR, END),
+    ]
+    # Raw resolution: the nearest rollup where raw rows were deleted
+    assert plan_levels(START, END, 300, coverage) == [
+        ("daily", START, START + DAY), ("hourly", START + DAY, START + 3 * DAY), ("raw", START + 3 * DAY, END),
+    ]
+    assert plan_levels(START + 5 * DAY, START + 5 * DAY, DAY, coverage) == [("raw", START + 5 * DAY, START + 5 * DAY)]
+
+
+def test_compaction_rolls_up_and_applies_retention(seeded):
+    before = load_downsampled_series("TestCity", START, END, max_points=DAYS)
+    summaries = {day: WeatherAnalyzer().get_daily_summary("TestCity", date(2021, 6, day)) for day in (1, 9)}
+
+    compactor = Compactor(raw_retention_days=3, hourly_retention_days=5, settle=0)
+    stats = compactor.run(now=END + HOUR)
+    assert stats == {"hourly": 2 * DAYS * 24, "daily": 2 * DAYS, "archived": 0,
+                     "raw_deleted": 2 * (DAYS - 3) * 288, "hourly_deleted": 2 * (DAYS - 5) * 24}
+    assert get_rollup_coverage() == {
+        "raw_from": END - 3 * DAY, "hourly_from": END - 5 * DAY, "hourly_until": END + HOUR, "daily_until": END,
+    }
+    assert count(WeatherDataDB) == 2 * 3 * 288
+    assert count(HourlyRollupDB) == 2 * 5 * 24
+
+    # A second run has nothing left to do
+    assert compactor.run(now=END + HOUR) == dict.fromkeys(stats, 0)
+
+    db = database.open_session()
+    try:
+        day = db.get(DailyRollupDB, ("TestCity", datetime(2021, 6, 1)))
+        hour = db.get(HourlyRollupDB, ("TestCity", datetime(2021, 6, 10, 5)))
+    finally:
+        db.close()
+    assert day.count == 288 and hour.count == 12
+    assert (day.temp_min, day.temp_max) == (0, 28.7)
+    assert day.humidity_count == 288 - 288 // 5 - 1
+    assert sum(json.loads(day.conditions).values()) == 288
+    assert set(json.loads(hour.conditions)) <= set(CONDITIONS)
+
+    # Daily buckets are read from the daily rollups, and match the raw rows they replaced
+    after = load_downsampled_series("TestCity", START, END, max_points=DAYS)
+    assert list(after["bucket"]) == list(before["bucket"])
+    assert list(after["count"]) == list(before["count"])
+    for column in ("temp", "temp_min", "temp_max", "feels_like", "humidity"):
+        assert after[column].tolist() == pytest.approx(before[column].tolist())
+
+    # Summaries of days past raw retention come from the daily rollups
+    analyzer = WeatherAnalyzer()
+    for day, summary in summaries.items():
+        assert analyzer.get_daily_summary("TestCity", date(2021, 6, day)) == pytest.approx(summary)
+
+
+def test_summary_reads_expired_days_from_rollups(seeded, monkeypatch):
+    window = (date(2021, 6, 1), date(2021, 6, 11))
+    monkeypatch.setattr(WeatherAnalyzer, "summary_window", staticmethod(lambda days: window))
+    analyzer = WeatherAnalyzer()
+    before = analyzer.get_summary(["TestCity", "OtherCity"], days=DAYS)
+    Compactor(raw_retention_days=3, hourly_retention_days=5, settle=0).run(now=END + HOUR)
+
+    after = analyzer.get_summary(["TestCity", "OtherCity"], days=DAYS)
+    assert [len(after[city]) for city in after] == [DAYS, DAYS]
+    for city, periods in before.items():
+        assert [period["period"] for period in after[city]] == [period["period"] for period in periods]
+        assert [period["count"] for period in after[city]] == [period["count"] for period in periods]
+        for column in ("avg_temp", "max_temp", "min_feels_like", "rolling_avg_temp"):
+            assert [period[column] for period in after[city]] == pytest.approx([period[column] for period in periods])
+
+    # Hourly summaries: hours past raw retention come from the hourly rollups that are left
+    hourly = analyzer.get_summary(["TestCity"], days=DAYS, freq="hourly")["TestCity"]
+    assert len(hourly) == 5 * 24 and sum(period["count"] for period in hourly) == 5 * 288
+
+    async def query():
+        db = AsyncDatabase(DATABASE_URL, pool_size=2, max_overflow=0)
+        try:
+            async for session in db.session():
+                start, end = analyzer.summary_window(DAYS)
+                expired, start = analyzer.split_expired(start, end, await async_database.get_rollup_coverage(session))
+                return expired, start, await async_database.get_rollups(session, "daily", ["TestCity"], *expired)
+        finally:
+            await db.dispose()
+
+    expired, start, rollups = asyncio.run(query())
+    assert expired == (datetime(2021, 6, 1), datetime(2021, 6, 8)) and start == datetime(2021, 6, 8)
+    assert [row.day for row in rollups] == [date(2021, 6, day) for day in range(1, 8)]
+
+
+def test_compaction_is_skipped_where_rollups_are_unsupported(seeded, monkeypatch, caplog):
+    monkeypatch.setattr(database, "_epoch_seconds", lambda column, dialect: None)
+    compactor = Compactor(raw_retention_days=3, settle=0)
+    with caplog.at_level("WARNING", logger="data.rollup"):
+        assert compactor.run(now=END) == dict.fromkeys(
+            ("hourly", "daily", "archived", "raw_deleted", "hourly_deleted"), 0
+        )
+        compactor.run(now=END)
+    assert [record.levelname for record in caplog.records] == ["WARNING"]  # once, not every run
+    assert count(WeatherDataDB) == 2 * DAYS * 288
+
+
+def test_raw_retention_is_opt_in(seeded):
+    stats = Compactor(settle=0).run(now=END + HOUR)
+    assert stats["daily"] == 2 * DAYS and stats["raw_deleted"] == 0
+    assert count(WeatherDataDB) == 2 * DAYS * 288
+
+
+def test_loaders_merge_levels(seeded):
+    window = (END - 4 * DAY, END)
+    before = load_downsampled_frame(["TestCity", "OtherCity"], *window, max_points=4 * 24)
+    # Rolls up part of the last day only, so one hour bucket spans hourly and raw rows
+    Compactor(raw_retention_days=0, hourly_retention_days=0, settle=0).run(now=END - 5 * HOUR)
+    assert get_rollup_coverage()["hourly_until"] == END - 5 * HOUR
+
+    after = load_downsampled_frame(["TestCity", "OtherCity"], *window, max_points=4 * 24)
+    assert after["city"].tolist() == before["city"].tolist()
+    assert after["bucket"].tolist() == before["bucket"].tolist()
+    assert after["count"].tolist() == before["count"].tolist()
+    assert after["temp"].tolist() == pytest.approx(before["temp"].tolist())
+    assert after["humidity"].tolist() == pytest.approx(before["humidity"].tolist())
+
+    # A grid that does not line up with the hours: a bucket straddling the rollup watermark is merged
+    series = load_downsampled_series("TestCity", END - DAY + 1800, END, max_points=7)
+    assert series["bucket"].is_unique and series["count"].sum() == 288 - 6
+
+    async def query():
+        db = AsyncDatabase(DATABASE_URL, pool_size=2, max_overflow=0)
+        try:
+            async for session in db.session():
+                return await async_database.load_downsampled_frame(
+                    session, ["TestCity", "OtherCity"], *window, max_points=4 * 24
+                )
+        finally:
+            await db.dispose()
+
+    assert asyncio.run(query()).equals(after)
+
+
+def test_compaction_archives_raw_rows_before_deleting(seeded, tmp_path):
+    pytest.importorskip("pyarrow")
+    from data.archive import WeatherArchive
+
+    archive = WeatherArchive(str(tmp_path / "archive"))
+    stats = Compactor(raw_retention_days=7, hourly_retention_days=0, archive=archive, settle=0).run(now=END)
+    assert stats["archived"] == stats["raw_deleted"] == 2 * 3 * 288
+    assert archive.covered_until() == date(2021, 6, 4)
+    assert stats["hourly_deleted"] == 0
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from services.scheduler import PollingScheduler
+from tests.fake_owm import FakeOpenWeatherMap, make_service
+
+
+def run_scheduler(job, seconds, **kwargs):
+    async def run():
+        scheduler = PollingScheduler(job, **kwargs)
+        scheduler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            scheduler.shutdown()
+        return scheduler
+
+    return asyncio.run(run())
+
+
+def test_coroutine_job_is_awaited_on_event_loop():
+    calls = []
+
+    async def job():
+        calls.append(asyncio.get_running_loop())
+        await asyncio.sleep(0)
+
+    scheduler = run_scheduler(job, 0.35, interval=0.1, run_immediately=True)
+    assert len(calls) >= 3
+    stats = scheduler.get_stats()
+    assert stats["cycles"] == len(calls)
+    assert stats["failures"] == 0 and stats["skipped"] == 0
+    assert 0 <= stats["last_lag"] < 0.1
+    assert not scheduler.running
+
+
+def test_overrunning_cycle_is_not_overlapped():
+    active = []
+    overlaps = []
+
+    async def slow_job():
+        if active:
+            overlaps.append(True)
+        active.append(True)
+        await asyncio.sleep(0.25)
+        active.pop()
+
+    scheduler = run_scheduler(slow_job, 0.6, interval=0.1, run_immediately=True)
+    assert overlaps == []
+    assert scheduler.stats.skipped >= 2
+    assert scheduler.stats.max_duration >= 0.25
+
+
+def test_failures_are_counted():
+    async def failing_job():
+        raise RuntimeError("upstream down")
+
+    scheduler = run_scheduler(failing_job, 0.05, interval=10, run_immediately=True)
+    assert scheduler.stats.failures == 1
+    assert scheduler.stats.last_error == "upstream down"
+
+
+def test_fetch_requests_are_staggered():
+    cities = [f"City{i}" for i in range(5)]
+
+    async def run():
+        upstream = FakeOpenWeatherMap()
+        base_url = await upstream.start()
+        service = make_service(base_url, cities)
+        try:
+            start = time.perf_counter()
+            results = await service.fetch_weather_data(stagger=0.5)
+            return results, time.perf_counter() - start
+        finally:
+            await service.close()
+            await upstream.stop()
+
+    results, elapsed = asyncio.run(run())
+    assert len(results) == 5
+    # Last request starts 4/5 of the way through the stagger window
+    assert elapsed >= 0.4
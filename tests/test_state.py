@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from data.database import Base, engine
+from models.alert import AlertRule
+from models.weather_data import WeatherData
+from services.alert_service import AlertService
+from services.state import (
+    LeaderElector, MemoryStateBackend, RedisStateBackend, SQLStateBackend, create_state_backend,
+)
+from tests.fake_owm import FakeOpenWeatherMap, make_service
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clean_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture(params=["memory", "sql", "redis"])
+def backend(request, clean_db):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    if request.param == "sql":
+        return SQLStateBackend()
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisStateBackend(client=fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_set_get_items_delete(backend):
+    backend.set("rules", "a", "1")
+    backend.set("rules", "b", "2")
+    backend.set("rules", "a", "3")
+    backend.set("other", "a", "x")
+    assert backend.get("rules", "a") == "3"
+    assert backend.items("rules") == {"a": "3", "b": "2"}
+    assert backend.get_many("rules", ["b", "c", "a"]) == {"b": "2", "a": "3"}
+    backend.delete("rules", "a")
+    assert backend.get("rules", "a") is None
+    assert backend.items("rules") == {"b": "2"}
+    assert backend.get("missing", "a") is None
+
+
+def test_touch_publishes_new_token(backend):
+    assert backend.token("alert_rules") is None
+    first = backend.touch("alert_rules")
+    assert backend.token("alert_rules") == first
+    assert backend.touch("alert_rules") != first
+
+
+def test_lease_is_exclusive_until_released(backend):
+    assert backend.acquire_lease("poll", "w1", 60)
+    assert backend.acquire_lease("poll", "w1", 60)  # renewal
+    assert not backend.acquire_lease("poll", "w2", 60)
+    backend.release_lease("poll", "w2")  # not the holder: no effect
+    assert not backend.acquire_lease("poll", "w2", 60)
+    backend.release_lease("poll", "w1")
+    assert backend.acquire_lease("poll", "w2", 60)
+
+
+def test_memory_entries_and_leases_expire():
+    clock = FakeClock()
+    backend = MemoryStateBackend(clock=clock)
+    backend.set("weather", "Delhi", "{}", ttl=10)
+    assert backend.acquire_lease("poll", "w1", 30)
+    clock.now += 11
+    assert backend.get("weather", "Delhi") is None
+    assert backend.items("weather") == {}
+    assert not backend.acquire_lease("poll", "w2", 30)
+    clock.now += 20
+    assert backend.acquire_lease("poll", "w2", 30)
+
+
+def test_sql_lease_expires(clean_db, monkeypatch):
+    import types
+    import data.database as database
+    clock = FakeClock()
+    monkeypatch.setattr(database, "time", types.SimpleNamespace(time=clock))
+    backend = SQLStateBackend()
+    backend.set("weather", "Delhi", "{}", ttl=10)
+    assert backend.acquire_lease("poll", "w1", 30)
+    clock.now += 31
+    assert backend.get("weather", "Delhi") is None
+    assert backend.acquire_lease("poll", "w2", 30)
+    assert not backend.acquire_lease("poll", "w1", 30)
+
+
+def test_create_state_backend_rejects_unknown_backend():
+    class MockSettings:
+        STATE_BACKEND = "memory"
+
+    settings = MockSettings()
+    assert create_state_backend(settings).name == "memory"
+    settings.STATE_BACKEND = "zookeeper"
+    with pytest.raises(ValueError):
+        create_state_backend(settings)
+
+
+def test_exactly_one_leader_and_failover():
+    clock = FakeClock()
+    backend = MemoryStateBackend(clock=clock)
+    workers = [LeaderElector(backend, ttl=30, owner=f"w{i}") for i in range(3)]
+    assert [worker.try_acquire() for worker in workers] == [True, False, False]
+
+    # The leader dies without releasing: another worker takes over after the TTL
+    clock.now += 31
+    assert [worker.try_acquire() for worker in workers[1:]] == [True, False]
+    assert not workers[0].try_acquire()
+    assert workers[0].transitions == 2
+
+    # A clean shutdown hands over at once
+    workers[1].release()
+    assert workers[2].try_acquire()
+
+
+def test_leader_steps_down_when_backend_fails():
+    class BrokenBackend(MemoryStateBackend):
+        def acquire_lease(self, name, owner, ttl):
+            raise ConnectionError("unreachable")
+
+    elector = LeaderElector(BrokenBackend(), owner="w1")
+    elector.is_leader = True
+    assert not elector.try_acquire()
+    assert not elector.is_leader
+
+
+def test_alert_rules_are_shared_between_workers(backend):
+    settings = type("MockSettings", (), {"get_cities": lambda self: ["Delhi"]})()
+    worker1, worker2 = AlertService(settings, state=backend), AlertService(settings, state=backend)
+    worker1.add_rule(AlertRule(id="hot", city="*", metric="temp", operator=">", threshold=30))
+    worker2.set_threshold(25, "Delhi")
+
+    assert {rule.id for rule in worker1.get_rules()} == {"hot", "threshold:Delhi"}
+    observation = WeatherData(city="Delhi", main="Clear", temp=32, feels_like=34, dt=1622555555)
+    assert worker2.sync_rules()
+    assert {alert.rule_id for alert in worker2.check_alert(observation)} == {"hot", "threshold:Delhi"}
+
+    worker2.remove_rule("hot")
+    assert [rule.id for rule in worker1.get_rules()] == ["threshold:Delhi"]
+    assert not worker1.sync_rules()  # unchanged since the last sync
+
+
+def test_weather_cache_is_shared_between_workers():
+    backend = MemoryStateBackend()
+
+    async def run():
+        upstream = FakeOpenWeatherMap()
+        base_url = await upstream.start()
+        workers = [make_service(base_url, ["Delhi", "Pune"], shared_cache=backend) for _ in range(3)]
+        try:
+            await workers[0].fetch_weather_data()
+            results = [await worker.get_cached_weather("Delhi") for worker in workers]
+            results.append(await workers[1].get_cached_weather("Pune"))
+        finally:
+            for worker in workers:
+                await worker.close()
+            await upstream.stop()
+        return upstream, results
+
+    upstream, results = asyncio.run(run())
+    # Only the polling worker went upstream; the others were served from the shared cache
+    assert upstream.requests == 2
+    assert results[0] == results[1] == results[2]
+    assert results[3].city == "Pune"
@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models.weather_data import WeatherData
+from utils.temperature_converter import (
+    convert_columns, convert_record, convert_records, convert_temperature, dew_point, heat_index, wind_chill,
+)
+
+
+def test_convert_temperature_keeps_the_input_kind():
+    assert convert_temperature(100, "imperial") == 212
+    assert convert_temperature(0, "standard") == 273.15
+    assert convert_temperature(-40, "metric", "imperial") == pytest.approx(-40)
+    assert convert_temperature(373.15, "imperial", "standard") == pytest.approx(212)
+
+    values = np.array([0.0, 37.0, np.nan])
+    converted = convert_temperature(values, "imperial")
+    assert isinstance(converted, np.ndarray)
+    np.testing.assert_allclose(converted, [32, 98.6, np.nan])
+    assert convert_temperature(values, "metric") is values
+
+    series = pd.Series([10.0, 20.0], index=["a", "b"], name="temp")
+    converted = convert_temperature(series, "standard")
+    assert list(converted.index) == ["a", "b"] and converted.name == "temp"
+    assert converted.tolist() == pytest.approx([283.15, 293.15])
+    assert convert_temperature([0, 100], "imperial").tolist() == [32, 212]
+
+    with pytest.raises(ValueError):
+        convert_temperature(1, "rankine")
+
+
+def test_derived_metrics():
+    # Reference values from the NWS heat index and wind chill tables
+    assert heat_index(90, 70, "imperial") == pytest.approx(106, abs=0.5)
+    assert heat_index(convert_temperature(90, "metric", "imperial"), 70) == pytest.approx(41.1, abs=0.3)
+    assert heat_index(20, 50) == pytest.approx(19.4, abs=0.1)  # below 80°F: Steadman's approximation
+    assert wind_chill(0, 15, "imperial") == pytest.approx(-19, abs=0.5)
+    assert wind_chill(15, 10) == 15  # too warm for wind chill
+    assert wind_chill(-10, 0.5) == -10  # too calm
+    assert dew_point(25, 60) == pytest.approx(16.7, abs=0.1)
+    assert dew_point(298.15, 60, "standard") == pytest.approx(289.85, abs=0.1)
+
+    temps, humidity = pd.Series([30.0, 35.0, 20.0]), pd.Series([40.0, 80.0, np.nan])
+    index = heat_index(temps, humidity)
+    assert isinstance(index, pd.Series)
+    assert index[1] > 35 and np.isnan(index[2])
+    np.testing.assert_allclose(dew_point(temps.to_numpy(), [0, 100, 50]), [np.nan, 35, 9.26], atol=0.01)
+
+
+def test_convert_records_and_columns():
+    observations = [
+        WeatherData(city="A", main="Clear", temp=t, feels_like=t + 1, humidity=50, dt=1622555555) for t in (0, 100)
+    ]
+    converted = convert_records(observations, "imperial")
+    assert [(o.temp, o.feels_like, o.humidity) for o in converted] == [(32, 33.8, 50), (212, 213.8, 50)]
+    assert observations[0].temp == 0
+    assert convert_record(observations[1], "standard").temp == pytest.approx(373.15)
+
+    summary = {"city": "A", "count": 2, "avg_temp": 10, "max_temp": 20, "min_temp": None}
+    assert convert_record(summary, "imperial") == {
+        "city": "A", "count": 2, "avg_temp": 50, "max_temp": 68, "min_temp": None,
+    }
+
+    df = pd.DataFrame({"temperature": [0.0, 10.0], "humidity": [50.0, 60.0]})
+    converted = convert_columns(df, "imperial")
+    assert converted["temperature"].tolist() == [32, 50]
+    assert converted["humidity"].tolist() == [50, 60] and df["temperature"].tolist() == [0, 10]
+    assert convert_columns(df, "metric") is df
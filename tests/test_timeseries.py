@@ -0,0 +1,61 @@
+from models.weather_data import WeatherData
+from utils.timeseries import ObservationStore
+
+
+def observation(i, city="TestCity", main="Clear"):
+    return WeatherData(city=city, main=main, temp=20 + i / 100, feels_like=21.25, humidity=i % 100, dt=1622505600 + i * 300)
+
+
+def test_last_returns_read_only_snapshots():
+    store = ObservationStore(capacity=10)
+    store.extend(observation(i) for i in range(4))
+    view = store.last("TestCity", 3)
+    assert list(view.dt) == [1622505600 + i * 300 for i in (1, 2, 3)]
+    assert not view.temp.flags.writeable
+    assert len(store.last("TestCity")) == 4
+    assert len(store.last("Nowhere", 5)) == 0
+
+
+def test_ring_wraps_and_stays_contiguous():
+    store = ObservationStore(capacity=5)
+    store.extend(observation(i, main=["Clear", "Rain"][i % 2]) for i in range(13))
+    view = store.last("TestCity")
+    assert len(view) == 5
+    assert list(view.dt) == [1622505600 + i * 300 for i in range(8, 13)]
+    assert view.dt.flags.c_contiguous
+    assert [model.main for model in view.to_models()] == ["Clear", "Rain", "Clear", "Rain", "Clear"]
+
+
+def test_views_survive_appends_to_a_full_ring():
+    store = ObservationStore(capacity=3)
+    store.extend(observation(i) for i in range(3))
+    view = store.last("TestCity")
+    store.extend(observation(i) for i in range(100, 103))
+    assert list(view.dt) == [1622505600 + i * 300 for i in range(3)]
+    assert [model.dt for model in view.to_models()] == list(view.dt)
+
+
+def test_range_slices_by_time():
+    store = ObservationStore(capacity=50)
+    store.extend(observation(i) for i in range(60))
+    store.extend(observation(i, city="OtherCity") for i in range(3))
+    view = store.range("TestCity", 1622505600 + 20 * 300, 1622505600 + 25 * 300)
+    assert list(view.dt) == [1622505600 + i * 300 for i in range(20, 25)]
+    assert len(store.range("TestCity", 0, 1622505600 + 10 * 300)) == 0
+    assert sorted(store.cities()) == ["OtherCity", "TestCity"]
+
+
+def test_models_materialised_at_boundary():
+    store = ObservationStore()
+    store.append(observation(37))
+    store.append(WeatherData(city="TestCity", main="Haze", temp=-3.14, feels_like=-5.5, dt=1622600000))
+    models = store.last("TestCity").to_models()
+    assert models[0] == observation(37)
+    assert models[1].humidity is None and models[1].temp == -3.14
+
+
+def test_bytes_per_observation():
+    store = ObservationStore(capacity=1000)
+    store.extend(observation(i) for i in range(1000))
+    # dt + temp + feels_like + humidity + condition code, mirrored
+    assert store.nbytes / len(store) == 2 * (8 + 4 + 4 + 4 + 2)
@@ -1,6 +1,7 @@
 import pytest
-from datetime import datetime
-from utils.weather_analyzer import WeatherAnalyzer
+from datetime import date, datetime
+from data.database import Base, engine
+from utils.weather_analyzer import DailyAggregate, DailyAggregator, WeatherAnalyzer
 from models.weather_data import WeatherData
 
 @pytest.fixture
@@ -9,13 +10,121 @@ def weather_analyzer():
 
 def test_get_daily_summary(weather_analyzer, mocker):
     mock_data = [
-        WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=datetime.fromtimestamp(1622555555)),
-        WeatherData(city="TestCity", main="Cloudy", temp=25, feels_like=26, dt=datetime.fromtimestamp(1622565555))
+        WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555),
+        WeatherData(city="TestCity", main="Cloudy", temp=25, feels_like=26, dt=1622565555)
     ]
+    mocker.patch('data.database.get_daily_summaries', return_value=[])
+    mocker.patch('data.database.get_rollups', return_value=[])
     mocker.patch('data.database.get_daily_weather_data', return_value=mock_data)
-    
-    summary = weather_analyzer.get_daily_summary("TestCity")
+
+    summary = weather_analyzer.get_daily_summary("TestCity", date(2021, 6, 1))
     assert summary["avg_temp"] == 22.5
     assert summary["max_temp"] == 25
     assert summary["min_temp"] == 20
-    assert summary["dominant_condition"] == "Clear"
\ No newline at end of file
+    assert summary["dominant_condition"] == "Clear"
+
+
+@pytest.fixture
+def clean_db():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def test_daily_aggregate_incremental():
+    aggregate = DailyAggregate("TestCity", date(2021, 6, 1))
+    for temp, condition in [(20, "Clear"), (25, "Rain"), (15, "Rain"), (30, "Clear"), (10, "Rain")]:
+        aggregate.add(temp, temp + 1, condition)
+
+    summary = aggregate.summary()
+    assert summary["count"] == 5
+    assert summary["avg_temp"] == 20
+    assert summary["min_temp"] == 10
+    assert summary["max_temp"] == 30
+    assert summary["avg_feels_like"] == 21
+    assert summary["dominant_condition"] == "Rain"
+    assert DailyAggregate("TestCity", date(2021, 6, 1)).summary() == {}
+
+
+def test_summary_served_from_aggregates_without_db_scan(weather_analyzer, mocker, clean_db):
+    scan = mocker.patch('data.database.get_daily_weather_data')
+    weather_analyzer.aggregator.update_many([
+        WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555),
+        WeatherData(city="TestCity", main="Cloudy", temp=26, feels_like=26, dt=1622565555),
+        WeatherData(city="TestCity", main="Rain", temp=0, feels_like=0, dt=1622665555),
+    ])
+
+    summary = weather_analyzer.get_daily_summary("TestCity", date(2021, 6, 1))
+    assert summary["avg_temp"] == 23
+    assert summary["count"] == 2
+    scan.assert_not_called()
+
+
+def test_aggregates_survive_restart(clean_db, mocker):
+    aggregator = DailyAggregator()
+    aggregator.update_many([
+        WeatherData(city="TestCity", main="Clear", temp=20, feels_like=22, dt=1622555555),
+        WeatherData(city="OtherCity", main="Rain", temp=10, feels_like=9, dt=1622555555),
+    ])
+    assert aggregator.flush() == 2
+    aggregator.update(WeatherData(city="TestCity", main="Clear", temp=30, feels_like=31, dt=1622565555))
+    assert aggregator.flush() == 1
+    assert aggregator.flush() == 0
+
+    restarted = DailyAggregator()
+    assert restarted.load(since=date(2021, 6, 1)) == 2
+    restarted.update(WeatherData(city="TestCity", main="Rain", temp=10, feels_like=10, dt=1622565555))
+    summary = WeatherAnalyzer(restarted).get_daily_summary("TestCity", date(2021, 6, 1))
+    assert summary["count"] == 3
+    assert summary["avg_temp"] == 20
+    assert summary["dominant_condition"] == "Clear"
+
+    scan = mocker.patch('data.database.get_daily_weather_data')
+    cold = WeatherAnalyzer(DailyAggregator()).get_daily_summary("OtherCity", date(2021, 6, 1))
+    assert cold["dominant_condition"] == "Rain"
+    scan.assert_not_called()
+
+
+def test_summarize_frame_matches_per_object_loops(weather_analyzer):
+    import pandas as pd
+    from utils.weather_analyzer import summarize_frame
+
+    observations = [
+        WeatherData(city=city, main=["Clear", "Rain", "Rain"][i % 3], temp=i % 17, feels_like=i % 13,
+                    dt=1622505600 + i * 1800)
+        for i in range(200)
+        for city in ("TestCity", "OtherCity")
+    ]
+    df = pd.DataFrame([o.model_dump() for o in observations])
+    df["dt"] = pd.to_datetime(df["dt"], unit="s")
+
+    summary = summarize_frame(df, freq="daily")
+    for (city, period), row in summary.iterrows():
+        day = [o for o in observations if o.city == city and pd.Timestamp(o.dt, unit="s").floor("D") == period]
+        temps = [o.temp for o in day]
+        assert row["count"] == len(day)
+        assert row["avg_temp"] == pytest.approx(weather_analyzer.calculate_average_temp(temps))
+        assert row["min_temp"] == min(temps)
+        assert row["max_temp"] == max(temps)
+        assert row["dominant_condition"] == weather_analyzer.get_dominant_condition([o.main for o in day])
+
+    hourly = summarize_frame(df, freq="hourly", rolling_window=2)
+    assert len(hourly) == 2 * 100
+    first_two = hourly.loc["TestCity"]["avg_temp"].iloc[:2]
+    assert hourly.loc["TestCity"]["rolling_avg_temp"].iloc[1] == pytest.approx(first_two.mean())
+
+
+def test_get_summary_loads_from_database(weather_analyzer, clean_db):
+    from data.database import insert_weather_data_bulk
+
+    now = int(datetime.now().timestamp())
+    insert_weather_data_bulk([
+        WeatherData(city=city, main="Clear", temp=temp, feels_like=temp, dt=now - 60 * i)
+        for i, temp in enumerate([10, 20, 30])
+        for city in ("TestCity", "OtherCity", "Ignored")
+    ])
+
+    result = weather_analyzer.get_summary(["TestCity", "OtherCity", "Empty"], days=2)
+    assert set(result) == {"TestCity", "OtherCity", "Empty"}
+    assert result["Empty"] == []
+    assert sum(row["count"] for row in result["TestCity"]) == 3
+    assert result["TestCity"][-1]["dominant_condition"] == "Clear"
@@ -1,32 +1,324 @@
 # Content of test_weather_service.py
+import asyncio
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch
+from services.resilience import CircuitBreaker, CircuitOpenError, UpstreamError
 from services.weather_service import WeatherService
 from config.settings import Settings
+from tests.fake_owm import FakeOpenWeatherMap, city_temp, make_service
 
 @pytest.fixture
 def weather_service():
     settings = Settings(OPENWEATHERMAP_API_KEY="test_key", DATABASE_URL="sqlite:///./test.db")
     return WeatherService(settings)
 
-@patch('httpx.AsyncClient.get')
-async def test_fetch_weather_data(mock_get, weather_service):
-    mock_response = MagicMock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {
-        "weather": [{"main": "Clear"}],
-        "main": {"temp": 20, "feels_like": 22},
-        "dt": 1622555555
-    }
-    mock_get.return_value = mock_response
-
-    await weather_service.fetch_weather_data()
-    
-    mock_get.assert_called_once()
-    # Add assertions to check if data was properly processed and stored
-
-async def test_get_current_weather(weather_service):
-    with patch.object(weather_service, '_make_api_call') as mock_api_call:
-        mock_api_call.return_value = {"temp": 25, "humidity": 60}
-        result = await weather_service.get_current_weather("TestCity")
-        assert result == {"temp": 25, "humidity": 60}
+def test_fetch_weather_data():
+    async def run():
+        upstream = FakeOpenWeatherMap()
+        service = make_service(await upstream.start(), ["TestCity"])
+        try:
+            return await service.fetch_weather_data()
+        finally:
+            await service.close()
+            await upstream.stop()
+
+    results = asyncio.run(run())
+
+    assert len(results) == 1
+    assert results[0].city == "TestCity"
+    assert results[0].temp == city_temp("TestCity")
+    assert results[0].main == "Clear"
+
+
+def test_get_current_weather(weather_service):
+    async def run():
+        with patch.object(weather_service, "_request") as mock_request:
+            mock_request.return_value = {
+                "weather": [{"main": "Clouds"}],
+                "main": {"temp": 25, "feels_like": 26, "humidity": 60},
+                "dt": 1622555555,
+            }
+            return await weather_service.get_current_weather("TestCity"), mock_request
+
+    result, mock_request = asyncio.run(run())
+    assert mock_request.call_args.args[1]["q"] == "TestCity"
+    assert (result.city, result.temp, result.humidity, result.main) == ("TestCity", 25, 60, "Clouds")
+
+
+def test_fetch_weather_data_concurrent_with_shared_session():
+    cities = [f"City{i}" for i in range(12)]
+
+    async def run():
+        upstream = FakeOpenWeatherMap(latency=0.05)
+        base_url = await upstream.start()
+        service = make_service(base_url, cities, FETCH_CONCURRENCY=4, FETCH_LIMIT_PER_HOST=4)
+        try:
+            results = await service.fetch_weather_data()
+            session = service._session
+            await service.fetch_weather_data()
+            assert service._session is session
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, service, results
+
+    upstream, service, results = asyncio.run(run())
+
+    assert sorted(r.city for r in results) == sorted(cities)
+    assert results[0].temp == city_temp(results[0].city)
+    assert upstream.requests == 24
+    assert upstream.max_in_flight <= 4
+    # Connections are pooled: far fewer sockets than requests.
+    assert len(upstream.peers) <= 4
+    stats = service.last_cycle
+    assert set(stats.latencies) == set(cities)
+    assert stats.errors == {}
+    assert stats.wall_time < 12 * 0.05
+
+
+def test_fetch_weather_data_reports_failures(caplog, capsys):
+    async def run():
+        upstream = FakeOpenWeatherMap(fail_cities={"Bad"})
+        base_url = await upstream.start()
+        service = make_service(base_url, ["Good", "Bad"])
+        try:
+            results = await service.fetch_weather_data()
+        finally:
+            await service.close()
+            await upstream.stop()
+        return service, results
+
+    service, results = asyncio.run(run())
+
+    assert [r.city for r in results] == ["Good"]
+    assert "Bad" in service.last_cycle.errors
+    assert service.last_cycle.succeeded == 1
+    # Failures are logged, not printed
+    assert any("Bad" in record.getMessage() for record in caplog.records if record.levelname == "WARNING")
+    assert capsys.readouterr().out == ""
+
+
+def test_fetch_weather_data_batches_cities_with_ids():
+    ids = {1000 + i: f"City{i}" for i in range(45)}
+    cities = {city: {"id": city_id} for city_id, city in ids.items()}
+    cities.update({name: {} for name in ("Alpha", "Beta", "Gamma")})
+
+    async def run():
+        upstream = FakeOpenWeatherMap(city_ids=ids)
+        base_url = await upstream.start()
+        service = make_service(base_url, cities)
+        try:
+            results = await service.fetch_weather_data()
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, service, results
+
+    upstream, service, results = asyncio.run(run())
+
+    # 45 ids in groups of 20 -> 3 group requests, plus one request per name-only city.
+    assert upstream.group_requests == 3
+    assert upstream.requests == 6
+    assert service.last_cycle.requests == 6
+    assert {r.city for r in results} == set(cities)
+    assert {r.city: r.temp for r in results}["City7"] == city_temp("City7")
+
+
+def test_fetch_weather_data_group_falls_back_to_single_requests():
+    ids = {1: "Known", 2: "Unknown", 3: "Other"}
+    cities = {city: {"id": city_id} for city_id, city in ids.items()}
+
+    async def run():
+        # The group endpoint does not know id 2; the second run fails every group call.
+        partial = FakeOpenWeatherMap(city_ids={1: "Known", 3: "Other"})
+        failing = FakeOpenWeatherMap(city_ids=ids, fail_groups=True)
+        runs = []
+        for upstream in (partial, failing):
+            service = make_service(await upstream.start(), cities, UPSTREAM_MAX_RETRIES=0)
+            try:
+                runs.append((upstream, await service.fetch_weather_data()))
+            finally:
+                await service.close()
+                await upstream.stop()
+        return runs
+
+    (partial, partial_results), (failing, failing_results) = asyncio.run(run())
+
+    assert {r.city for r in partial_results} == set(cities)
+    assert (partial.group_requests, partial.requests) == (1, 2)
+    assert {r.city for r in failing_results} == set(cities)
+    assert (failing.group_requests, failing.requests) == (1, 4)
+
+
+def test_get_current_weather_retries_5xx_and_429():
+    async def run():
+        upstream = FakeOpenWeatherMap(statuses={"Flaky": [503, 429, 502]}, retry_after="0")
+        service = make_service(await upstream.start(), ["Flaky"], UPSTREAM_BACKOFF_BASE=0.001)
+        try:
+            weather = await service.get_current_weather("Flaky")
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, service, weather
+
+    upstream, service, weather = asyncio.run(run())
+
+    assert weather.temp == city_temp("Flaky")
+    assert upstream.requests == 4
+    stats = service.get_upstream_stats()
+    assert (stats["retries"], stats["throttled"], stats["failures"]) == (3, 1, 0)
+    assert stats["breaker_state"] == "closed"
+
+
+def test_get_current_weather_does_not_retry_client_errors():
+    async def run():
+        upstream = FakeOpenWeatherMap(statuses={"Nowhere": [404]})
+        service = make_service(await upstream.start(), ["Nowhere"])
+        try:
+            with pytest.raises(UpstreamError) as excinfo:
+                await service.get_current_weather("Nowhere")
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, excinfo.value
+
+    upstream, error = asyncio.run(run())
+
+    assert error.status == 404
+    assert upstream.requests == 1
+
+
+def test_retry_after_longer_than_backoff_max_gives_up():
+    async def run():
+        upstream = FakeOpenWeatherMap(statuses={"Busy": [429]}, retry_after="120")
+        service = make_service(await upstream.start(), ["Busy"])
+        try:
+            with pytest.raises(UpstreamError):
+                await service.get_current_weather("Busy")
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream
+
+    assert asyncio.run(run()).requests == 1
+
+
+def test_request_timeout_is_retried():
+    async def run():
+        upstream = FakeOpenWeatherMap(latency=0.5)
+        service = make_service(
+            await upstream.start(), ["Slow"],
+            FETCH_TIMEOUT=0.05, UPSTREAM_MAX_RETRIES=1, UPSTREAM_BACKOFF_BASE=0.001,
+        )
+        try:
+            with pytest.raises(UpstreamError):
+                await service.get_current_weather("Slow")
+        finally:
+            await service.close()
+            await upstream.stop()
+        return service
+
+    stats = asyncio.run(run()).get_upstream_stats()
+    assert (stats["requests"], stats["timeouts"], stats["failures"]) == (2, 2, 1)
+
+
+def test_open_circuit_serves_last_cached_observation():
+    async def run():
+        upstream = FakeOpenWeatherMap()
+        service = make_service(
+            await upstream.start(), ["Delhi", "Pune"],
+            CACHE_TTL=0.0, UPSTREAM_MAX_RETRIES=0, BREAKER_FAILURE_THRESHOLD=2,
+        )
+        try:
+            fresh = await service.get_cached_weather("Delhi")
+            upstream.fail_cities = {"Delhi", "Pune"}
+            for _ in range(2):
+                with pytest.raises(UpstreamError):
+                    await service.get_cached_weather("Delhi")
+            requests_when_opened = upstream.requests
+            stale = await service.get_cached_weather("Delhi")
+            with pytest.raises(CircuitOpenError):
+                await service.get_cached_weather("Pune")
+        finally:
+            await service.close()
+            await upstream.stop()
+        return upstream, service, fresh, stale, requests_when_opened
+
+    upstream, service, fresh, stale, requests_when_opened = asyncio.run(run())
+
+    assert stale == fresh
+    assert upstream.requests == requests_when_opened  # nothing sent while open
+    stats = service.get_upstream_stats()
+    assert stats["breaker_state"] == "open"
+    assert (stats["breaker_opens"], stats["stale_served"], stats["rejected"]) == (1, 1, 2)
+
+
+def half_open(service: WeatherService):
+    # A circuit that is half-open from the start: opened, with no reset timeout
+    service.breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    service.breaker.record_failure()
+    assert service.breaker.state == "half_open"
+
+
+def test_cancelled_trial_releases_half_open_circuit():
+    async def run():
+        upstream = FakeOpenWeatherMap(latency=0.5)
+        service = make_service(await upstream.start(), ["Delhi"], UPSTREAM_MAX_RETRIES=0)
+        half_open(service)
+        try:
+            trial = asyncio.ensure_future(service.get_current_weather("Delhi"))
+            while not upstream.in_flight:
+                await asyncio.sleep(0.01)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            upstream.latency = 0
+            return await service.get_current_weather("Delhi"), service.breaker.state
+        finally:
+            await service.close()
+            await upstream.stop()
+
+    weather, state = asyncio.run(run())
+    assert weather.temp == city_temp("Delhi")
+    assert state == "closed"
+
+
+def test_malformed_trial_response_reopens_circuit():
+    async def run():
+        upstream = FakeOpenWeatherMap(malformed_cities={"Delhi"})
+        service = make_service(await upstream.start(), ["Delhi"], UPSTREAM_MAX_RETRIES=0)
+        half_open(service)
+        try:
+            with pytest.raises(UpstreamError, match="Malformed"):
+                await service.get_current_weather("Delhi")
+            opens = service.breaker.opens
+            upstream.malformed_cities.clear()
+            return opens, await service.get_current_weather("Delhi"), service.breaker.state
+        finally:
+            await service.close()
+            await upstream.stop()
+
+    opens, weather, state = asyncio.run(run())
+    assert opens == 2  # the failed trial opened the circuit again
+    assert weather.temp == city_temp("Delhi")
+    assert state == "closed"
+
+
+def test_get_city_weather_data_from_database(weather_service):
+    from data.database import Base, engine, insert_weather_data_bulk
+    from models.weather_data import WeatherData
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = 1622505600
+    insert_weather_data_bulk([
+        WeatherData(city="TestCity", main="Clear", temp=i % 30, feels_like=i % 30, humidity=40, dt=start + i * 300)
+        for i in range(365 * 288 // 12)
+    ])
+
+    df = weather_service.get_city_weather_data("TestCity", start, start + 365 * 86400 // 12, max_points=500)
+    assert len(df) <= 500
+    assert list(df.columns[:4]) == ["timestamp", "city", "temperature", "temperature_min"]
+    assert df["humidity"].eq(40).all()
+    assert str(df["timestamp"].iloc[0]) == "2021-06-01 00:00:00"
+    assert weather_service.get_city_weather_data("Nowhere").empty
@@ -0,0 +1,378 @@
+"""
+metrics.py
+
+In-process metrics exposed in the Prometheus text format (GET /metrics).
+
+Counters, gauges and histograms live in a Registry (REGISTRY by default) and
+are updated on the hot paths: HTTP requests (MetricsMiddleware), upstream
+fetches, database statements and transactions (instrument_engine), polling
+cycles and chart renders. Values that are already counted elsewhere, such as
+cache statistics, are read at scrape time by collector callbacks instead.
+
+Every update is a dict lookup and a few additions under a lock, so metrics
+can stay on in production.
+"""
+
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from sub-millisecond cache hits to minute-long polling cycles
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# A sample as returned by collectors: (labels, value)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        try:
+            if len(labels) == len(self.labelnames):
+                return tuple([labels[name] for name in self.labelnames])
+        except KeyError:
+            pass
+        raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return {name: str(value) for name, value in zip(self.labelnames, key)}
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count, e.g. requests served.
+    """
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, e.g. open connections.
+    """
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values (usually durations in seconds) over fixed
+    buckets. Observations are counted in their own bucket only; the cumulative
+    counts Prometheus expects are computed at scrape time.
+
+    :param buckets: Increasing upper bounds; +Inf is implied.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def sum(self, **labels) -> float:
+        state = self._values.get(self._key(labels))
+        return state[1] if state else 0.0
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(state[0]), state[1], state[2]) for key, state in sorted(self._values.items())]
+        samples = []
+        for key, counts, total, count in states:
+            labels = self._labels(key)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class Registry:
+    """
+    Named metrics plus collector callbacks, rendered together by render().
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: Dict[str, Callable[[], Iterable[tuple]]] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        # Defining the same metric twice (e.g. on module reload) returns the existing one
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered as a different metric")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def register_collector(self, name: str, collect: Callable[[], Iterable[tuple]]):
+        """
+        Registers (or replaces) a callback run at every scrape. It yields
+        (metric_name, kind, documentation, samples) tuples, where samples is a
+        list of (labels, value); metric names it yields are rendered as-is.
+        """
+        with self._lock:
+            self._collectors[name] = collect
+
+    def unregister_collector(self, name: str):
+        with self._lock:
+            self._collectors.pop(name, None)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+            collectors = list(self._collectors.items())
+        blocks = [metric.render() for metric in metrics]
+        for collector_name, collect in collectors:
+            try:
+                families = list(collect())
+            except Exception:
+                # A broken collector must not take the whole endpoint down
+                logger.exception("Metrics collector %s failed", collector_name)
+                continue
+            for name, kind, documentation, samples in families:
+                lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{_format_labels(labels)} {_format_value(value)}" for labels, value in samples]
+                blocks.append("\n".join(lines))
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.counter(name, documentation, labelnames)
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.gauge(name, documentation, labelnames)
+
+
+def histogram(
+    name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+) -> Histogram:
+    return REGISTRY.histogram(name, documentation, labelnames, buckets)
+
+
+def cache_samples(caches: Dict[str, object]) -> List[tuple]:
+    """
+    Collector output for services.cache.TTLCache instances, keyed by cache name.
+    """
+    stats = {name: cache.stats() for name, cache in caches.items()}
+    families = [
+        ("cache_hits_total", "counter", "Lookups served from the cache", "hits"),
+        ("cache_misses_total", "counter", "Lookups that had to fetch", "misses"),
+        ("cache_coalesced_total", "counter", "Lookups that joined an in-flight fetch", "coalesced"),
+        ("cache_evictions_total", "counter", "Entries evicted to stay under maxsize", "evictions"),
+        ("cache_entries", "gauge", "Entries currently cached", "entries"),
+        ("cache_hit_ratio", "gauge", "(hits + coalesced) / lookups since start", "hit_ratio"),
+    ]
+    return [
+        (name, kind, documentation, [({"cache": cache}, values[field]) for cache, values in stats.items()])
+        for name, kind, documentation, field in families
+    ]
+
+
+def instrument_engine(engine, registry: Registry = REGISTRY):
+    """
+    Times every statement (by operation: SELECT, INSERT, ...) and every
+    transaction from begin to commit or rollback on a SQLAlchemy engine.
+    """
+    from sqlalchemy import event
+
+    query_seconds = registry.histogram(
+        "db_query_seconds", "Database statement execution time", ["operation"]
+    )
+    transaction_seconds = registry.histogram(
+        "db_transaction_seconds", "Database transaction time from begin to commit/rollback", ["outcome"]
+    )
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if starts:
+            operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+            query_seconds.observe(time.perf_counter() - starts.pop(), operation=operation)
+
+    @event.listens_for(engine, "begin")
+    def begin(conn):
+        conn.info["metrics_transaction_start"] = time.perf_counter()
+
+    def end(outcome):
+        def listener(conn):
+            start = conn.info.pop("metrics_transaction_start", None)
+            if start is not None:
+                transaction_seconds.observe(time.perf_counter() - start, outcome=outcome)
+        return listener
+
+    event.listen(engine, "commit", end("commit"))
+    event.listen(engine, "rollback", end("rollback"))
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording http_requests_total and
+    http_request_duration_seconds per method, route template and status.
+
+    Latency is measured until the response headers are sent, so long-lived
+    streams such as /stream count their time to first byte, not their lifetime.
+    Requests that match no route are recorded under route="<unmatched>", which
+    keeps the number of series bounded.
+    """
+
+    def __init__(self, app, registry: Registry = REGISTRY):
+        self.app = app
+        self.requests = registry.counter(
+            "http_requests_total", "HTTP requests served", ["method", "route", "status"]
+        )
+        self.latency = registry.histogram(
+            "http_request_duration_seconds", "HTTP request latency until response headers", ["method", "route"]
+        )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        recorded = False
+
+        def record(status):
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            route = scope.get("route")
+            labels = {"method": scope["method"], "route": getattr(route, "path", "<unmatched>")}
+            self.latency.observe(time.perf_counter() - start, **labels)
+            self.requests.inc(**labels, status=str(status))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                record(message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except Exception:
+            record(500)
+            raise
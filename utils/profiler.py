@@ -0,0 +1,118 @@
+"""
+profiler.py
+
+A sampling profiler for the running API process, switched on and off at
+runtime (POST /profiler/start and /profiler/stop when PROFILER_ENABLED).
+
+A background thread snapshots the stack of every other thread each
+`interval` seconds with sys._current_frames() and counts identical stacks.
+The result is emitted in the "folded" format (one `frame;frame;frame count`
+line per stack) read by flamegraph.pl, speedscope and inferno to draw flame
+graphs. Nothing is traced between samples, so the overhead stays proportional
+to the sampling rate rather than to the amount of work being profiled.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """
+    :param interval: Seconds between samples.
+    :param max_duration: Sampling stops by itself after this many seconds, so a
+                         forgotten profiler does not keep running.
+    :param max_depth: Innermost frames kept per stack.
+    """
+
+    def __init__(self, interval: float = 0.005, max_duration: float = 300.0, max_depth: int = 128):
+        self.interval = interval
+        self.max_duration = max_duration
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: Optional[float] = None) -> bool:
+        """
+        Starts sampling with fresh counts. Returns False if already running.
+        """
+        if self.running:
+            return False
+        if interval is not None:
+            self.interval = interval
+        with self._lock:
+            self.stacks = Counter()
+            self.samples = 0
+        self.started_at, self.stopped_at = time.time(), None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self) -> str:
+        """
+        Stops sampling and returns the folded stacks collected.
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self.folded()
+
+    def _run(self):
+        me = threading.get_ident()
+        deadline = time.monotonic() + self.max_duration
+        while not self._stop.wait(self.interval):
+            self.sample(skip=me)
+            if time.monotonic() >= deadline:
+                break
+        self.stopped_at = time.time()
+
+    def sample(self, skip: Optional[int] = None):
+        # One snapshot of every thread's stack, root frame first
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        snapshot = []
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            frames = []
+            while frame is not None and len(frames) < self.max_depth:
+                frames.append(_frame_label(frame))
+                frame = frame.f_back
+            frames.append(names.get(ident, f"thread-{ident}"))
+            snapshot.append(";".join(reversed(frames)))
+        with self._lock:
+            self.stacks.update(snapshot)
+            self.samples += 1
+
+    def folded(self) -> str:
+        with self._lock:
+            lines = [f"{stack} {count}" for stack, count in self.stacks.most_common()]
+        return "\n".join(lines) + ("\n" if lines else "")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "started_at": self.started_at,
+            "stopped_at": self.stopped_at,
+        }
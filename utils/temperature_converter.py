@@ -0,0 +1,217 @@
+"""
+temperature_converter.py
+
+Temperature unit conversion and derived comfort metrics (heat index, wind
+chill, dew point).
+
+Every function accepts a scalar, a sequence, a NumPy array or a pandas
+Series and converts the whole input in one vectorized NumPy expression; the
+result has the same shape and kind as the input (a float for a scalar, a
+Series with the same index for a Series).
+
+Units follow the OpenWeatherMap names: "metric" (Celsius, wind in m/s),
+"imperial" (Fahrenheit, wind in mph) and "standard" (Kelvin, wind in m/s).
+Observations are fetched and stored in metric units; the API converts whole
+series once, at the response boundary, when a client asks for other units.
+"""
+
+from typing import Any, Dict, Iterable, List, Literal, Sequence
+
+import numpy as np
+
+Units = Literal["metric", "imperial", "standard"]
+UNITS = ("metric", "imperial", "standard")
+SYMBOLS = {"metric": "°C", "imperial": "°F", "standard": "K"}
+
+# Fields holding temperatures in observations, summaries and chart frames
+TEMPERATURE_FIELDS = (
+    "temp", "feels_like", "temp_min", "temp_max",
+    "avg_temp", "min_temp", "max_temp", "rolling_avg_temp",
+    "avg_feels_like", "min_feels_like", "max_feels_like",
+    "temperature", "temperature_min", "temperature_max",
+)
+
+MPS_TO_MPH = 2.2369363
+
+
+def _check(units: str):
+    if units not in SYMBOLS:
+        raise ValueError(f"Unknown units {units!r}; expected one of {', '.join(UNITS)}")
+
+
+def _values(values):
+    # Lists and tuples become float arrays; scalars, arrays and Series are used as they are
+    return np.asarray(values, dtype=float) if isinstance(values, (list, tuple)) else values
+
+
+def _like(result: np.ndarray, template):
+    # np.where and friends return arrays: hand scalars and Series back as such
+    if np.ndim(result) == 0:
+        return float(result)
+    if hasattr(template, "index") and hasattr(template, "to_numpy") and np.shape(template) == np.shape(result):
+        import pandas as pd
+
+        return pd.Series(result, index=template.index, name=template.name)
+    return result
+
+
+def celsius_to_fahrenheit(celsius):
+    return _values(celsius) * 1.8 + 32
+
+
+def fahrenheit_to_celsius(fahrenheit):
+    return (_values(fahrenheit) - 32) / 1.8
+
+
+def celsius_to_kelvin(celsius):
+    return _values(celsius) + 273.15
+
+
+def kelvin_to_celsius(kelvin):
+    return _values(kelvin) - 273.15
+
+
+_TO_CELSIUS = {"metric": lambda t: t, "imperial": fahrenheit_to_celsius, "standard": kelvin_to_celsius}
+_FROM_CELSIUS = {"metric": lambda t: t, "imperial": celsius_to_fahrenheit, "standard": celsius_to_kelvin}
+
+
+def convert_temperature(values, units: str, from_units: str = "metric"):
+    """
+    Converts temperatures between units.
+
+    :param values: Scalar, sequence, NumPy array or pandas Series of temperatures.
+    :param units: Target units: "metric" (°C), "imperial" (°F) or "standard" (K).
+    :param from_units: Units of values (default: metric, as stored).
+    :return: Converted temperatures, like values; values itself when the units match.
+    :raises ValueError: For unknown units.
+    """
+    _check(units)
+    _check(from_units)
+    if units == from_units:
+        return _values(values)
+    return _FROM_CELSIUS[units](_TO_CELSIUS[from_units](_values(values)))
+
+
+def heat_index(temp, humidity, units: str = "metric"):
+    """
+    Apparent temperature of warm, humid air (US National Weather Service:
+    Steadman's approximation, and the Rothfusz regression with its low- and
+    high-humidity adjustments from 80°F up).
+
+    :param temp: Air temperatures, in `units`.
+    :param humidity: Relative humidity in percent.
+    :return: Heat index in `units`; NaN where humidity is unknown.
+    """
+    shape = np.broadcast_shapes(np.shape(temp), np.shape(humidity))
+    t, rh = np.broadcast_arrays(
+        np.atleast_1d(convert_temperature(np.asarray(temp, dtype=float), "imperial", units)),
+        np.atleast_1d(np.asarray(humidity, dtype=float)),
+    )
+    simple = 1.1 * t - 10.3 + 0.047 * rh
+    # The Rothfusz polynomial, factored to keep the number of temporary arrays down
+    tr = t * rh
+    full = (
+        -42.379 + t * (2.04901523 - 6.83783e-3 * t) + rh * (10.14333127 - 5.481717e-2 * rh)
+        + tr * (-0.22475541 + 1.22874e-3 * t + 8.5282e-4 * rh - 1.99e-6 * tr)
+    )
+    with np.errstate(invalid="ignore"):
+        result = np.where(simple + t >= 160, full, simple)
+        # Adjustments only apply to the few readings that are hot and very dry or very humid
+        dry = np.flatnonzero((rh < 13) & (t >= 80) & (t <= 112))
+        result[dry] -= (13 - rh[dry]) / 4 * np.sqrt((17 - np.abs(t[dry] - 95)) / 17)
+        damp = np.flatnonzero((rh > 85) & (t >= 80) & (t <= 87))
+        result[damp] += (rh[damp] - 85) / 10 * (87 - t[damp]) / 5
+    return _like(convert_temperature(result.reshape(shape), units, "imperial"), temp)
+
+
+def wind_chill(temp, wind_speed, units: str = "metric"):
+    """
+    Apparent temperature of cold, windy air (the 2001 North American wind chill
+    index). Defined at or below 10°C (50°F) with wind of at least 3 mph; the air
+    temperature itself is returned elsewhere.
+
+    :param temp: Air temperatures, in `units`.
+    :param wind_speed: Wind speed in m/s (mph for imperial units).
+    :return: Wind chill in `units`.
+    """
+    t = np.asarray(convert_temperature(temp, "imperial", units), dtype=float)
+    v = np.asarray(_values(wind_speed), dtype=float)
+    if units != "imperial":
+        v = v * MPS_TO_MPH
+    with np.errstate(invalid="ignore"):
+        v16 = np.power(v, 0.16)
+        chill = 35.74 + 0.6215 * t - 35.75 * v16 + 0.4275 * t * v16
+        result = np.where((t <= 50) & (v >= 3), chill, t)
+    return _like(convert_temperature(result, units, "imperial"), temp)
+
+
+def dew_point(temp, humidity, units: str = "metric"):
+    """
+    Dew point from temperature and relative humidity (Magnus formula with the
+    Alduchov-Eskridge coefficients, within 0.4°C from -40°C to 50°C).
+
+    :param temp: Air temperatures, in `units`.
+    :param humidity: Relative humidity in percent.
+    :return: Dew point in `units`; NaN where humidity is unknown or zero.
+    """
+    t = np.asarray(convert_temperature(temp, "metric", units), dtype=float)
+    rh = np.asarray(_values(humidity), dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        gamma = np.log(rh / 100) + 17.625 * t / (243.04 + t)
+        result = np.where(rh > 0, 243.04 * gamma / (17.625 - gamma), np.nan)
+    return _like(convert_temperature(result, units), temp)
+
+
+def convert_record(record, units: str, fields: Sequence[str] = TEMPERATURE_FIELDS):
+    """
+    Converts the temperature fields of one metric record (a dict or pydantic model)
+    to units; a copy is returned unless the units are metric.
+    """
+    _check(units)
+    if units == "metric":
+        return record
+    if isinstance(record, dict):
+        return {
+            key: convert_temperature(value, units) if key in fields and value is not None else value
+            for key, value in record.items()
+        }
+    update = {field: convert_temperature(getattr(record, field), units)
+              for field in fields if getattr(record, field, None) is not None}
+    return record.model_copy(update=update)
+
+
+def convert_records(records: Iterable, units: str, fields: Sequence[str] = TEMPERATURE_FIELDS) -> List:
+    """
+    convert_record for many pydantic models, each field converted across all
+    records in one vectorized call.
+    """
+    records = list(records)
+    _check(units)
+    if units == "metric" or not records:
+        return records
+    present = [field for field in fields if field in type(records[0]).model_fields]
+    columns: Dict[str, Any] = {
+        field: convert_temperature(
+            np.array([np.nan if getattr(record, field) is None else getattr(record, field) for record in records]),
+            units,
+        ).tolist()
+        for field in present
+    }
+    return [
+        record.model_copy(update={
+            field: columns[field][i] for field in present if getattr(record, field) is not None
+        })
+        for i, record in enumerate(records)
+    ]
+
+
+def convert_columns(df, units: str, fields: Sequence[str] = TEMPERATURE_FIELDS):
+    """
+    A copy of a metric DataFrame with its temperature columns converted to units
+    (the frame itself when the units are metric).
+    """
+    _check(units)
+    columns = [column for column in df.columns if column in fields]
+    if units == "metric" or not columns:
+        return df
+    return df.assign(**{column: convert_temperature(df[column], units) for column in columns})
@@ -0,0 +1,207 @@
+"""
+timeseries.py
+
+Compact in-memory store for recent observations.
+
+Each city gets a fixed-capacity columnar ring buffer of typed NumPy arrays
+(dt, temp, feels_like, humidity and an interned condition code) instead of a
+list of pydantic WeatherData objects. Reads copy one contiguous slice per
+column, and pydantic models are only built when a view is materialised at the
+API boundary.
+"""
+
+import threading
+from typing import Dict, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from models.weather_data import WeatherData
+
+COLUMNS = {
+    "dt": np.int64,
+    "temp": np.float32,
+    "feels_like": np.float32,
+    "humidity": np.float32,
+    "condition": np.uint16,
+}
+
+
+class ObservationView(NamedTuple):
+    """
+    Read-only snapshot of one city's columns, oldest first.
+
+    The arrays are copies taken under the store's lock (one contiguous slice per
+    column), so a view stays consistent however many observations other threads
+    append afterwards; the ring buffer overwrites its oldest slot on every append
+    once it is full.
+    """
+    city: str
+    dt: np.ndarray
+    temp: np.ndarray
+    feels_like: np.ndarray
+    humidity: np.ndarray
+    condition: np.ndarray
+    conditions: List[str]
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+    def to_models(self, units: str = "metric") -> List[WeatherData]:
+        # Temperatures are stored as float32 in metric units; other units are converted
+        # a whole column at a time, then everything is rounded back to 2 decimals.
+        temps, feels_likes = self.temp, self.feels_like
+        if units != "metric":
+            from utils.temperature_converter import convert_temperature
+
+            temps = convert_temperature(temps.astype(np.float64), units)
+            feels_likes = convert_temperature(feels_likes.astype(np.float64), units)
+        return [
+            WeatherData(
+                city=self.city,
+                main=self.conditions[code],
+                temp=round(float(temp), 2),
+                feels_like=round(float(feels_like), 2),
+                humidity=None if np.isnan(humidity) else round(float(humidity), 2),
+                dt=int(dt),
+            )
+            for dt, temp, feels_like, humidity, code in zip(
+                self.dt, temps, feels_likes, self.humidity, self.condition
+            )
+        ]
+
+
+class CityRing:
+    """
+    Columnar ring buffer for one city.
+
+    Every value is written twice, at i and i + capacity, so the most recent
+    `capacity` values are always one contiguous slice: any "last N" or time
+    range is a view without re-ordering (ObservationStore copies it before
+    releasing its lock).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(2 * capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._write = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
+
+    def append(self, dt: int, temp: float, feels_like: float, humidity: float, condition: int):
+        for name, value in (("dt", dt), ("temp", temp), ("feels_like", feels_like),
+                            ("humidity", humidity), ("condition", condition)):
+            column = self.columns[name]
+            column[self._write] = value
+            column[self._write + self.capacity] = value
+        self._write = (self._write + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+
+    def window(self, start: int, stop: int) -> Dict[str, np.ndarray]:
+        # Views of positions [start, stop) counted from the oldest retained value
+        end = self._write + self.capacity
+        first = end - self._count
+        views = {}
+        for name, column in self.columns.items():
+            view = column[first + start:first + stop]
+            view.flags.writeable = False
+            views[name] = view
+        return views
+
+    def search(self, dt: int) -> int:
+        # Position of the first retained value with timestamp >= dt (timestamps ascend)
+        end = self._write + self.capacity
+        return int(np.searchsorted(self.columns["dt"][end - self._count:end], dt, side="left"))
+
+
+class ObservationStore:
+    """
+    Per-city ring buffers holding the last `capacity` observations of each city.
+
+    :param capacity: Observations retained per city (default: one week at 5-minute polling).
+    """
+
+    def __init__(self, capacity: int = 2016):
+        self.capacity = capacity
+        self._rings: Dict[str, CityRing] = {}
+        self._conditions: List[str] = []
+        self._condition_codes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return sum(len(ring) for ring in self._rings.values())
+
+    @property
+    def nbytes(self) -> int:
+        return sum(ring.nbytes for ring in self._rings.values())
+
+    def cities(self) -> List[str]:
+        return list(self._rings)
+
+    def _intern(self, condition: str) -> int:
+        code = self._condition_codes.get(condition)
+        if code is None:
+            code = self._condition_codes[condition] = len(self._conditions)
+            self._conditions.append(condition)
+        return code
+
+    def append(self, weather_data: WeatherData):
+        with self._lock:
+            ring = self._rings.get(weather_data.city)
+            if ring is None:
+                ring = self._rings[weather_data.city] = CityRing(self.capacity)
+            ring.append(
+                weather_data.dt,
+                weather_data.temp,
+                weather_data.feels_like,
+                np.nan if weather_data.humidity is None else weather_data.humidity,
+                self._intern(weather_data.main),
+            )
+
+    def extend(self, weather_data_list) -> int:
+        count = 0
+        for weather_data in weather_data_list:
+            self.append(weather_data)
+            count += 1
+        return count
+
+    def _view(self, city: str, start: int, stop: int) -> ObservationView:
+        # Called with the lock held: copy the slices before an append can overwrite them
+        columns = {}
+        for name, window in self._rings[city].window(start, stop).items():
+            column = window.copy()
+            column.flags.writeable = False
+            columns[name] = column
+        return ObservationView(city=city, conditions=self._conditions, **columns)
+
+    def _empty(self, city: str) -> ObservationView:
+        return ObservationView(
+            city=city, conditions=self._conditions,
+            **{name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()},
+        )
+
+    def last(self, city: str, n: Optional[int] = None) -> ObservationView:
+        """
+        The most recent n observations for a city (all retained ones if n is None).
+        """
+        with self._lock:
+            ring = self._rings.get(city)
+            if ring is None:
+                return self._empty(city)
+            n = len(ring) if n is None else max(0, min(n, len(ring)))
+            return self._view(city, len(ring) - n, len(ring))
+
+    def range(self, city: str, start: Union[int, float], end: Union[int, float]) -> ObservationView:
+        """
+        Observations for a city with start <= dt < end (unix timestamps).
+        """
+        with self._lock:
+            ring = self._rings.get(city)
+            if ring is None:
+                return self._empty(city)
+            return self._view(city, ring.search(start), ring.search(end))
@@ -1,25 +1,370 @@
-from typing import Dict, Any
-from datetime import datetime, timedelta
+import json
+import threading
+from collections import Counter
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+from datetime import date, datetime, timedelta, timezone
+from data import database
+from utils import temperature_converter
 
-class WeatherAnalyzer:
-    def __init__(self):
-        # You might want to inject a database service here to fetch the data
-        pass
 
-    def get_daily_summary(self, city: str) -> Dict[str, Any]:
-        # This is a placeholder implementation. In a real scenario, you'd fetch this data from your database.
-        # For now, we'll return dummy data
+def observation_day(dt) -> date:
+    # UTC calendar day of an observation; dt is a unix timestamp or a (naive UTC) datetime.
+    return database.to_db_datetime(dt).date()
+
+
+class DailyAggregate:
+    """
+    Running statistics for one city on one day.
+
+    Every update is O(1): sum/count/min/max are kept incrementally and the
+    dominant condition is tracked alongside the condition histogram, so a
+    summary never needs to look at the raw observations again.
+    """
+
+    __slots__ = (
+        "city", "day", "count", "temp_sum", "temp_min", "temp_max",
+        "feels_like_sum", "feels_like_min", "feels_like_max",
+        "conditions", "dominant_condition",
+    )
+
+    def __init__(self, city: str, day: date):
+        self.city = city
+        self.day = day
+        self.count = 0
+        self.temp_sum = 0.0
+        self.temp_min = None
+        self.temp_max = None
+        self.feels_like_sum = 0.0
+        self.feels_like_min = None
+        self.feels_like_max = None
+        self.conditions: Dict[str, int] = {}
+        self.dominant_condition = None
+
+    @classmethod
+    def from_observations(cls, city: str, day: date, observations: Iterable) -> "DailyAggregate":
+        aggregate = cls(city, day)
+        for observation in observations:
+            aggregate.add(observation.temp, observation.feels_like, observation.main)
+        return aggregate
+
+    def add(self, temp: float, feels_like: float, condition: str):
+        self.count += 1
+        self.temp_sum += temp
+        self.temp_min = temp if self.temp_min is None else min(self.temp_min, temp)
+        self.temp_max = temp if self.temp_max is None else max(self.temp_max, temp)
+        self.feels_like_sum += feels_like
+        self.feels_like_min = feels_like if self.feels_like_min is None else min(self.feels_like_min, feels_like)
+        self.feels_like_max = feels_like if self.feels_like_max is None else max(self.feels_like_max, feels_like)
+        seen = self.conditions.get(condition, 0) + 1
+        self.conditions[condition] = seen
+        if self.dominant_condition is None or seen > self.conditions[self.dominant_condition]:
+            self.dominant_condition = condition
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.count:
+            return {}
+        return {
+            "city": self.city,
+            "date": self.day.isoformat(),
+            "count": self.count,
+            "avg_temp": self.temp_sum / self.count,
+            "max_temp": self.temp_max,
+            "min_temp": self.temp_min,
+            "avg_feels_like": self.feels_like_sum / self.count,
+            "dominant_condition": self.dominant_condition,
+        }
+
+    def to_row(self) -> Dict[str, Any]:
         return {
-            "city": city,
-            "date": datetime.now().date().isoformat(),
-            "average_temp": 25.5,
-            "max_temp": 30.0,
-            "min_temp": 20.0,
-            "dominant_condition": "Clear"
+            "city": self.city, "day": self.day, "count": self.count,
+            "temp_sum": self.temp_sum, "temp_min": self.temp_min, "temp_max": self.temp_max,
+            "feels_like_sum": self.feels_like_sum, "feels_like_min": self.feels_like_min,
+            "feels_like_max": self.feels_like_max, "conditions": json.dumps(self.conditions),
         }
 
+    @classmethod
+    def from_row(cls, row) -> "DailyAggregate":
+        aggregate = cls(row.city, row.day)
+        aggregate.count = row.count
+        aggregate.temp_sum = row.temp_sum
+        aggregate.temp_min = row.temp_min
+        aggregate.temp_max = row.temp_max
+        aggregate.feels_like_sum = row.feels_like_sum
+        aggregate.feels_like_min = row.feels_like_min
+        aggregate.feels_like_max = row.feels_like_max
+        aggregate.conditions = json.loads(row.conditions or "{}")
+        if aggregate.conditions:
+            aggregate.dominant_condition = max(aggregate.conditions, key=aggregate.conditions.get)
+        return aggregate
+
+
+class DailyAggregator:
+    """
+    Keeps a DailyAggregate per (city, day), updated as observations arrive.
+
+    Aggregates touched since the last flush() are written to the
+    daily_weather_summary rollup table, and load() restores recent days from
+    it so summaries survive restarts. Days older than retention_days are
+    dropped from memory (they stay in the rollup table).
+    """
+
+    def __init__(self, retention_days: int = 2):
+        self.retention_days = retention_days
+        self._aggregates: Dict[Tuple[str, date], DailyAggregate] = {}
+        self._dirty = set()
+        self._newest_day: Optional[date] = None
+        self._lock = threading.Lock()
+
+    def update(self, weather_data) -> DailyAggregate:
+        key = (weather_data.city, observation_day(weather_data.dt))
+        with self._lock:
+            aggregate = self._aggregates.get(key)
+            if aggregate is None:
+                aggregate = self._aggregates[key] = DailyAggregate(*key)
+                if self._newest_day is None or key[1] > self._newest_day:
+                    self._newest_day = key[1]
+                    self._evict(key[1])
+            aggregate.add(weather_data.temp, weather_data.feels_like, weather_data.main)
+            self._dirty.add(key)
+        return aggregate
+
+    def update_many(self, weather_data_list: Iterable) -> int:
+        count = 0
+        for weather_data in weather_data_list:
+            self.update(weather_data)
+            count += 1
+        return count
+
+    def get(self, city: str, day: date) -> Optional[DailyAggregate]:
+        return self._aggregates.get((city, day))
+
+    def put(self, aggregate: DailyAggregate):
+        with self._lock:
+            self._aggregates[(aggregate.city, aggregate.day)] = aggregate
+
+    def _evict(self, newest_day: date):
+        cutoff = newest_day - timedelta(days=self.retention_days)
+        for key in [key for key in self._aggregates if key[1] < cutoff and key not in self._dirty]:
+            del self._aggregates[key]
+
+    def flush(self) -> int:
+        """
+        Persists aggregates changed since the last flush in one batch upsert.
+        """
+        with self._lock:
+            rows = [self._aggregates[key].to_row() for key in self._dirty if key in self._aggregates]
+            self._dirty = set()
+        return database.upsert_daily_summaries(rows)
+
+    def load(self, since: Optional[date] = None) -> int:
+        """
+        Restores aggregates from the rollup table (default: the retention window).
+        """
+        since = since or datetime.now(timezone.utc).date() - timedelta(days=self.retention_days)
+        rows = database.get_daily_summaries(since=since)
+        for row in rows:
+            self.put(DailyAggregate.from_row(row))
+        return len(rows)
+
+
+SUMMARY_FREQUENCIES = {"daily": "D", "hourly": "h"}
+
+
+def summarize_rollups(rows):
+    """
+    summarize_frame's per-period statistics from rollup rows (data.rollup), one
+    period per row, for periods whose raw observations are past retention.
+    Rollups store sums, so the means match those of the raw rows exactly.
+
+    :param rows: Hourly or daily rollup rows (see data.database.get_rollups).
+    :return: DataFrame indexed by (city, period), without rolling_avg_temp.
+    """
+    import pandas as pd
+
+    rows = [row for row in rows if row.count]
+    conditions = [json.loads(row.conditions or "{}") for row in rows]
+    index = pd.MultiIndex.from_arrays(
+        [[row.city for row in rows], pd.to_datetime([row.bucket for row in rows])], names=["city", "period"]
+    )
+    return pd.DataFrame({
+        "avg_temp": [row.temp_sum / row.count for row in rows],
+        "min_temp": [row.temp_min for row in rows],
+        "max_temp": [row.temp_max for row in rows],
+        "avg_feels_like": [row.feels_like_sum / row.count for row in rows],
+        "min_feels_like": [row.feels_like_min for row in rows],
+        "max_feels_like": [row.feels_like_max for row in rows],
+        "count": [row.count for row in rows],
+        "dominant_condition": [max(counts, key=counts.get) if counts else None for counts in conditions],
+    }, index=index)
+
+
+def summarize_frame(df, freq: str = "daily", rolling_window: int = 3, rollups: Optional[list] = None):
+    """
+    Computes per-city, per-period statistics for a whole observation frame at once.
+
+    All cities and periods are handled by a single groupby over the columnar data;
+    nothing loops over individual observations in Python.
+
+    :param df: DataFrame with columns city, dt, main, temp, feels_like (see
+               data.database.load_weather_frame).
+    :param freq: "daily" or "hourly" buckets.
+    :param rolling_window: Number of periods in the rolling mean of avg_temp.
+    :param rollups: Rollup rows of the same frequency for earlier periods, whose raw
+                    observations are past retention (see summarize_rollups).
+    :return: DataFrame indexed by (city, period) with avg/min/max temp and
+             feels_like, count, dominant_condition and rolling_avg_temp.
+    """
+    import pandas as pd
+
+    columns = [
+        "avg_temp", "min_temp", "max_temp", "avg_feels_like", "min_feels_like",
+        "max_feels_like", "count", "dominant_condition", "rolling_avg_temp",
+    ]
+    expired = summarize_rollups(rollups) if rollups else None
+    if df.empty and expired is None:
+        return pd.DataFrame(columns=columns, index=pd.MultiIndex.from_arrays([[], []], names=["city", "period"]))
+    if df.empty:
+        summary = expired
+    else:
+        summary = _summarize_observations(df, freq)
+        if expired is not None:
+            summary = pd.concat([expired, summary.rename(index=str, level="city")]).sort_index()
+
+    summary["rolling_avg_temp"] = (
+        summary.groupby(level="city", observed=True)["avg_temp"]
+        .rolling(rolling_window, min_periods=1).mean()
+        .droplevel(0)
+    )
+    return summary[columns]
+
+
+def _summarize_observations(df, freq: str):
+    import pandas as pd
+
+    period = df["dt"].dt.floor(SUMMARY_FREQUENCIES[freq]).rename("period")
+    keys = [df["city"], period]
+    grouped = df.groupby(keys, observed=True, sort=True)
+    summary = pd.DataFrame({
+        "avg_temp": grouped["temp"].mean(),
+        "min_temp": grouped["temp"].min(),
+        "max_temp": grouped["temp"].max(),
+        "avg_feels_like": grouped["feels_like"].mean(),
+        "min_feels_like": grouped["feels_like"].min(),
+        "max_feels_like": grouped["feels_like"].max(),
+        "count": grouped["temp"].count(),
+    })
+
+    # Dominant condition: histogram of (city, period, condition), keep the largest per group
+    counts = df.groupby(keys + [df["main"]], observed=True).size()
+    counts = counts[counts > 0].sort_values(ascending=False, kind="stable")
+    top = counts[~counts.index.droplevel("main").duplicated()]
+    summary["dominant_condition"] = top.reset_index(level="main")["main"].astype(str)
+    return summary
+
+
+class WeatherAnalyzer:
+    def __init__(self, aggregator: Optional[DailyAggregator] = None, archive=None):
+        # archive: optional data.archive.WeatherArchive serving the days it covers
+        self.aggregator = aggregator or DailyAggregator()
+        self.archive = archive
+
+    def load_frame(self, cities: Optional[List[str]], start, end):
+        # Archived days come from the columnar archive, the rest from the database
+        if self.archive is None:
+            return database.load_weather_frame(cities, start=start, end=end)
+        from data import archive
+        return archive.load_weather_frame(self.archive, cities, start, end)
+
+    def get_daily_summary(self, city: str, day: Optional[date] = None) -> Dict[str, Any]:
+        return self.get_daily_summaries([city], day)[city]
+
+    def get_daily_summaries(self, cities: List[str], day: Optional[date] = None) -> Dict[str, Dict[str, Any]]:
+        # Served from the running aggregates. Cities/days that are not in memory yet are
+        # looked up in the summary table, then in the compacted daily rollups (days whose
+        # raw rows may be past retention), and built once from raw rows as a last resort;
+        # each step is one IN (...) query for every city still missing.
+        day = day or datetime.now(timezone.utc).date()
+        aggregates = {city: self.aggregator.get(city, day) for city in cities}
+        missing = [city for city, aggregate in aggregates.items() if aggregate is None]
+        lookups = [
+            lambda cities: database.get_daily_summaries(city=cities, since=day),
+            lambda cities: database.get_rollups("daily", cities, day, day + timedelta(days=1)),
+        ]
+        for lookup in lookups:
+            if not missing:
+                break
+            for row in lookup(missing):
+                if row.day == day:
+                    aggregates[row.city] = DailyAggregate.from_row(row)
+            missing = [city for city in missing if aggregates[city] is None]
+        if missing:
+            observations = database.group_by_city(database.get_daily_weather_data(missing, day))
+            for city in missing:
+                aggregates[city] = DailyAggregate.from_observations(city, day, observations.get(city, ()))
+        for city, aggregate in aggregates.items():
+            if aggregate.count and self.aggregator.get(city, day) is None:
+                self.aggregator.put(aggregate)
+        return {city: aggregate.summary() for city, aggregate in aggregates.items()}
+
+    def get_summary(
+        self,
+        cities: Optional[List[str]] = None,
+        days: int = 1,
+        freq: str = "daily",
+        rolling_window: int = 3,
+        units: str = "metric",
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        # Multi-city, multi-day summary: one query (or archive scan) into a DataFrame,
+        # one vectorized pass. Without an archive, days whose raw rows are past retention
+        # are summarised from the rollups of the same frequency instead.
+        start, end = self.summary_window(days)
+        rollups = []
+        if self.archive is None:
+            expired, start = self.split_expired(start, end, database.get_rollup_coverage())
+            if expired:
+                rollups = database.get_rollups(freq, cities, *expired)
+        df = self.load_frame(cities, start, end)
+        return self.summarize(df, cities, freq=freq, rolling_window=rolling_window, units=units, rollups=rollups)
+
+    @staticmethod
+    def summary_window(days: int) -> Tuple[date, date]:
+        # [start, end) of a get_summary covering the last `days` UTC days, today included
+        end = datetime.now(timezone.utc).date() + timedelta(days=1)
+        return end - timedelta(days=days), end
+
+    @staticmethod
+    def split_expired(start, end, coverage: Dict[str, int]) -> Tuple[Optional[Tuple[datetime, datetime]], datetime]:
+        # Splits [start, end) at the rollup coverage's raw_from (a UTC day boundary): returns
+        # the expired range to read from the rollups, if any, and where raw rows take over
+        start, end = database.to_db_datetime(start), database.to_db_datetime(end)
+        raw_from = coverage.get("raw_from")
+        if raw_from is None or start >= database.to_db_datetime(raw_from):
+            return None, start
+        split = min(database.to_db_datetime(raw_from), end)
+        return (start, split), split
+
+    def summarize(
+        self,
+        df,
+        cities: Optional[List[str]] = None,
+        freq: str = "daily",
+        rolling_window: int = 3,
+        units: str = "metric",
+        rollups: Optional[list] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        # get_summary for a frame (and rollup rows of expired periods) that has already been
+        # loaded, e.g. through the async layer; temperature columns are converted to `units`
+        # on the summary frame, one column at a time
+        summary = summarize_frame(df, freq=freq, rolling_window=rolling_window, rollups=rollups).reset_index()
+        summary = temperature_converter.convert_columns(summary, units)
+        summary["period"] = summary["period"].map(lambda period: period.isoformat())
+        result = {city: [] for city in (cities or [])}
+        for record in summary.to_dict(orient="records"):
+            result.setdefault(record.pop("city"), []).append(record)
+        return result
+
     def calculate_average_temp(self, temperatures: list[float]) -> float:
         return sum(temperatures) / len(temperatures) if temperatures else 0
 
     def get_dominant_condition(self, conditions: list[str]) -> str:
-        return max(set(conditions), key=conditions.count) if conditions else "Unknown"
\ No newline at end of file
+        return Counter(conditions).most_common(1)[0][0] if conditions else "Unknown"
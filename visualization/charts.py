@@ -2,11 +2,52 @@
 charts.py
 
 Module for visualizing weather data using matplotlib.
+
+Figures are built with the object-oriented API on an Agg canvas, so rendering
+does not touch pyplot's global state; pyplot is only imported when show=True.
 """
 
-import matplotlib.pyplot as plt
 import pandas as pd
-from typing import Optional
+import matplotlib
+import matplotlib.dates as mdates
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from matplotlib.lines import Line2D
+from typing import List, Optional, Tuple
+from matplotlib.axes import Axes
+from visualization.series import comparison_series, metric_label
+
+
+def _new_figure(show: bool) -> Tuple[Figure, Axes]:
+    # Interactive display needs a pyplot-managed figure; everything else uses a plain Agg canvas.
+    if show:
+        import matplotlib.pyplot as plt
+        return plt.subplots(figsize=(10, 5))
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    return fig, fig.add_subplot()
+
+
+def _marker(df: pd.DataFrame) -> Optional[str]:
+    # Point markers only help on short series; on long ones they just cost render time.
+    return "o" if len(df) <= 200 else None
+
+
+def _finish(fig: Figure, show: bool, save_path: Optional[str], return_fig: bool) -> Optional[Figure]:
+    # Save if a path is provided
+    if save_path:
+        fig.savefig(save_path, bbox_inches="tight")
+
+    # Show if requested
+    if show:
+        import matplotlib.pyplot as plt
+        plt.show()
+        if not return_fig:
+            plt.close(fig)
+
+    return fig if return_fig else None
 
 
 def plot_temperature_over_time(
@@ -14,8 +55,9 @@ def plot_temperature_over_time(
     city: Optional[str] = None,
     show: bool = False,
     save_path: Optional[str] = None,
-    return_fig: bool = False
-) -> Optional[plt.Figure]:
+    return_fig: bool = False,
+    units: str = "metric"
+) -> Optional[Figure]:
     """
     Plot temperature over time for a given city (or all data if city not provided).
 
@@ -25,6 +67,7 @@ def plot_temperature_over_time(
     :param show: If True, displays the plot.
     :param save_path: If provided, saves the plot to the specified file path.
     :param return_fig: If True, returns the Matplotlib Figure object.
+    :param units: Units the temperatures are in, for the axis label ("metric", "imperial" or "standard").
     :return: A Matplotlib Figure if return_fig is True; otherwise, None.
     """
 
@@ -40,10 +83,12 @@ def plot_temperature_over_time(
     df = df.sort_values(by="timestamp")
 
     # Create the figure and axis
-    fig, ax = plt.subplots(figsize=(10, 5))
+    fig, ax = _new_figure(show)
 
-    # Plot the data
-    ax.plot(df["timestamp"], df["temperature"], marker="o", linestyle="-", label="Temperature")
+    # Plot the data; downsampled frames also carry a per-bucket min/max band
+    ax.plot(df["timestamp"], df["temperature"], marker=_marker(df), linestyle="-", label="Temperature")
+    if {"temperature_min", "temperature_max"} <= set(df.columns):
+        ax.fill_between(df["timestamp"], df["temperature_min"], df["temperature_max"], alpha=0.2, label="Min/Max")
 
     # Title and labels
     if city:
@@ -51,23 +96,11 @@ def plot_temperature_over_time(
     else:
         ax.set_title("Temperature Over Time (All Cities)")
     ax.set_xlabel("Timestamp")
-    ax.set_ylabel("Temperature (°C)")
+    ax.set_ylabel(metric_label("temperature", units))
     ax.legend()
     ax.grid(True)
 
-    # Save if a path is provided
-    if save_path:
-        fig.savefig(save_path, bbox_inches="tight")
-
-    # Show if requested
-    if show:
-        plt.show()
-
-    if return_fig:
-        return fig
-    else:
-        plt.close(fig)
-        return None
+    return _finish(fig, show, save_path, return_fig)
 
 
 def plot_humidity_over_time(
@@ -76,7 +109,7 @@ def plot_humidity_over_time(
     show: bool = False,
     save_path: Optional[str] = None,
     return_fig: bool = False
-) -> Optional[plt.Figure]:
+) -> Optional[Figure]:
     """
     Plot humidity over time for a given city (or all data if city not provided).
 
@@ -97,8 +130,8 @@ def plot_humidity_over_time(
 
     df = df.sort_values(by="timestamp")
 
-    fig, ax = plt.subplots(figsize=(10, 5))
-    ax.plot(df["timestamp"], df["humidity"], marker="o", linestyle="-", label="Humidity", color="orange")
+    fig, ax = _new_figure(show)
+    ax.plot(df["timestamp"], df["humidity"], marker=_marker(df), linestyle="-", label="Humidity", color="orange")
 
     if city:
         ax.set_title(f"Humidity Over Time - {city}")
@@ -109,17 +142,66 @@ def plot_humidity_over_time(
     ax.legend()
     ax.grid(True)
 
-    if save_path:
-        fig.savefig(save_path, bbox_inches="tight")
+    return _finish(fig, show, save_path, return_fig)
 
-    if show:
-        plt.show()
 
-    if return_fig:
-        return fig
+def plot_comparison(
+    df: pd.DataFrame,
+    metric: str = "temperature",
+    cities: Optional[List[str]] = None,
+    max_points: int = 2000,
+    show: bool = False,
+    save_path: Optional[str] = None,
+    return_fig: bool = False,
+    units: str = "metric"
+) -> Optional[Figure]:
+    """
+    Compare one metric over time across many cities.
+
+    The frame is split into per-city series in a single pass (see
+    visualization.series) and drawn as one LineCollection, so the cost grows
+    with the number of points rather than cities × rows. The frame is not modified.
+
+    :param df: A Pandas DataFrame containing weather data.
+               Expects columns ['timestamp', 'city'] and the metric column.
+    :param metric: Column to compare: 'temperature', 'feels_like' or 'humidity'.
+    :param cities: Cities to compare, in legend order (default: every city in df).
+    :param max_points: Each series is downsampled to at most this many points.
+    :param show: If True, displays the plot.
+    :param save_path: If provided, saves the plot to the specified file path.
+    :param return_fig: If True, returns the Matplotlib Figure object.
+    :param units: Units temperatures are in, for the axis label.
+    :return: A Matplotlib Figure if return_fig is True; otherwise, None.
+    """
+    series = comparison_series(df, metric, cities, max_points=max_points)
+    names = list(series)
+    if len(names) <= 20:
+        colormap = matplotlib.colormaps["tab10" if len(names) <= 10 else "tab20"]
+        colors = [colormap(i) for i in range(len(names))]
     else:
-        plt.close(fig)
-        return None
+        colors = list(matplotlib.colormaps["turbo"](np.linspace(0, 1, len(names))))
+
+    fig, ax = _new_figure(show)
+    segments = [np.column_stack([mdates.date2num(timestamps), values]) for timestamps, values in series.values()]
+    ax.add_collection(LineCollection(segments, colors=colors, linewidths=1.2))
+    ax.xaxis_date()
+    ax.autoscale_view()
+
+    label = metric_label(metric, units)
+    shown = ", ".join(names) if len(names) <= 5 else f"{len(names)} cities"
+    ax.set_title(f"{label.split(' (')[0]} Comparison: {shown}")
+    ax.set_xlabel("Timestamp")
+    ax.set_ylabel(label)
+    if names:
+        # Proxy handles: the collection itself has no per-line legend entries
+        handles = [Line2D([], [], color=color) for color in colors]
+        ax.legend(
+            handles, names, loc="upper left", bbox_to_anchor=(1.01, 1),
+            fontsize="small" if len(names) <= 20 else "x-small", ncol=-(-len(names) // 25),
+        )
+    ax.grid(True)
+
+    return _finish(fig, show, save_path, return_fig)
 
 
 def plot_temperature_comparison(
@@ -128,9 +210,9 @@ def plot_temperature_comparison(
     show: bool = False,
     save_path: Optional[str] = None,
     return_fig: bool = False
-) -> Optional[plt.Figure]:
+) -> Optional[Figure]:
     """
-    Compare temperature over time for multiple cities.
+    Compare temperature over time for multiple cities (plot_comparison of 'temperature').
 
     :param df: A Pandas DataFrame containing weather data.
                Expects columns ['timestamp', 'city', 'temperature'].
@@ -140,30 +222,4 @@ def plot_temperature_comparison(
     :param return_fig: If True, returns the Matplotlib Figure object.
     :return: A Matplotlib Figure if return_fig is True; otherwise, None.
     """
-
-    if not pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-
-    fig, ax = plt.subplots(figsize=(10, 5))
-
-    for city in cities:
-        city_df = df[df["city"] == city].sort_values(by="timestamp")
-        ax.plot(city_df["timestamp"], city_df["temperature"], marker="o", linestyle="-", label=f"{city} Temp")
-
-    ax.set_title(f"Temperature Comparison: {', '.join(cities)}")
-    ax.set_xlabel("Timestamp")
-    ax.set_ylabel("Temperature (°C)")
-    ax.legend()
-    ax.grid(True)
-
-    if save_path:
-        fig.savefig(save_path, bbox_inches="tight")
-
-    if show:
-        plt.show()
-
-    if return_fig:
-        return fig
-    else:
-        plt.close(fig)
-        return None
+    return plot_comparison(df, "temperature", cities, show=show, save_path=save_path, return_fig=return_fig)
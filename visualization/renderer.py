@@ -0,0 +1,144 @@
+"""
+renderer.py
+
+Off-event-loop chart rendering with a PNG cache.
+
+Charts are rendered in a process pool (CPU-bound matplotlib work never blocks
+the API event loop) and the PNG or SVG bytes are cached by (chart, city, data
+version, format).
+The same key yields a stable ETag, so clients revalidating an unchanged chart
+can be answered with 304 Not Modified before any data is rendered.
+"""
+
+import asyncio
+import functools
+import hashlib
+import io
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from services.cache import TTLCache
+from utils import metrics
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Chart name -> function in visualization.charts; matplotlib is only imported
+# by the process that renders
+CHARTS = {
+    "temperature": "plot_temperature_over_time",
+    "humidity": "plot_humidity_over_time",
+    "compare": "plot_comparison",
+}
+
+# Output format -> media type
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+
+RENDER_SECONDS = metrics.histogram(
+    "chart_render_seconds", "Chart render time in the worker pool, including queueing", ["chart"]
+)
+
+
+def render_chart(chart: str, df: "pd.DataFrame", fmt: str = "png", **options) -> bytes:
+    """
+    Renders one chart to image bytes. Runs inside the worker pool, so it must stay
+    a picklable module-level function.
+
+    :param chart: Key of CHARTS, e.g. "temperature".
+    :param df: Weather data in the format the chart function expects.
+    :param fmt: Key of FORMATS.
+    :param options: Keyword arguments for the chart function, e.g. city.
+    :return: Image bytes.
+    """
+    from visualization import charts
+
+    fig = getattr(charts, CHARTS[chart])(df, return_fig=True, **options)
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, bbox_inches="tight")
+    return buf.getvalue()
+
+
+def render_png(chart: str, df: "pd.DataFrame", city: Optional[str] = None) -> bytes:
+    # One city's chart as PNG bytes
+    return render_chart(chart, df, "png", city=city)
+
+
+def data_version(df: "pd.DataFrame") -> str:
+    # Content hash of the frame: changes whenever any plotted value changes.
+    import pandas as pd
+
+    return hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()[:16]
+
+
+class ChartRenderer:
+    """
+    :param workers: Size of the rendering process pool; 0 renders in a single
+                    background thread instead (useful for tests and tiny deployments).
+    :param cache_size: Number of rendered PNGs kept.
+    :param cache_ttl: Seconds a rendered PNG is kept even if its data is unchanged.
+    """
+
+    def __init__(self, workers: int = 2, cache_size: int = 256, cache_ttl: float = 3600.0):
+        self.workers = workers
+        self.cache = TTLCache(ttl=cache_ttl, maxsize=cache_size)
+        self.renders = 0
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn: forking a process that runs an event loop and scheduler threads is unsafe
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+        return self._executor
+
+    @staticmethod
+    def etag(chart: str, city: str, version: str, fmt: str = "png") -> str:
+        subject = f"{chart}\0{city}\0{version}" + (f"\0{fmt}" if fmt != "png" else "")
+        digest = hashlib.sha1(subject.encode()).hexdigest()[:20]
+        return f'"{digest}"'
+
+    async def render(
+        self,
+        chart: str,
+        city: str,
+        df: "pd.DataFrame",
+        version: Optional[str] = None,
+        fmt: str = "png",
+        options: Optional[dict] = None,
+    ) -> Tuple[bytes, str]:
+        """
+        Returns (image_bytes, etag) for the chart, rendering it in the pool only if
+        this (chart, city, version, fmt) is not cached. Concurrent requests for the
+        same chart share one render.
+
+        :param city: What the chart shows, as part of the cache key (a city, or a
+                     description of several).
+        :param options: Keyword arguments for the chart function (default: city=city).
+        """
+        if chart not in CHARTS:
+            raise ValueError(f"Unknown chart {chart!r}; expected one of {sorted(CHARTS)}")
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format {fmt!r}; expected one of {sorted(FORMATS)}")
+        version = version or data_version(df)
+        options = options if options is not None else {"city": city}
+
+        async def render_in_pool() -> bytes:
+            self.renders += 1
+            loop = asyncio.get_running_loop()
+            with RENDER_SECONDS.time(chart=chart):
+                return await loop.run_in_executor(
+                    self._get_executor(), functools.partial(render_chart, chart, df, fmt, **options)
+                )
+
+        image = await self.cache.get_or_fetch((chart, city, version, fmt), render_in_pool)
+        return image, self.etag(chart, city, version, fmt)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
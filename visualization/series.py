@@ -0,0 +1,94 @@
+"""
+series.py
+
+Splits a multi-city weather frame into one time series per city for
+comparison charts, without matplotlib: the same series feed the rendered
+charts (visualization.charts.plot_comparison) and the JSON the
+/chart/compare endpoint returns for client-side rendering.
+
+The frame is sorted once by (city, timestamp) and cut at the city
+boundaries, instead of being filtered and sorted again for every city.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Chart column -> axis label
+METRICS = {
+    "temperature": "Temperature (°C)",
+    "feels_like": "Feels like (°C)",
+    "humidity": "Humidity (%)",
+}
+
+
+def metric_label(metric: str, units: str = "metric") -> str:
+    # Axis label of a chart column, with the temperature unit of `units`
+    from utils.temperature_converter import SYMBOLS
+
+    return METRICS.get(metric, metric).replace("°C", SYMBOLS[units])
+
+
+def downsample(timestamps: np.ndarray, values: np.ndarray, max_points: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Averages values over consecutive chunks so that at most max_points remain;
+    each chunk is stamped with its first timestamp. Shorter series are returned as is.
+    """
+    if max_points <= 0 or len(values) <= max_points:
+        return timestamps, values
+    size = -(-len(values) // max_points)
+    starts = np.arange(0, len(values), size)
+    counts = np.diff(np.append(starts, len(values)))
+    return timestamps[starts], np.add.reduceat(values, starts) / counts
+
+
+def comparison_series(
+    df: pd.DataFrame,
+    metric: str = "temperature",
+    cities: Optional[List[str]] = None,
+    max_points: int = 0,
+) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """
+    :param df: Weather data with columns 'timestamp', 'city' and the metric column;
+               it is not modified.
+    :param metric: Column to plot, e.g. "temperature".
+    :param cities: Cities to keep, in this order (default: every city, sorted).
+    :param max_points: Downsample each series to at most this many points (0: keep all).
+    :return: {city: (datetime64 timestamps, float values)} ordered by timestamp.
+    """
+    if cities is not None:
+        df = df[df["city"].isin(cities)]
+    timestamps = df["timestamp"]
+    if not pd.api.types.is_datetime64_any_dtype(timestamps):
+        timestamps = pd.to_datetime(timestamps)
+    frame = pd.DataFrame({
+        "city": df["city"].astype(str).to_numpy(),
+        "timestamp": timestamps.to_numpy(),
+        "value": df[metric].to_numpy(dtype=float, na_value=np.nan),
+    })
+    if not frame.empty:
+        frame = frame.sort_values(["city", "timestamp"], kind="stable")
+    names = frame["city"].to_numpy()
+    times = frame["timestamp"].to_numpy()
+    values = frame["value"].to_numpy()
+
+    # Each city is one contiguous run of the sorted frame
+    bounds = np.flatnonzero(names[1:] != names[:-1]) + 1
+    series = {}
+    for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(names)]):
+        if end > start:
+            series[names[start]] = downsample(times[start:end], values[start:end], max_points)
+    order = cities if cities is not None else sorted(series)
+    return {city: series[city] for city in order if city in series}
+
+
+def series_payload(series: Dict[str, Tuple[np.ndarray, np.ndarray]], decimals: int = 2) -> Dict[str, dict]:
+    # {city: {"t": [unix seconds], "v": [values]}}; missing values become null in JSON
+    return {
+        city: {
+            "t": timestamps.astype("datetime64[s]").astype(np.int64).tolist(),
+            "v": np.round(values, decimals).tolist(),
+        }
+        for city, (timestamps, values) in series.items()
+    }